@@ -0,0 +1,163 @@
+# coding: utf-8
+# Copyright (c) 2016 Fabian Barkhau <f483@storj.io>
+# License: MIT (see LICENSE file)
+
+
+# Asyncio versions of JsonRpc, Mpc and Mph (requires python >= 3.5).
+#
+# The protocol steps are shared with the blocking classes, only hub calls
+# are awaited so many connections can be driven from a single event loop.
+# Uses aiohttp if installed, otherwise the blocking pooled session is run
+# in the loop executor.
+
+
+import time
+import json
+import asyncio
+import functools
+from picopayments_cli import auth
+from picopayments_cli import rpc
+from picopayments_cli import steps
+from picopayments_cli import metrics
+from picopayments_cli.mpc import Mpc
+from picopayments_cli.mph import Mph
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class AsyncJsonRpcBatch(rpc.JsonRpcBatch):
+    """ Async JsonRpcBatch, use with `async with api.batch() as batch:`. """
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            await self.execute()
+
+    async def execute(self):
+        calls, self._calls = self._calls, []
+        if not calls:
+            return
+        payloads = [call.payload for call in calls]
+        responses = await self._rpc._post(payloads)
+        self._resolve(calls, rpc._index_batch_responses(responses))
+
+
+class AsyncJsonRpc(object):
+
+    def __init__(self, url, auth_wif=None, verify_ssl_cert=True,
+                 username=None, password=None, session=None,
+                 pool_size=rpc.DEFAULT_POOL_SIZE, keep_alive=True,
+                 memo=None):
+        self.url = url
+        self.auth_wif = auth_wif
+        self.username = username
+        self.password = password
+        self.verify_ssl_cert = verify_ssl_cert
+        self.session = session  # aiohttp.ClientSession, created lazily
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self.memo = memo or rpc.get_memo()
+
+    def __getattr__(self, name):
+
+        async def wrapper(**kwargs):
+            found, result = self.memo.lookup(name, kwargs)
+            if found:
+                return result
+            params = kwargs
+            auth_wif = self.auth_wif if name in rpc.AUTH_METHODS else None
+            if auth_wif:
+                kwargs = auth.sign_json(kwargs, auth_wif)
+            payload = {
+                "method": name, "params": kwargs, "jsonrpc": "2.0", "id": 0
+            }
+            response = await self._post(payload)
+            if "result" not in response:
+                raise rpc.JsonRpcCallFailed(payload, response)
+            result = response["result"]
+            if auth_wif:
+                auth.verify_json(result)
+            self.memo.store(name, params, result)
+            return result
+        return wrapper
+
+    def batch(self, memo=None):
+        """ Returns a AsyncJsonRpcBatch to group calls into one round trip. """
+        return AsyncJsonRpcBatch(self, memo=memo)
+
+    async def close(self):
+        """ Close the underlying http session if one was created. """
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def _get_session(self):
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=self.pool_size,
+                                             force_close=not self.keep_alive)
+            self.session = aiohttp.ClientSession(connector=connector)
+        return self.session
+
+    async def _post(self, payload):
+        if aiohttp is None:
+            return await asyncio.get_event_loop().run_in_executor(
+                None, functools.partial(
+                    rpc._post, self.url, payload,
+                    verify_ssl_cert=self.verify_ssl_cert,
+                    username=self.username, password=self.password,
+                    session=rpc.get_session(self.pool_size, self.keep_alive)
+                )
+            )
+        data = json.dumps(payload)
+        kwargs = {
+            "headers": {'content-type': 'application/json'},
+            "data": data,
+        }
+        if self.username and self.password:
+            kwargs["auth"] = aiohttp.BasicAuth(self.username, self.password)
+        if not self.verify_ssl_cert:
+            kwargs["ssl"] = False
+        session = self._get_session()
+
+        begin = time.time()
+        try:
+            async with session.post(self.url, **kwargs) as http_response:
+                content = await http_response.read()
+            response = json.loads(content.decode("utf-8"))
+        except Exception:
+            metrics.registry.record_rpc(payload, None, time.time() - begin,
+                                        len(data), 0)
+            raise
+        metrics.registry.record_rpc(payload, response, time.time() - begin,
+                                    len(data), len(content))
+        return response
+
+
+class AsyncMpc(Mpc):
+    """ Asyncio Mpc, public methods return coroutines. """
+
+    async def _run(self, step):
+        runner = steps.Runner(step)
+        request = runner.resume()
+        while not runner.done:
+            try:
+                value, error = await self._execute(request), None
+            except Exception as e:
+                value, error = None, e
+            request = runner.resume(value, error)
+        return runner.value
+
+    async def _execute(self, request):
+        if isinstance(request, steps.Batch):
+            async with self.api.batch(memo=request.memo) as batch:
+                return request.queue_func(batch)
+        return await getattr(self.api, request.method)(**request.params)
+
+
+class AsyncMph(AsyncMpc, Mph):
+    """ Asyncio Mph, public methods return coroutines. """
@@ -1,16 +1,30 @@
 import os
-import copy
-import json
-import csv
-from werkzeug.serving import run_simple
+import sys
+import atexit
+import signal
+import threading
+import contextlib
 from werkzeug.wrappers import Request, Response
 from jsonrpc import JSONRPCResponseManager, dispatcher
 from picopayments_cli.auth import load_wif
-from picopayments_cli.rpc import JsonRpc
-from picopayments_cli.mph import Mph
+from picopayments_cli.rpc import JsonRpc, get_session, get_memo
+from picopayments_cli.metrics import registry
+from picopayments_cli.txstore import get_txstore
+from picopayments_cli.history import get_history, close_histories
+from picopayments_cli.cache import ChainCache
+from picopayments_cli.keyring import get_keyring
+from picopayments_cli.store import BACKENDS, JsonStore, ResidentStore
+from picopayments_cli.store import migrate as store_migrate
+from picopayments_cli.journal import PaymentJournal
+from picopayments_cli.locks import HandleLocks
+from picopayments_cli.server import make_server
+from picopayments_cli.scheduler import SyncScheduler
+from picopayments_cli.policy import SyncPolicy
+from picopayments_cli.mph import Mph, new_payment, make_payment
+from picopayments_cli.mph import add_payment_history
+from picopayments_cli.bulk import read_payments, validate as validate_payment
 from picopayments_cli import etc
 from picopayments_cli import __version__
-from micropayment_core import keys
 from picopayments_cli.mpc import Mpc
 
 
@@ -99,8 +113,9 @@ def balances(asset=None, address=None):
     hub_api = _hub_api()
     assets = [asset] if asset else None
     if address is None:
-        address = keys.address_from_wif(load_wif())
-    return Mpc(hub_api).get_balances(address, assets=assets)
+        address = _keyring().default.address
+    client = Mpc(hub_api, **_client_options())
+    return client.get_balances(address, assets=assets)
 
 
 @dispatcher.add_method
@@ -175,7 +190,7 @@ def blocksend(asset, destination, quantity, extra_btc=0):
     )
     if extra_btc > 0:
         kwargs["regular_dust_size"] = extra_btc
-    return Mpc(hub_api).block_send(**kwargs)
+    return Mpc(hub_api, **_client_options()).block_send(**kwargs)
 
 
 @dispatcher.add_method
@@ -205,14 +220,12 @@ def connect(asset, quantity, expire_time=1024, delay_time=2):
     assert _quantity > quantity, err_msg.format(asset, quantity, _quantity)
 
     # connect to hub
-    client = Mph(_hub_api())
+    client = Mph(_hub_api(), **_client_options())
     send_deposit_txid = client.connect(quantity, expire_time=expire_time,
                                        asset=asset, delay_time=delay_time)
 
     # save to data
-    data = _load_data()
-    data["connections"][client.handle] = client.serialize()
-    _save_data(data)
+    _store().save(client.handle, client.serialize())
 
     return {
         "send_deposit_txid": send_deposit_txid,
@@ -234,14 +247,89 @@ def queuepayment(source, destination, quantity, token=None):
     Returns:
         Provided token or generated token if None given.
     """
-    hub_api = _hub_api()
-    data = _load_data()
-    client = Mph.deserialize(hub_api, data["connections"][source])
     # TODO check dest can receive payment
-    result = client.micro_send(destination, quantity, token=token)
-    data["connections"][source] = client.serialize()
-    _save_data(data)
-    return result
+    payment = new_payment(source, _connection_asset(source), destination,
+                          quantity, token=token)
+    journal = _journal()
+    journal.queue(source, payment)
+    journal.maybe_compact(_store())
+    return payment["token"]
+
+
+def queuepayments(path="-", input_format=None):
+    """ Queue payments read from a file (sent on sync).
+
+    All payments are read and validated before any is queued, they are
+    then queued together in a single journal write.
+
+    Args:
+        path (str, default="-"): JSONL or CSV file, "-" reads stdin.
+        input_format (str, default=None): jsonl or csv, by default csv if
+                                          the path ends with .csv.
+
+    Returns:
+        Iterator of the provided or generated tokens in input order, all
+        payments are queued before it is returned.
+    """
+    if input_format is None:
+        input_format = "csv" if path.endswith(".csv") else "jsonl"
+    infile = sys.stdin if path == "-" else open(path, "r")
+    try:
+        queued = _queue_payments(read_payments(infile, input_format))
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+    for source, payment in queued:
+        add_payment_history(source, _connection_asset(source), payment)
+    return iter([payment["token"] for source, payment in queued])
+
+
+def _rpc_queuepayments(payments):
+    """ Queue list of payments (sent on sync).
+
+    All payments are validated before any is queued, they are then queued
+    together in a single journal write.
+
+    Args:
+        payments (list): Objects with source, destination, quantity and
+                         optional token, as for queuepayment.
+
+    Returns:
+        List of the provided or generated tokens.
+    """
+    payments = [validate_payment(payment) for payment in payments]
+    queued = _queue_payments(payments)
+    for source, payment in queued:
+        add_payment_history(source, _connection_asset(source), payment)
+    return [payment["token"] for source, payment in queued]
+
+
+dispatcher["queuepayments"] = _rpc_queuepayments
+
+
+def _queue_payments(payments):
+    """ Queue validated payments in a single journal write.
+
+    Returns list of (source, payment) in input order.
+    """
+    queued = []
+    for number, payment in enumerate(payments, 1):
+        try:
+            _connection_asset(payment["source"])
+        except KeyError:
+            raise AssertionError("Payment {0}: Unknown source {1}!".format(
+                number, payment["source"]
+            ))
+        queued.append((payment["source"], make_payment(
+            payment["destination"], payment["quantity"],
+            token=payment["token"]
+        )))
+    journal = _journal()
+    with journal.batch():
+        for source, payment in queued:
+            journal.queue(source, payment)
+    journal.maybe_compact(_store())
+    return queued
 
 
 @dispatcher.add_method
@@ -271,19 +359,18 @@ def status(handle=None, verbose=False):
           }
         }
     """
-    data = _load_data()
     hub_api = _hub_api()
     result = {
         "connections": {},
         "wallet": {
-            "address": keys.address_from_wif(load_wif()),
+            "address": _keyring().default.address,
             "balances": balances()
         }
     }
-    for _handle, connection_data in data["connections"].items():
-        if handle is not None and _handle != handle:
-            continue
-        client = Mph.deserialize(hub_api, connection_data)
+    connections = _journal().view(_load_connections(handle), _store())
+    for _handle, connection_data in connections.items():
+        client = Mph.deserialize(hub_api, connection_data,
+                                 **_client_options())
         status = client.get_status()
         if verbose:
             status["data"] = connection_data
@@ -300,7 +387,7 @@ def status(handle=None, verbose=False):
 
 
 @dispatcher.add_method
-def sync(handle=None):
+def sync(handle=None, policy=False):
     """ Sync payments and recover funds from closed connections.
 
     This WILL cost a fee per channnel synced as defined in the hub terms.
@@ -308,8 +395,14 @@ def sync(handle=None):
     * Synchronize open connections to send/receive payments.
     * Recover funds of closed connections.
 
+    With policy, open connections are only synced once the fee is worth
+    it (sync_max_fee_ratio of the queued amount), a queued payment waited
+    sync_max_latency seconds or the deposit expires within sync_min_ttl
+    blocks. The reason is added to the result.
+
     Args:
         handle (str, default=None): Optionally limit to given handle.
+        policy (bool, default=False): Hold back syncs per the sync policy.
 
     Returns:
         {
@@ -326,33 +419,13 @@ def sync(handle=None):
         }
     """
     result = {}
-    hub_api = _hub_api()
-    data = _load_data()
-    for _handle, connection_data in copy.deepcopy(data)["connections"].items():
-        if handle is not None and _handle != handle:
-            continue
-        client = Mph.deserialize(hub_api, connection_data)
-        if client.can_cull():
-            continue  # dont sync closed inactive
-        status = client.get_status()
-
-        # sync open connections
-        if status["status"] == "open":
-            result[_handle] = {
-                "rawtxs": [],
-                "received_payments": client.sync()
-            }
-
-        # update closed connections
-        elif status["status"] == "closed":
-            result[_handle] = {
-                "rawtxs": client.update(),
-                "received_payments": []
-            }
-
-        data["connections"][client.handle] = client.serialize()
-
-    _save_data(data)
+    store = _store()
+    _journal().compact(store)
+    sync_policy = _sync_policy() if policy else None
+    for _handle in _handles(handle):
+        synced = _sync_connection(_handle, policy=sync_policy)
+        if synced is not None:
+            result[_handle] = synced
     return result
 
 
@@ -367,34 +440,40 @@ def close(handle):
         Commit txid or None if no assets received from hub.
     """
     hub_api = _hub_api()
-    data = _load_data()
-    client = Mph.deserialize(hub_api, data["connections"][handle])
-    commit_txid = client.close()
-    # TODO flag as closed in case hub delays close
-    # TODO recover now if possible
-    data["connections"][handle] = client.serialize()
-    _save_data(data)
+    store = _store()
+    _journal().compact(store)
+    with _handle_locks().locked([handle]):
+        client = Mph.deserialize(hub_api, store.load(handle),
+                                 **_client_options())
+        commit_txid = client.close()
+        # TODO flag as closed in case hub delays close
+        # TODO recover now if possible
+        store.update(handle, client.serialize(), client.changed())
     return commit_txid
 
 
 @dispatcher.add_method
-def history(handle=None):
+def history(handle=None, action=None, since=None, until=None, cursor=None,
+            limit=None, newest_first=False):
     """ Show history
 
     Args:
         handle (str): Limit history to given channel.
+        action (str): Limit history to given action.
+        since (float): Only actions at or after this unix timestamp.
+        until (float): Only actions before this unix timestamp.
+        cursor (int): Only actions after the one with this cursor,
+                      pass the last cursor of a page to get the next page.
+        limit (int): Maximum number of actions returned.
+        newest_first (bool, default=False): Show newest actions first.
 
     Returns:
         List of previous actions made.
     """
-    entries = []
-    if os.path.exists(etc.history_path):
-        with open(etc.history_path, 'r') as csvfile:
-            for entrie in list(csv.DictReader(csvfile)):
-                if handle is not None and entrie["handle"] != handle:
-                    continue
-                entries.append(entrie)
-    return entries
+    return list(get_history().entries(
+        handle=handle, action=action, since=since, until=until,
+        cursor=cursor, limit=limit, newest_first=newest_first
+    ))
 
 
 @dispatcher.add_method
@@ -407,17 +486,21 @@ def cull(handle=None):
     Returns:
         List of with handles of culled connections.
     """
-    data = _load_data()
+    store = _store()
     hub_api = _hub_api()
     culled = []
-    for _handle, connection_data in copy.deepcopy(data)["connections"].items():
-        if handle is not None and _handle != handle:
-            continue
-        client = Mph.deserialize(hub_api, connection_data)
-        if client.can_cull():
-            culled.append(_handle)
-            del data["connections"][_handle]
-    _save_data(data)
+    for _handle in _handles(handle):
+        with _handle_locks().locked([_handle]):
+            try:
+                connection_data = store.load(_handle)
+            except KeyError:
+                continue  # culled
+            client = Mph.deserialize(hub_api, connection_data,
+                                     **_client_options())
+            if client.can_cull():
+                culled.append(_handle)
+                store.delete(_handle)
+                _assets.pop(_handle, None)
     return culled
 
 
@@ -431,52 +514,413 @@ def cancelpayment(token):
     Returns:
         True if payment found and canceled, otherwise False.
     """
-    data = _load_data()
-    for _handle, connection_data in data["connections"].items():
-        for queued_payment in connection_data["payments_queued"]:
-            if queued_payment["token"] == token:
-                data["connections"][_handle]["payments_queued"].remove(
-                    queued_payment
-                )
-                _save_data(data)
-                return True
-    return False
+    store = _store()
+    journal = _journal()
+    canceled = journal.cancel(token, store)
+    journal.maybe_compact(store)
+    return canceled
+
+
+@dispatcher.add_method
+def convertdata(backend):
+    """ Copy connections to a new store of the given data backend.
+
+    Pending journal records are folded in first, the current store is
+    not changed. Set data_backend in the config file to use the new one.
+
+    Args:
+        backend (str): Data backend to convert to: sqlite, json or binary.
+
+    Returns:
+        Path of the created data file.
+    """
+    assert backend in BACKENDS, "Unknown data backend {0}!".format(backend)
+    assert backend != etc.data_backend, "Already using {0}!".format(backend)
+    path = _store_path(backend)
+    assert not os.path.exists(path), "{0} already exists!".format(path)
+    store = _store()
+    _journal().compact(store)
+    store_migrate(store, BACKENDS[backend](path))
+    return path
+
+
+@dispatcher.add_method
+def metrics():
+    """ Get statistics of hub rpc calls made by this process.
+
+    Returns:
+        Call statistics per hub method (latencies in seconds) and
+        hit/miss counters of the memo cache for pure hub calls. While
+        serving with background syncs, sync statistics per connection.
+
+        {
+          "rpc": {
+            "mpc_deposit_ttl": {
+              "calls": 42,
+              "errors": 0,
+              "request_bytes": 61320,
+              "response_bytes": 1764,
+              "latency": {
+                "max": 0.41, "mean": 0.12, "total": 5.04,
+                "p50": 0.11, "p95": 0.32, "p99": 0.41
+              }
+            }
+          },
+          "memo": {
+            "hits": 17, "misses": 9, "size": 9, "maxsize": 4096,
+            "methods": {
+              "mpc_transferred_amount": {"hits": 12, "misses": 6}
+            }
+          }
+        }
+    """
+    result = {
+        "rpc": registry.snapshot(),
+        "memo": get_memo(maxsize=etc.hub_memo_size).snapshot(),
+    }
+    if _schedulers:
+        result["sync"] = _schedulers[0].snapshot()
+    return result
 
 
 @Request.application
 def _application(request):
-    response = JSONRPCResponseManager.handle(request.data, dispatcher)
+    if request.method == "GET" and request.path == "/metrics":
+        memo = get_memo(maxsize=etc.hub_memo_size)
+        text = registry.exposition() + memo.exposition()
+        if _schedulers:
+            text += _schedulers[0].exposition()
+        return Response(text, content_type="text/plain; version=0.0.4")
+    if request.data.lstrip()[:1] == b"[":  # batch
+        with _unit_of_work():
+            response = JSONRPCResponseManager.handle(request.data, dispatcher)
+    else:
+        response = JSONRPCResponseManager.handle(request.data, dispatcher)
     return Response(response.json, mimetype='application/json')
 
 
+@contextlib.contextmanager
+def _unit_of_work():
+    """ Run calls of a batch against the same state and persist it once.
+
+    Journal records are written together when the batch ends. Connection
+    changes of a resident store are written to disk once by a single store
+    flush, other stores write every call directly.
+    """
+    store = _store()
+    journal = _journal()
+    try:
+        with store.hold(), journal.batch():
+            yield
+    finally:
+        store.flush()
+        journal.maybe_compact(store)
+
+
+_chain_caches = {}  # settings -> ChainCache
+
+
+def _client_options():
+    return {
+        "engine": etc.state_engine,
+        "txstore": get_txstore(path=etc.rawtxs_path,
+                               cache_size=etc.txstore_cache_size),
+        "chain_cache": _chain_cache(),
+        "keyring": _keyring(),
+        "archive": _store(),
+    }
+
+
+def _keyring():
+    return get_keyring(etc.wallet_path, netcode=etc.netcode)
+
+
+def _chain_cache():
+    key = (etc.hub_url, etc.chain_cache_size, etc.chain_cache_max_age,
+           etc.chain_tip_interval)
+    chain_cache = _chain_caches.get(key)
+    if chain_cache is None:
+        chain_cache = _chain_caches[key] = ChainCache(
+            _get_chain_tip, maxsize=etc.chain_cache_size,
+            tip_interval=etc.chain_tip_interval,
+            max_age=etc.chain_cache_max_age
+        )
+    return chain_cache
+
+
+def _get_chain_tip():
+    return _hub_api().get_running_info()["last_block"]["block_index"]
+
+
+_hub_apis = {}  # settings -> JsonRpc
+
+
 def _hub_api():
-    return JsonRpc(
-        etc.hub_url, auth_wif=load_wif(),
-        username=etc.hub_username, password=etc.hub_password,
-        verify_ssl_cert=etc.hub_verify_ssl_cert
-    )
+    # the wif is only loaded once per wallet, not on every call
+    key = (etc.hub_url, etc.wallet_path, etc.netcode, etc.hub_username,
+           etc.hub_password, etc.hub_verify_ssl_cert, etc.hub_pool_size,
+           etc.hub_keep_alive, etc.hub_memo_size)
+    hub_api = _hub_apis.get(key)
+    if hub_api is None:
+        hub_api = _hub_apis[key] = JsonRpc(
+            etc.hub_url, auth_wif=load_wif(),
+            username=etc.hub_username, password=etc.hub_password,
+            verify_ssl_cert=etc.hub_verify_ssl_cert,
+            session=get_session(pool_size=etc.hub_pool_size,
+                                keep_alive=etc.hub_keep_alive),
+            memo=get_memo(maxsize=etc.hub_memo_size)
+        )
+    return hub_api
+
+
+_stores = {}  # (backend, path, resident) -> Store
+_resident = False  # keep connections in memory, set while serving
+_cache_lock = threading.RLock()  # shared objects created once per process
+
+
+def _store():
+    """ Get connection store of the configured data backend.
+
+    Connections of an existing json data file are migrated to a new
+    sqlite store, the data file is kept renamed with a .migrated suffix.
+
+    While serving the store is wrapped in a ResidentStore, flushed on exit.
+    """
+    path = _store_path(etc.data_backend)
+    key = (etc.data_backend, path, _resident)
+    with _cache_lock:
+        store = _stores.get(key)
+        if store is None:
+            migrate = (etc.data_backend == "sqlite" and
+                       not os.path.exists(path) and
+                       os.path.exists(etc.data_path))
+            store = BACKENDS[etc.data_backend](path)
+            if migrate:
+                store_migrate(JsonStore(etc.data_path), store)
+                os.rename(etc.data_path, etc.data_path + ".migrated")
+            if _resident:
+                store = ResidentStore(store,
+                                      write_delay=etc.serve_write_delay)
+                atexit.register(store.flush)
+            _stores[key] = store
+        return store
+
+
+_journals = {}  # path -> PaymentJournal
+_locks = {}  # path -> HandleLocks
+_assets = {}  # handle -> asset, set once per connection
+
+
+def _journal():
+    with _cache_lock:
+        journal = _journals.get(etc.journal_path)
+        if journal is None:
+            journal = _journals[etc.journal_path] = PaymentJournal(
+                etc.journal_path, compact_size=etc.journal_compact_size,
+                locks=_handle_locks()
+            )
+        return journal
+
+
+def _handle_locks():
+    """ Locks held while a connection is changed, shared by all threads and
+    processes using the same base directory.
+    """
+    with _cache_lock:
+        locks = _locks.get(etc.locks_path)
+        if locks is None:
+            locks = _locks[etc.locks_path] = HandleLocks(etc.locks_path)
+        return locks
 
 
-def _load_data():
-    if os.path.exists(etc.data_path):
-        with open(etc.data_path, 'r') as infile:
-            data = json.load(infile)
-    else:
-        data = {"connections": {}}
-        _save_data(data)
-    return data
+def _connection_asset(handle):
+    """ Returns asset of stored connection, raises KeyError if unknown. """
+    asset = _assets.get(handle)
+    if asset is None:
+        asset = _assets[handle] = _store().load(handle)["asset"]
+    return asset
+
+
+def _store_path(backend):
+    return {
+        "json": etc.data_path,
+        "binary": etc.bin_data_path,
+        "sqlite": etc.db_path,
+    }[backend]
+
+
+def _sync_connection(handle, policy=None):
+    """ Sync open or recover closed connection while holding its lock.
+
+    Open connections are skipped if the optional SyncPolicy says to wait,
+    otherwise the reason it gave is added to the result.
+
+    Returns the sync result or None if nothing was done.
+    """
+    store = _store()
+    with _handle_locks().locked([handle]):
+        try:
+            connection_data = store.load(handle)
+        except KeyError:
+            return None  # culled
+        client = Mph.deserialize(_hub_api(), connection_data,
+                                 **_client_options())
+        if client.can_cull():
+            return None  # dont sync closed inactive
+        status = client.get_status()
+        result = None
+
+        # sync open connections
+        if status["status"] == "open":
+            reason = None
+            if policy is not None:
+                reason = policy.decide(client.payments_queued,
+                                       client.channel_terms["sync_fee"],
+                                       ttl=status["ttl"])
+                if reason is None:
+                    return None
+            result = {
+                "rawtxs": [],
+                "received_payments": client.sync()
+            }
+            if reason is not None:
+                result["reason"] = reason
+
+        # update closed connections
+        elif status["status"] == "closed":
+            result = {
+                "rawtxs": client.update(),
+                "received_payments": []
+            }
+
+        store.update(client.handle, client.serialize(), client.changed())
+        return result
+
+
+def _sync_policy():
+    return SyncPolicy(max_fee_ratio=etc.sync_max_fee_ratio,
+                      max_latency=etc.sync_max_latency,
+                      min_ttl=etc.sync_min_ttl)
+
+
+def _sync_queue():
+    """ Returns dict mapping handle to (number of queued payments, due).
+
+    Connections are due if the sync policy allows a sync without knowing
+    the ttl, which needs hub calls and is checked when syncing.
+    """
+    store = _store()
+    _journal().compact(store)
+    policy = _sync_policy()
+    result = {}
+    for handle, data in store.load_all().items():
+        queued = data["payments_queued"]
+        terms = data.get("channel_terms") or {}
+        reason = policy.decide(queued, terms.get("sync_fee", 0))
+        result[handle] = (len(queued), reason is not None)
+    return result
+
 
+_schedulers = []  # running SyncScheduler
 
-def _save_data(data):
-    with open(etc.data_path, 'w') as outfile:
-        json.dump(data, outfile, indent=2, sort_keys=True)
+
+def _exit_forked():
+    """ Called before a forked request process exits.
+
+    Buffered history entries are written and a started compaction is
+    finished. Returns the hub call statistics to merge into the server.
+    """
+    close_histories()
+    _journal().join()
+    return {
+        "rpc": registry.recorded(),
+        "memo": get_memo(maxsize=etc.hub_memo_size).recorded(),
+    }
+
+
+def _merge_forked(result):
+    registry.merge(result["rpc"])
+    get_memo(maxsize=etc.hub_memo_size).merge(result["memo"])
+
+
+def _handles(handle=None):
+    """ Returns stored handles, optionally only given handle. """
+    if handle is None:
+        return _store().handles()
+    return [handle]
+
+
+def _load_connections(handle=None):
+    """ Returns dict mapping handle to data, optionally only given handle.
+    """
+    store = _store()
+    if handle is None:
+        return store.load_all()
+    try:
+        return {handle: store.load(handle)}
+    except KeyError:
+        return {}
 
 
 def serve(host, port):
     """ Start RPC-API Server.
 
+    Hub rpc call metrics can be scraped from GET /metrics in the
+    prometheus text format.
+
+    If serve_sync_interval is set, connections with queued payments are
+    synced in the background by serve_sync_workers threads once the sync
+    policy allows it, and all connections are checked every
+    serve_recover_interval seconds to recover closed ones. Queue depth
+    and last sync latency per connection are added to the metrics.
+
+    Calls of a JSON-RPC batch are run in order as one unit of work, the
+    results or errors are returned per call.
+
+    Requests are handled by serve_threads threads, or by up to
+    serve_processes forked processes. Changes of a connection are
+    serialized by its handle lock, so different connections are synced in
+    parallel.
+
+    With threads connections are loaded into memory before serving and
+    changes are written to disk within serve_write_delay seconds and on
+    shutdown. Forked processes can not share memory, so they read and
+    write the sqlite data backend directly, and write their history and
+    hand their metrics to the server before they exit. Background syncs
+    need threads, so they can not be used with multiple processes: a
+    process forked while a sync holds a lock would never see it released.
+
     Args:
         host (str): Network interface on which to host the service.
         port (int): Network port on which to host the service.
     """
-    run_simple(host, port, _application)
+    global _resident
+    processes = etc.serve_processes
+    assert processes <= 1 or etc.data_backend == "sqlite", \
+        "Multiple serve processes require the sqlite data backend!"
+    assert processes <= 1 or not etc.serve_sync_interval, \
+        "Background syncs can not be used with multiple serve processes!"
+    _resident = processes <= 1
+    store = _store()
+    store.handles()  # load connections before the first request
+    _journal()
+    _hub_api()
+    server = make_server(host, port, _application,
+                         threads=etc.serve_threads, processes=processes,
+                         on_exit=_exit_forked, merge=_merge_forked)
+    if etc.serve_sync_interval:
+        _schedulers.append(SyncScheduler(
+            _sync_queue,
+            lambda handle: _sync_connection(handle, policy=_sync_policy()),
+            interval=etc.serve_sync_interval,
+            recover_interval=etc.serve_recover_interval,
+            workers=etc.serve_sync_workers
+        ))
+        _schedulers[0].start()
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()  # waits for handled requests when stopped
+    finally:
+        while _schedulers:
+            _schedulers.pop().stop()
+        store.flush()
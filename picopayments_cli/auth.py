@@ -3,11 +3,26 @@
 # License: MIT (see LICENSE file)
 
 
-import os
-import copy
 import json
-from micropayment_core import keys
+import hashlib
+import threading
+import ecdsa
+from pycoin import encoding
+from pycoin.key import Key
+from pycoin.serialize import b2h, h2b
+from pycoin.ecdsa import sign as ecdsa_sign
+from pycoin.ecdsa import verify as ecdsa_verify
+from pycoin.ecdsa import generator_secp256k1 as G
+from micropayment_core import util
 from picopayments_cli import etc
+from picopayments_cli.cache import LRUCache
+from picopayments_cli.keyring import get_keyring
+
+
+# same output as json.dumps(data, sort_keys=True), created once
+_canonical_encoder = json.JSONEncoder(sort_keys=True)
+_signers = LRUCache(maxsize=16)  # wif -> Signer
+_signers_lock = threading.Lock()
 
 
 class AuthPubkeyMissmatch(Exception):
@@ -19,40 +34,81 @@ class AuthPubkeyMissmatch(Exception):
         super(AuthPubkeyMissmatch, self).__init__(msg)
 
 
-def sign_json(json_data, auth_wif):
-    privkey = keys.wif_to_privkey(auth_wif)
+def canonical_digest(json_data, exclude=None):
+    """ Sha256 digest of the canonical (sorted keys) json encoding.
+
+    The top level `exclude` key is skipped without copying the data.
+    """
+    if exclude is not None and exclude in json_data:
+        json_data = dict([
+            (k, v) for k, v in json_data.items() if k != exclude
+        ])  # shallow, nested values are only read
+    data = _canonical_encoder.encode(json_data)
+    return hashlib.sha256(data.encode("utf-8")).digest()
+
+
+class Signer(object):
+    """ Signs json data, key material is derived once from the wif. """
+
+    def __init__(self, auth_wif):
+        key = Key.from_text(auth_wif)
+        self._secret_exponent = key.secret_exponent()
+        self.pubkey = b2h(key.sec())
+
+    def sign(self, json_data):
+        """ Add pubkey and signature to json data (modified in place). """
+        if "pubkey" in json_data and not json_data["pubkey"] == self.pubkey:
+            raise AuthPubkeyMissmatch(self.pubkey, json_data["pubkey"])
+        json_data["pubkey"] = self.pubkey
+
+        # sign serialized data (keys must be ordered!)
+        digest = canonical_digest(json_data, exclude="signature")
+        r, s = ecdsa_sign(G, self._secret_exponent, util.bytestoint(digest))
+        json_data["signature"] = b2h(ecdsa.util.sigencode_der(r, s, G.order()))
+        return json_data
 
-    # add pubkey to json data if needed
-    pubkey = keys.pubkey_from_privkey(privkey)
-    if "pubkey" in json_data and not json_data["pubkey"] == pubkey:
-        raise AuthPubkeyMissmatch(pubkey, json_data["pubkey"])
-    else:
-        json_data["pubkey"] = pubkey
 
-    # sign serialized data (keys must be ordered!)
-    data = json.dumps(json_data, sort_keys=True)
-    signature = keys.sign_sha256(privkey, data.encode("utf-8"))
+class Verifier(object):
+    """ Verifies signed json data, caches decoded public keys. """
 
-    # add signature to json data
-    json_data["signature"] = signature
+    def __init__(self, cache_size=64):
+        self._public_pairs = LRUCache(maxsize=cache_size)  # pubkey -> pair
 
-    return json_data
+    def _public_pair(self, pubkey):
+        public_pair = self._public_pairs.get(pubkey)
+        if public_pair is None:
+            public_pair = encoding.sec_to_public_pair(h2b(pubkey))
+            self._public_pairs.set(pubkey, public_pair)
+        return public_pair
+
+    def verify(self, json_data):
+        digest = canonical_digest(json_data, exclude="signature")
+        signature = h2b(json_data["signature"])
+        sig = ecdsa.util.sigdecode_der(signature, G.order())
+        public_pair = self._public_pair(json_data["pubkey"])
+        return ecdsa_verify(G, public_pair, util.bytestoint(digest), sig)
+
+
+_verifier = Verifier()
+
+
+def get_signer(auth_wif):
+    """ Get shared Signer for the given wif. """
+    with _signers_lock:
+        signer = _signers.get(auth_wif)
+        if signer is None:
+            signer = Signer(auth_wif)
+            _signers.set(auth_wif, signer)
+        return signer
+
+
+def sign_json(json_data, auth_wif):
+    return get_signer(auth_wif).sign(json_data)
 
 
 def verify_json(json_data):
-    json_data = copy.deepcopy(json_data)
-    pubkey = json_data["pubkey"]
-    signature = json_data.pop("signature")
-    data = json.dumps(json_data, sort_keys=True)
-    return keys.verify_sha256(pubkey, signature, data.encode("utf-8"))
+    return _verifier.verify(json_data)
 
 
 def load_wif():
-    if not os.path.exists(etc.wallet_path):
-        wif = keys.generate_wif(etc.netcode)
-        with open(etc.wallet_path, 'w') as outfile:
-            outfile.write(wif)
-    else:
-        with open(etc.wallet_path, 'r', encoding="utf-8") as infile:
-            wif = infile.read().strip()
-    return wif
+    return get_keyring(etc.wallet_path, netcode=etc.netcode).default.wif
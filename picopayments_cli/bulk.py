@@ -0,0 +1,71 @@
+# coding: utf-8
+# Copyright (c) 2016 Fabian Barkhau <f483@storj.io>
+# License: MIT (see LICENSE file)
+
+
+import csv
+import json
+from picopayments_cli import parse
+
+
+FIELDS = ["source", "destination", "quantity", "token"]
+FORMATS = ["jsonl", "csv"]
+
+
+def validate(payment):
+    """ Returns payment with values checked and converted by parse. """
+    assert isinstance(payment, dict), "Payment is not an object!"
+    unknown = set(payment.keys()).difference(FIELDS)
+    assert not unknown, "Unknown fields {0}!".format(sorted(unknown))
+    for field in FIELDS[:3]:
+        assert payment.get(field) not in (None, ""), \
+            "Missing {0}!".format(field)
+    quantity = payment["quantity"]
+    assert not isinstance(quantity, bool), \
+        "{0} not a valid satoshis amount!".format(quantity)
+    assert not isinstance(quantity, float) or quantity.is_integer(), \
+        "{0} not a valid satoshis amount!".format(quantity)
+    return {
+        "source": parse.handle(payment["source"]),
+        "destination": parse.handle(payment["destination"]),
+        "quantity": parse.satoshis(payment["quantity"]),
+        "token": parse.token(payment.get("token") or None),
+    }
+
+
+def _rows(infile, input_format):
+    # yields (line number, row)
+    if input_format == "csv":
+        reader = csv.DictReader(infile)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for number, line in enumerate(infile, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                raise ValueError("Line {0}: {1}".format(number, e))
+            yield number, row
+
+
+def read_payments(infile, input_format="jsonl"):
+    """ Generator of validated payments read from a file object.
+
+    Args:
+        infile: File with a json object per line, or csv rows with a header
+                of the source, destination, quantity and optional token.
+        input_format (str): One of FORMATS.
+
+    Raises AssertionError or ValueError naming the line of an invalid
+    payment.
+    """
+    assert input_format in FORMATS, \
+        "Unknown format {0}!".format(input_format)
+    for number, row in _rows(infile, input_format):
+        try:
+            payment = validate(row)
+        except (AssertionError, ValueError) as e:
+            raise type(e)("Line {0}: {1}".format(number, e))
+        yield payment
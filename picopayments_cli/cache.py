@@ -0,0 +1,233 @@
+# coding: utf-8
+# Copyright (c) 2016 Fabian Barkhau <f483@storj.io>
+# License: MIT (see LICENSE file)
+
+
+import copy
+import time
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+# hub calls whose result only depends on the given params
+PURE_METHODS = [
+    "mpc_transferred_amount",
+    "mpc_highest_commit",
+    "mpc_revoke_hashes_until",
+]
+
+
+# chain queries whose confirmed result only changes with the chain tip
+CHAIN_METHODS = [
+    "get_balances",
+    "get_unspent_txouts",
+    "search_raw_transactions",
+]
+
+
+def canonical_key(method, params):
+    """ Content hash of a call, equal for equal method and params. """
+    data = json.dumps([method, params], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class LRUCache(object):
+    """ Thread safe mapping that evicts the least recently used entries. """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return default
+            self.hits += 1
+            value = self._entries.pop(key)
+            self._entries[key] = value  # move to most recently used
+            return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = value
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._entries.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def _add_counters(counters, other):
+    counters["hits"] += other["hits"]
+    counters["misses"] += other["misses"]
+
+
+class MemoCache(object):
+    """ Memoizes results of pure hub calls by content hash of the call. """
+
+    _MISSING = object()
+
+    def __init__(self, maxsize=1024, methods=PURE_METHODS):
+        self.methods = set(methods)
+        self.stats = {}  # method -> {"hits": int, "misses": int}
+        self._cache = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._merged = {"hits": 0, "misses": 0, "methods": {}}
+
+    def enabled(self, method):
+        return self._cache.maxsize > 0 and method in self.methods
+
+    def lookup(self, method, params):
+        """ Returns (found, result) for the given call. """
+        if not self.enabled(method):
+            return False, None
+        result = self._cache.get(canonical_key(method, params), self._MISSING)
+        found = result is not self._MISSING
+        with self._lock:
+            counters = self.stats.setdefault(method, {"hits": 0, "misses": 0})
+            counters["hits" if found else "misses"] += 1
+        return found, copy.deepcopy(result) if found else None
+
+    def store(self, method, params, result):
+        if self.enabled(method):
+            key = canonical_key(method, params)
+            self._cache.set(key, copy.deepcopy(result))
+
+    def snapshot(self):
+        """ Returns cache size and hit/miss counters per method. """
+        with self._lock:
+            hits = self._cache.hits + self._merged["hits"]
+            misses = self._cache.misses + self._merged["misses"]
+        return {
+            "size": len(self._cache),
+            "maxsize": self._cache.maxsize,
+            "hits": hits,
+            "misses": misses,
+            "methods": self._stats_copy(),
+        }
+
+    def recorded(self):
+        """ Returns hit/miss counters of this process, without merged ones.
+        """
+        with self._lock:
+            return {
+                "hits": self._cache.hits,
+                "misses": self._cache.misses,
+                "methods": copy.deepcopy(self.stats),
+            }
+
+    def merge(self, counters):
+        """ Add hit/miss counters returned by recorded of another process.
+        """
+        with self._lock:
+            _add_counters(self._merged, counters)
+            for method, method_counters in counters["methods"].items():
+                _add_counters(self._merged["methods"].setdefault(
+                    method, {"hits": 0, "misses": 0}
+                ), method_counters)
+
+    def _stats_copy(self):
+        # per method counters including merged ones
+        with self._lock:
+            stats = copy.deepcopy(self.stats)
+            for method, counters in self._merged["methods"].items():
+                _add_counters(stats.setdefault(
+                    method, {"hits": 0, "misses": 0}
+                ), counters)
+            return stats
+
+    def exposition(self, prefix="picopayments_memo"):
+        """ Returns counters in the prometheus text exposition format. """
+        lines = []
+        for counter in ["hits", "misses"]:
+            name = "{0}_{1}_total".format(prefix, counter)
+            lines.append("# TYPE {0} counter".format(name))
+            for method, counters in sorted(self._stats_copy().items()):
+                lines.append('{0}{{method="{1}"}} {2}'.format(
+                    name, method, counters[counter]
+                ))
+        name = "{0}_entries".format(prefix)
+        lines.append("# TYPE {0} gauge".format(name))
+        lines.append("{0} {1}".format(name, len(self._cache)))
+        return "\n".join(lines) + "\n"
+
+
+class ChainCache(MemoCache):
+    """ Memoizes confirmed chain queries until the chain tip changes.
+
+    Queries for unconfirmed data are never cached as the mempool changes
+    within a block. The tip is queried at most once per tip_interval
+    seconds and the cache is cleared when it changed. Entries also expire
+    after max_age seconds. Call invalidate after publishing a transaction.
+    The get_tip_func is always called blocking.
+    """
+
+    def __init__(self, get_tip_func, maxsize=1024, methods=CHAIN_METHODS,
+                 tip_interval=5.0, max_age=60.0):
+        super(ChainCache, self).__init__(maxsize=maxsize, methods=methods)
+        self.get_tip_func = get_tip_func
+        self.tip_interval = tip_interval
+        self.max_age = max_age
+        self.tip = None
+        self._tip_checked = None
+
+    def _check_tip(self):
+        """ Returns False if the current tip could not be determined. """
+        now = time.time()
+        with self._lock:
+            if (self._tip_checked is not None and
+                    now - self._tip_checked < self.tip_interval):
+                return True
+            self._tip_checked = now
+        try:
+            tip = self.get_tip_func()
+        except Exception:  # tip unknown, dont trust cached data
+            self.invalidate()
+            with self._lock:
+                self._tip_checked = None  # retry on next lookup
+            return False
+        if tip != self.tip:
+            self.invalidate()
+            self.tip = tip
+        return True
+
+    def invalidate(self):
+        """ Drop all cached chain data, e.g. after publishing a tx. """
+        self._cache.clear()
+
+    def cacheable(self, method, params):
+        return self.enabled(method) and not params.get("unconfirmed")
+
+    def lookup(self, method, params):
+        if not self.cacheable(method, params) or not self._check_tip():
+            return False, None
+        found, entry = super(ChainCache, self).lookup(method, params)
+        if found and time.time() - entry[0] > self.max_age:
+            self._cache.pop(canonical_key(method, params))
+            return False, None
+        return found, entry[1] if found else None
+
+    def store(self, method, params, result):
+        if self.cacheable(method, params) and self._check_tip():
+            entry = (time.time(), result)
+            super(ChainCache, self).store(method, params, entry)
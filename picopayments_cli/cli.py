@@ -162,6 +162,19 @@ def parse_args(args):
         help="Optional token payee will receive with the payment."
     )
 
+    # queue payments from file
+    command_parser = subparsers.add_parser(
+        "queuepayments", help="Queue payments read from a file (sent on sync)."
+    )
+    command_parser.add_argument(
+        'path', nargs='?', default="-", metavar="PATH",
+        help="JSONL or CSV file of payments, default - reads stdin."
+    )
+    command_parser.add_argument(
+        '--format', dest="input_format", choices=["jsonl", "csv"],
+        default=None, help="Input format, by default csv for .csv files."
+    )
+
     # get connections status
     command_parser = subparsers.add_parser(
         "status", help="Get status of connections and wallet."
@@ -183,6 +196,10 @@ def parse_args(args):
         '--handle', type=parse.handle, default=None, metavar="HANDLE",
         help="Optionally limit to given handle."
     )
+    command_parser.add_argument(
+        '--policy', action='store_true',
+        help="Only sync connections once the sync policy allows it."
+    )
 
     # close connection
     command_parser = subparsers.add_parser(
@@ -201,6 +218,30 @@ def parse_args(args):
         '--handle', type=parse.handle, default=None, metavar="HANDLE",
         help="Limit history to given channel."
     )
+    command_parser.add_argument(
+        '--action', default=None, metavar="ACTION",
+        help="Limit history to given action."
+    )
+    command_parser.add_argument(
+        '--since', type=float, default=None, metavar="TIMESTAMP",
+        help="Only actions at or after this unix timestamp."
+    )
+    command_parser.add_argument(
+        '--until', type=float, default=None, metavar="TIMESTAMP",
+        help="Only actions before this unix timestamp."
+    )
+    command_parser.add_argument(
+        '--cursor', type=parse.unsigned, default=None, metavar="CURSOR",
+        help="Only actions after the one with this cursor."
+    )
+    command_parser.add_argument(
+        '--limit', type=parse.unsigned, default=None, metavar="LIMIT",
+        help="Maximum number of actions shown."
+    )
+    command_parser.add_argument(
+        '--newest-first', action='store_true',
+        help="Show newest actions first."
+    )
 
     # cull closed connections no longer needed
     command_parser = subparsers.add_parser(
@@ -221,6 +262,21 @@ def parse_args(args):
         help="Token of the queued payment to be canceled."
     )
 
+    # convert connection data
+    command_parser = subparsers.add_parser(
+        "convertdata",
+        help="Copy connections to a new store of the given data backend."
+    )
+    command_parser.add_argument(
+        'backend', choices=["sqlite", "json", "binary"],
+        help="Data backend to convert to."
+    )
+
+    # show rpc metrics
+    subparsers.add_parser(
+        "metrics", help="Get statistics of hub rpc calls made by this process."
+    )
+
     # start rpc api server
     command_parser = subparsers.add_parser(
         "serve", help="Start RPC-API server."
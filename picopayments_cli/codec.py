@@ -0,0 +1,264 @@
+# coding: utf-8
+# Copyright (c) 2016 Fabian Barkhau <f483@storj.io>
+# License: MIT (see LICENSE file)
+
+
+import re
+import struct
+import binascii
+
+
+# Compact binary encoding of json compatible data.
+#
+# Every value starts with a one byte tag. Lowercase hex strings (scripts,
+# rawtxs, pubkeys, secrets) are stored as raw bytes. Lists and dicts are
+# prefixed with their encoded byte length, so they can be skipped without
+# decoding them.
+
+
+NONE = b"N"
+TRUE = b"T"
+FALSE = b"F"
+INT = b"I"  # zigzag varint
+FLOAT = b"D"  # big endian double
+STR = b"S"  # varint length + utf-8
+HEX = b"H"  # varint length + raw bytes
+LIST = b"L"  # varint byte length + varint count + values
+DICT = b"M"  # varint byte length + varint count + (key, value) pairs
+
+
+_HEX_REGEX = re.compile(r"^(?:[0-9a-f]{2})+\Z")
+
+try:
+    _text_type = unicode  # noqa
+    _integer_types = (int, long)  # noqa
+except NameError:
+    _text_type = str
+    _integer_types = (int,)
+
+
+class DecodeError(Exception):
+    pass
+
+
+class Raw(object):
+    """ Encoded value in a buffer, decoded on demand and encoded as is. """
+
+    __slots__ = ["data", "start", "end"]
+
+    def __init__(self, data, start, end):
+        self.data = data
+        self.start = start
+        self.end = end
+
+    def decode(self):
+        return decode_at(self.data, self.start)[0]
+
+    def tobytes(self):
+        return bytes(self.data[self.start:self.end])
+
+
+class LazyDict(dict):
+    """ Dict of Raw values that are decoded on first access. """
+
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        if isinstance(value, Raw):
+            value = value.decode()
+            dict.__setitem__(self, key, value)
+        return value
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            dict.__setitem__(self, key, default)
+        return self[key]
+
+    def pop(self, key, *args):
+        value = dict.pop(self, key, *args)
+        return value.decode() if isinstance(value, Raw) else value
+
+    def copy(self):
+        """ Shallow copy that keeps values not yet decoded as Raw. """
+        result = LazyDict()
+        for key in self.keys():
+            dict.__setitem__(result, key, dict.__getitem__(self, key))
+        return result
+
+    def items(self):
+        return [(key, self[key]) for key in list(self.keys())]
+
+    def values(self):
+        return [self[key] for key in list(self.keys())]
+
+    def __eq__(self, other):
+        return dict(self.items()) == other
+
+    def __ne__(self, other):
+        return not self == other
+
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def read_varint(data, offset):
+    """ Returns (value, offset after varint) of bytearray data. """
+    value, shift = 0, 0
+    while True:
+        if offset >= len(data):
+            raise DecodeError("Truncated varint!")
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, offset
+
+
+def _encode_str(value):
+    raw = value.encode("utf-8")
+    return _varint(len(raw)) + raw
+
+
+def _encode(value, parts):
+    if isinstance(value, Raw):
+        parts.append(value.tobytes())
+    elif value is None:
+        parts.append(NONE)
+    elif value is True:
+        parts.append(TRUE)
+    elif value is False:
+        parts.append(FALSE)
+    elif isinstance(value, _integer_types):
+        zigzag = value * 2 if value >= 0 else -value * 2 - 1
+        parts.append(INT + _varint(zigzag))
+    elif isinstance(value, float):
+        parts.append(FLOAT + struct.pack(">d", value))
+    elif isinstance(value, (str, _text_type)):
+        if _HEX_REGEX.match(value):
+            raw = binascii.unhexlify(value)
+            parts.append(HEX + _varint(len(raw)) + raw)
+        else:
+            parts.append(STR + _encode_str(value))
+    elif isinstance(value, (list, tuple)):
+        items = []
+        for item in value:
+            _encode(item, items)
+        body = _varint(len(value)) + b"".join(items)
+        parts.append(LIST + _varint(len(body)) + body)
+    elif isinstance(value, dict):
+        items = []
+        for key in sorted(value.keys()):
+            items.append(_encode_str(key))
+            _encode(dict.__getitem__(value, key), items)
+        body = _varint(len(value)) + b"".join(items)
+        parts.append(DICT + _varint(len(body)) + body)
+    else:
+        raise TypeError("Cannot encode {0}!".format(type(value)))
+
+
+def encode(value):
+    """ Returns bytes of encoded json compatible value. """
+    parts = []
+    _encode(value, parts)
+    return b"".join(parts)
+
+
+def _read_str(data, offset):
+    size, offset = read_varint(data, offset)
+    end = offset + size
+    return bytes(data[offset:end]).decode("utf-8"), end
+
+
+def decode_at(data, offset):
+    """ Returns (value, offset after value) of bytearray data. """
+    if offset >= len(data):
+        raise DecodeError("Truncated data!")
+    tag = bytes(data[offset:offset + 1])
+    offset += 1
+    if tag == NONE:
+        return None, offset
+    if tag == TRUE:
+        return True, offset
+    if tag == FALSE:
+        return False, offset
+    if tag == INT:
+        value, offset = read_varint(data, offset)
+        return (value >> 1) if not value & 1 else -((value + 1) >> 1), offset
+    if tag == FLOAT:
+        return struct.unpack(">d", bytes(data[offset:offset + 8]))[0], \
+            offset + 8
+    if tag == STR:
+        return _read_str(data, offset)
+    if tag == HEX:
+        size, offset = read_varint(data, offset)
+        end = offset + size
+        hexstr = binascii.hexlify(bytes(data[offset:end])).decode("ascii")
+        return hexstr, end
+    if tag == LIST:
+        size, offset = read_varint(data, offset)
+        count, offset = read_varint(data, offset)
+        items = []
+        for i in range(count):
+            item, offset = decode_at(data, offset)
+            items.append(item)
+        return items, offset
+    if tag == DICT:
+        size, offset = read_varint(data, offset)
+        count, offset = read_varint(data, offset)
+        items = {}
+        for i in range(count):
+            key, offset = _read_str(data, offset)
+            items[key], offset = decode_at(data, offset)
+        return items, offset
+    raise DecodeError("Unknown tag {0!r}!".format(tag))
+
+
+def skip_at(data, offset):
+    """ Returns offset after the value at offset without decoding lists
+    and dicts.
+    """
+    tag = bytes(data[offset:offset + 1])
+    if tag in (LIST, DICT):
+        size, start = read_varint(data, offset + 1)
+        end = start + size
+        if end > len(data):
+            raise DecodeError("Truncated data!")
+        return end
+    return decode_at(data, offset)[1]
+
+
+def lazy_dict_at(data, offset):
+    """ Returns (LazyDict, offset after dict) of the dict at offset, its
+    values are only decoded when accessed.
+    """
+    if bytes(data[offset:offset + 1]) != DICT:
+        raise DecodeError("Not a dict!")
+    size, offset = read_varint(data, offset + 1)
+    count, offset = read_varint(data, offset)
+    items = LazyDict()
+    for i in range(count):
+        key, offset = _read_str(data, offset)
+        end = skip_at(data, offset)
+        dict.__setitem__(items, key, Raw(data, offset, end))
+        offset = end
+    return items, offset
+
+
+def decode(data):
+    """ Returns value of encoded bytes. """
+    value, offset = decode_at(bytearray(data), 0)
+    if offset != len(data):
+        raise DecodeError("Trailing data!")
+    return value
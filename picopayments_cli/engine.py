@@ -0,0 +1,201 @@
+# coding: utf-8
+# Copyright (c) 2016 Fabian Barkhau <f483@storj.io>
+# License: MIT (see LICENSE file)
+
+
+import copy
+import struct
+from pycoin.tx import Tx
+from micropayment_core import util
+from micropayment_core import scripts
+from picopayments_cli.cache import LRUCache
+
+
+ENGINES = ["hub", "local", "verify"]
+COUNTERPARTY_PREFIX = b"CNTRPRTY"
+SEND_MESSAGE_TYPE = 0
+OP_RETURN = 0x6a
+OP_PUSHDATA1 = 0x4c
+
+
+class UndecodableCommit(Exception):
+
+    def __init__(self, rawtx):
+        msg = "Can not decode counterparty send of commit {0}!"
+        super(UndecodableCommit, self).__init__(msg.format(rawtx))
+
+
+class InvalidCommit(Exception):
+
+    def __init__(self, commit_script, reason):
+        msg = "Invalid commit {0}: {1}"
+        super(InvalidCommit, self).__init__(msg.format(commit_script, reason))
+
+
+class EngineMismatch(Exception):
+
+    def __init__(self, method, local_result, hub_result):
+        msg = "Local {0} result {1} does not match hub result {2}!"
+        super(EngineMismatch, self).__init__(
+            msg.format(method, local_result, hub_result)
+        )
+
+
+def arc4(key, data):
+    """ ARC4 keystream xor, counterparty uses it to obfuscate tx data. """
+    key = bytearray(key)
+    box = list(range(256))
+    j = 0
+    for i in range(256):
+        j = (j + box[i] + key[i % len(key)]) % 256
+        box[i], box[j] = box[j], box[i]
+    i = j = 0
+    result = bytearray()
+    for byte in bytearray(data):
+        i = (i + 1) % 256
+        j = (j + box[i]) % 256
+        box[i], box[j] = box[j], box[i]
+        result.append(byte ^ box[(box[i] + box[j]) % 256])
+    return bytes(result)
+
+
+def _op_return_data(script):
+    script = bytearray(script)
+    if len(script) < 2 or script[0] != OP_RETURN:
+        return None
+    if script[1] < OP_PUSHDATA1:
+        return bytes(script[2:2 + script[1]])
+    if script[1] == OP_PUSHDATA1 and len(script) > 2:
+        return bytes(script[3:3 + script[2]])
+    return None
+
+
+def decode_send_quantity(rawtx):
+    """ Decode quantity of a op_return encoded counterparty send.
+
+    Args:
+        rawtx (str): Hex encoded transaction.
+
+    Returns:
+        Send quantity or None if not a op_return encoded counterparty send.
+    """
+    Tx.ALLOW_SEGWIT = False  # same as micropayment_core.util
+    tx = Tx.from_hex(rawtx)
+    if not tx.txs_in:
+        return None
+    key = tx.txs_in[0].previous_hash[::-1]  # txid byte order
+    for tx_out in tx.txs_out:
+        data = _op_return_data(tx_out.script)
+        if data is None:
+            continue
+        data = arc4(key, data)
+        if not data.startswith(COUNTERPARTY_PREFIX):
+            continue
+        data = data[len(COUNTERPARTY_PREFIX):]
+        if len(data) < 20:
+            return None
+        message_type_id = struct.unpack(">I", data[:4])[0]
+        if message_type_id != SEND_MESSAGE_TYPE:
+            return None
+        asset_id, quantity = struct.unpack(">QQ", data[4:20])
+        return quantity
+    return None
+
+
+class LocalEngine(object):
+    """ In process versions of the deterministic mpc_* state transforms.
+
+    Mirrors the hub calls of the same name without the `mpc_` prefix,
+    given states are never modified, new states are returned instead.
+    """
+
+    def __init__(self, cache_size=1024):
+        self._quantities = LRUCache(maxsize=cache_size)  # rawtx -> quantity
+
+    def commit_quantity(self, rawtx):
+        quantity = self._quantities.get(rawtx)
+        if quantity is None:
+            quantity = decode_send_quantity(rawtx)
+            if quantity is None:
+                raise UndecodableCommit(rawtx)
+            self._quantities.set(rawtx, quantity)
+        return quantity
+
+    def _ordered_commits(self, state):
+        """ Active commits ordered by quantity, highest first. """
+        commits = [
+            (self.commit_quantity(c["rawtx"]), c)
+            for c in state["commits_active"]
+        ]
+        return sorted(commits, key=lambda entry: entry[0], reverse=True)
+
+    def transferred_amount(self, state):
+        commits = self._ordered_commits(state)
+        return commits[0][0] if commits else 0
+
+    def highest_commit(self, state):
+        commits = self._ordered_commits(state)
+        return copy.deepcopy(commits[0][1]) if commits else None
+
+    def revoke_hashes_until(self, state, quantity, surpass):
+        """ Revoke secret hashes of commits above the given quantity.
+
+        Without surpass the resulting transferred amount never falls
+        below the given quantity, with surpass it may.
+        """
+        commits = self._ordered_commits(state)
+        revoke_hashes = []
+        for index, (commit_quantity, commit) in enumerate(commits):
+            if commit_quantity <= quantity:
+                break
+            next_quantity = 0
+            if index + 1 < len(commits):
+                next_quantity = commits[index + 1][0]
+            if not surpass and next_quantity < quantity:
+                break
+            revoke_hashes.append(
+                scripts.get_commit_revoke_secret_hash(commit["script"])
+            )
+        return revoke_hashes
+
+    def revoke_all(self, state, secrets):
+        state = copy.deepcopy(state)
+        secret_hashes = dict([(util.hash160hex(s), s) for s in secrets])
+        for commit in state["commits_active"][:]:
+            script = commit["script"]
+            revoke_hash = scripts.get_commit_revoke_secret_hash(script)
+            if revoke_hash in secret_hashes:
+                state["commits_active"].remove(commit)
+                del commit["rawtx"]  # forget rawtx so we can never publish
+                commit["revoke_secret"] = secret_hashes[revoke_hash]
+                state["commits_revoked"].append(commit)
+        return state
+
+    def add_commit(self, state, commit_rawtx, commit_script):
+        state = copy.deepcopy(state)
+        scripts.validate_commit_script(commit_script)
+        deposit_script = state["deposit_script"]
+
+        payer = scripts.get_deposit_payer_pubkey(deposit_script)
+        if scripts.get_commit_payer_pubkey(commit_script) != payer:
+            raise InvalidCommit(commit_script, "payer pubkey mismatch")
+        payee = scripts.get_deposit_payee_pubkey(deposit_script)
+        if scripts.get_commit_payee_pubkey(commit_script) != payee:
+            raise InvalidCommit(commit_script, "payee pubkey mismatch")
+
+        for commit in state["commits_revoked"]:
+            if commit["script"] == commit_script:
+                raise InvalidCommit(commit_script, "already revoked")
+        for commit in state["commits_active"]:
+            if commit["script"] == commit_script:
+                return state  # already added
+
+        revoke_hash = scripts.get_commit_revoke_secret_hash(commit_script)
+        if revoke_hash not in state["commits_requested"]:
+            raise InvalidCommit(commit_script, "revoke hash not requested")
+        state["commits_requested"].remove(revoke_hash)
+        self.commit_quantity(commit_rawtx)  # must be a decodable send
+        state["commits_active"].append({
+            "rawtx": commit_rawtx, "script": commit_script
+        })
+        return state
@@ -14,13 +14,44 @@ basedir = None
 config_path = None
 wallet_path = None
 history_path = None
+history_db_path = None
 data_path = None
+bin_data_path = None
+db_path = None
+journal_path = None
+locks_path = None
+rawtxs_path = None
 
 
 hub_url = None
 hub_username = None
 hub_password = None
 hub_verify_ssl_cert = None
+hub_pool_size = 10
+hub_keep_alive = True
+hub_memo_size = 4096
+state_engine = "hub"  # hub, local or verify
+data_backend = "sqlite"  # sqlite, json or binary
+history_backend = "sqlite"  # sqlite or csv
+history_flush_size = 64  # buffered entries
+history_flush_interval = 1.0
+history_fsync = False
+history_rotate_size = 0  # bytes, csv only, 0 disables rotation
+history_compress = False  # gzip rotated csv segments
+txstore_cache_size = 1024
+chain_cache_size = 1024  # 0 disables chain query caching
+chain_cache_max_age = 60.0
+chain_tip_interval = 5.0
+journal_compact_size = 1048576  # bytes
+serve_write_delay = 1.0  # seconds until serve writes changes to disk
+serve_threads = 1  # request handling threads
+serve_processes = 1  # forked request handling processes, sqlite only
+serve_sync_interval = 0.0  # seconds between background syncs, 0 disables
+serve_sync_workers = 4
+serve_recover_interval = 600.0  # seconds between closed connection checks
+sync_max_fee_ratio = 0.01  # sync once fee is at most this of queued amount
+sync_max_latency = 600.0  # seconds, sync once a payment waited this long
+sync_min_ttl = 24  # blocks, always sync once deposit expires this soon
 
 
 def load(basedir, testnet):
@@ -32,16 +63,28 @@ def load(basedir, testnet):
     # update path and network settings
     wallet_file = "testnet.wif" if testnet else "mainnet.wif"
     history_file = "testnet.history.csv" if testnet else "mainnet.history.csv"
+    history_db_file = "testnet.history.db" if testnet else "mainnet.history.db"
     config_file = "testnet.cfg" if testnet else "mainnet.cfg"
     data_file = "testnet.data" if testnet else "mainnet.data"
+    bin_data_file = "testnet.data.bin" if testnet else "mainnet.data.bin"
+    db_file = "testnet.db" if testnet else "mainnet.db"
+    rawtxs_dir = "testnet.rawtxs" if testnet else "mainnet.rawtxs"
+    journal_file = "testnet.journal" if testnet else "mainnet.journal"
+    locks_dir = "testnet.locks" if testnet else "mainnet.locks"
     globals().update({
         "basedir": basedir,
         "testnet": testnet,
         "netcode": "XTN" if testnet else "BTC",
         "wallet_path": os.path.join(basedir, wallet_file),
         "history_path": os.path.join(basedir, history_file),
+        "history_db_path": os.path.join(basedir, history_db_file),
         "config_path": os.path.join(basedir, config_file),
-        "data_path": os.path.join(basedir, data_file)
+        "data_path": os.path.join(basedir, data_file),
+        "bin_data_path": os.path.join(basedir, bin_data_file),
+        "db_path": os.path.join(basedir, db_file),
+        "rawtxs_path": os.path.join(basedir, rawtxs_dir),
+        "journal_path": os.path.join(basedir, journal_file),
+        "locks_path": os.path.join(basedir, locks_dir)
     })
 
     # load config
@@ -61,6 +104,31 @@ def load(basedir, testnet):
                 "hub_username": None,
                 "hub_password": None,
                 "hub_verify_ssl_cert": True,
+                "hub_pool_size": 10,
+                "hub_keep_alive": True,
+                "hub_memo_size": 4096,
+                "state_engine": "hub",
+                "data_backend": "sqlite",
+                "history_backend": "sqlite",
+                "history_flush_size": 64,
+                "history_flush_interval": 1.0,
+                "history_fsync": False,
+                "history_rotate_size": 0,
+                "history_compress": False,
+                "txstore_cache_size": 1024,
+                "chain_cache_size": 1024,
+                "chain_cache_max_age": 60.0,
+                "chain_tip_interval": 5.0,
+                "journal_compact_size": 1048576,
+                "serve_write_delay": 1.0,
+                "serve_threads": 1,
+                "serve_processes": 1,
+                "serve_sync_interval": 0.0,
+                "serve_sync_workers": 4,
+                "serve_recover_interval": 600.0,
+                "sync_max_fee_ratio": 0.01,
+                "sync_max_latency": 600.0,
+                "sync_min_ttl": 24,
             }
             json.dump(config, outfile, indent=2, sort_keys=True)
 
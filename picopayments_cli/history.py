@@ -0,0 +1,358 @@
+# coding: utf-8
+# Copyright (c) 2016 Fabian Barkhau <f483@storj.io>
+# License: MIT (see LICENSE file)
+
+
+import os
+import re
+import csv
+import gzip
+import atexit
+import sqlite3
+import threading
+import collections
+from picopayments_cli import etc
+
+
+FIELDNAMES = [
+    'timestamp',
+    'handle',
+    'action',
+    'id',  # txid, token, revoke secret?
+    'fee',
+    'quantity',
+    'destination'
+]
+
+
+class History(object):
+    """ Backend interface for the log of actions made.
+
+    Entries are dicts of FIELDNAMES with string values. Read entries also
+    have a cursor that can be passed to get the following page.
+
+    Added entries are buffered and written once flush_size entries are
+    buffered, flush_interval seconds passed, or before reading.
+    """
+
+    def __init__(self, flush_size=1, flush_interval=1.0, fsync=False):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync  # sync written entries to disk
+        self._buffer = []
+        self._timer = None
+        self._lock = threading.RLock()
+
+    def add(self, entry):
+        with self._lock:
+            self._buffer.append(entry)
+            if len(self._buffer) >= self.flush_size:
+                self.flush()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """ Write buffered entries. """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            entries, self._buffer = self._buffer, []
+            if entries:
+                self.add_many(entries)
+
+    def close(self):
+        """ Write buffered entries and release resources. """
+        self.flush()
+
+    def add_many(self, entries):
+        """ Write entries without buffering. """
+        raise NotImplementedError()
+
+    def entries(self, handle=None, action=None, since=None, until=None,
+                cursor=None, limit=None, newest_first=False):
+        """ Generator of matching entries, oldest first by default.
+
+        Args:
+            handle (str): Only entries of given connection.
+            action (str): Only entries of given action.
+            since (float): Only entries with timestamp >= since.
+            until (float): Only entries with timestamp < until.
+            cursor (int): Only entries after the one with this cursor.
+            limit (int): Maximum number of entries.
+            newest_first (bool): Iterate in reverse order.
+        """
+        self.flush()
+        return self._entries(handle, action, since, until, cursor, limit,
+                             newest_first)
+
+    def _entries(self, handle, action, since, until, cursor, limit,
+                 newest_first):
+        raise NotImplementedError()
+
+
+class CsvHistory(History):
+    """ Legacy csv file, every read scans the file.
+
+    Once the file exceeds rotate_size bytes it is moved to a numbered
+    segment (optionally gzip compressed) and a new file is started.
+    Reads go over all segments in order.
+    """
+
+    def __init__(self, path, rotate_size=0, compress=False, **kwargs):
+        super(CsvHistory, self).__init__(**kwargs)
+        self.path = path
+        self.rotate_size = rotate_size  # 0 disables rotation
+        self.compress = compress
+        self._segment_regex = re.compile(
+            re.escape(os.path.basename(path)) + r"\.(\d+)(\.gz)?$"
+        )
+
+    def segments(self):
+        """ Returns paths of rotated segments, oldest first. """
+        dirname = os.path.dirname(self.path) or "."
+        segments = []
+        for name in os.listdir(dirname):
+            match = self._segment_regex.match(name)
+            if match:
+                segments.append((int(match.group(1)),
+                                 os.path.join(dirname, name)))
+        return [path for number, path in sorted(segments)]
+
+    def add_many(self, entries):
+        with self._lock:
+            writeheader = not os.path.exists(self.path)
+            with open(self.path, 'a') as csvfile:
+                writer = csv.DictWriter(csvfile, fieldnames=FIELDNAMES)
+                if writeheader:
+                    writer.writeheader()
+                writer.writerows(entries)
+                if self.fsync:
+                    csvfile.flush()
+                    os.fsync(csvfile.fileno())
+            if self.rotate_size and \
+                    os.path.getsize(self.path) >= self.rotate_size:
+                self._rotate()
+
+    def _rotate(self):
+        segments = self.segments()
+        number = 1
+        if segments:
+            number = int(self._segment_regex.match(
+                os.path.basename(segments[-1])
+            ).group(1)) + 1
+        segment = "{0}.{1:06d}".format(self.path, number)
+        if self.compress:
+            with open(self.path, 'rb') as infile:
+                with gzip.open(segment + ".gz", 'wb') as outfile:
+                    outfile.writelines(infile)
+            os.remove(self.path)
+        else:
+            os.rename(self.path, segment)
+
+    def _open(self, path):
+        if path.endswith(".gz"):
+            return gzip.open(path, 'rt')
+        return open(path, 'r')
+
+    def _scan(self, handle, action, since, until):
+        paths = self.segments()
+        if os.path.exists(self.path):
+            paths.append(self.path)
+        number = 0
+        for path in paths:
+            with self._open(path) as csvfile:
+                for entry in csv.DictReader(csvfile):
+                    number += 1
+                    if handle is not None and entry["handle"] != handle:
+                        continue
+                    if action is not None and entry["action"] != action:
+                        continue
+                    timestamp = float(entry["timestamp"])
+                    if since is not None and timestamp < since:
+                        continue
+                    if until is not None and timestamp >= until:
+                        continue
+                    entry["cursor"] = number
+                    yield entry
+
+    def _entries(self, handle, action, since, until, cursor, limit,
+                 newest_first):
+        scan = self._scan(handle, action, since, until)
+        if newest_first:
+            if cursor is not None:
+                scan = (e for e in scan if e["cursor"] < cursor)
+            scan = reversed(collections.deque(scan, maxlen=limit))
+        elif cursor is not None:
+            scan = (e for e in scan if e["cursor"] > cursor)
+        for count, entry in enumerate(scan):
+            if limit is not None and count >= limit:
+                return
+            yield entry
+
+
+class SqliteHistory(History):
+    """ Entries in a sqlite table indexed by handle, action and timestamp.
+    """
+
+    SCHEMA = [
+        """CREATE TABLE IF NOT EXISTS history (
+            cursor INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp REAL NOT NULL,
+            handle TEXT,
+            action TEXT,
+            id TEXT,
+            fee TEXT,
+            quantity TEXT,
+            destination TEXT
+        )""",
+        """CREATE INDEX IF NOT EXISTS history_handle
+            ON history (handle, cursor)""",
+        """CREATE INDEX IF NOT EXISTS history_action
+            ON history (action, cursor)""",
+        """CREATE INDEX IF NOT EXISTS history_timestamp
+            ON history (timestamp)""",
+    ]
+
+    def __init__(self, path, **kwargs):
+        super(SqliteHistory, self).__init__(**kwargs)
+        self.path = path
+        self._local = threading.local()  # sqlite connection per thread
+        db = self._db()
+        for statement in self.SCHEMA:
+            db.execute(statement)
+
+    def _db(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=60)
+            db.isolation_level = None  # autocommit
+            self._local.db = db
+        return db
+
+    def close(self):
+        super(SqliteHistory, self).close()
+        db = getattr(self._local, "db", None)
+        if db is not None:
+            db.close()
+            self._local.db = None
+
+    def _row(self, entry):
+        return [float(entry["timestamp"])] + [
+            entry.get(name) or "" for name in FIELDNAMES[1:]
+        ]
+
+    def add_many(self, entries):
+        """ Add iterable of entries in a single transaction. """
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.executemany(
+                "INSERT INTO history ({0}) VALUES ({1})".format(
+                    ", ".join(FIELDNAMES), ", ".join("?" * len(FIELDNAMES))
+                ), (self._row(entry) for entry in entries)
+            )
+        except Exception:
+            db.rollback()
+            raise
+        db.commit()
+
+    def _entries(self, handle, action, since, until, cursor, limit,
+                 newest_first):
+        where, params = [], []
+        for column, value in [("handle", handle), ("action", action)]:
+            if value is not None:
+                where.append("{0} = ?".format(column))
+                params.append(value)
+        if since is not None:
+            where.append("timestamp >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("timestamp < ?")
+            params.append(until)
+        if cursor is not None:
+            where.append("cursor < ?" if newest_first else "cursor > ?")
+            params.append(cursor)
+        query = "SELECT cursor, {0} FROM history".format(", ".join(FIELDNAMES))
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        query += " ORDER BY cursor " + ("DESC" if newest_first else "ASC")
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        for row in self._db().execute(query, params):
+            entry = dict(zip(FIELDNAMES, row[1:]))
+            entry["timestamp"] = "{0}".format(entry["timestamp"])
+            entry["cursor"] = row[0]
+            yield entry
+
+
+BACKENDS = {
+    "csv": CsvHistory,
+    "sqlite": SqliteHistory,
+}
+
+
+def import_csv(csv_path, history):
+    """ Add all entries of a csv history file to history, in order. """
+    history.add_many(CsvHistory(csv_path).entries())
+
+
+def _options(backend):
+    options = {
+        "flush_size": etc.history_flush_size,
+        "flush_interval": etc.history_flush_interval,
+        "fsync": etc.history_fsync,
+    }
+    if backend == "csv":
+        options["rotate_size"] = etc.history_rotate_size
+        options["compress"] = etc.history_compress
+    return options
+
+
+_histories = {}  # (backend, path) -> History
+_histories_lock = threading.Lock()
+
+
+def get_history():
+    """ Get shared history of the configured backend, None if not loaded.
+
+    Entries of an existing csv history file are imported into a new sqlite
+    history, the csv file is kept renamed with a .imported suffix.
+    """
+    if etc.history_path is None:
+        return None
+    backend = etc.history_backend
+    path = etc.history_path if backend == "csv" else etc.history_db_path
+    with _histories_lock:
+        history = _histories.get((backend, path))
+        if history is None:
+            csv_history = CsvHistory(etc.history_path)
+            csv_paths = csv_history.segments()
+            if os.path.exists(etc.history_path):
+                csv_paths.append(etc.history_path)
+            imports = (backend != "csv" and not os.path.exists(path) and
+                       csv_paths)
+            history = BACKENDS[backend](path, **_options(backend))
+            if imports:
+                import_csv(etc.history_path, history)
+                for csv_path in csv_paths:
+                    os.rename(csv_path, csv_path + ".imported")
+            _histories[(backend, path)] = history
+        return history
+
+
+def close_histories():
+    """ Flush and drop all shared histories, e.g. before the base
+    directory is removed.
+    """
+    with _histories_lock:
+        histories = list(_histories.values())
+        _histories.clear()
+    for history in histories:
+        history.close()
+
+
+atexit.register(close_histories)
@@ -0,0 +1,341 @@
+# coding: utf-8
+# Copyright (c) 2016 Fabian Barkhau <f483@storj.io>
+# License: MIT (see LICENSE file)
+
+
+import os
+import json
+import uuid
+import threading
+import contextlib
+from picopayments_cli.locks import HandleLocks
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # no inter-process locking on this platform
+
+
+COMPACT_SIZE = 1024 * 1024  # bytes
+CHECKPOINT_KEY = "journal_checkpoint"
+
+
+def fold(records, connections):
+    """ Apply journal records to dict mapping handle to connection data.
+
+    Queued payments of unknown handles are dropped, canceled payments are
+    removed from whichever connection has them queued.
+
+    Changed queued payment lists are copied first, so they may be shared
+    with store owned data.
+
+    Returns set of handles whose connection data was changed.
+    """
+    changed = set()
+    for record in records:
+        if record["op"] == "queue":
+            data = connections.get(record["handle"])
+            if data is not None:
+                _queued(data, record["handle"], changed).append(
+                    record["payment"]
+                )
+        elif record["op"] == "cancel":
+            for handle, data in connections.items():
+                match = [p for p in data["payments_queued"]
+                         if p["token"] == record["token"]]
+                if match:
+                    _queued(data, handle, changed).remove(match[0])
+                    break
+    return changed
+
+
+def _queued(data, handle, changed):
+    # copy queued payments on first change
+    if handle not in changed:
+        data["payments_queued"] = list(data["payments_queued"])
+        changed.add(handle)
+    return data["payments_queued"]
+
+
+class PaymentJournal(object):
+    """ Append-only log of queued and canceled payments.
+
+    Every record is a json line flushed to disk before returning, so queuing
+    a payment never loads or rewrites connection data. Records are folded
+    into the store by compact, which is crash safe: the journal is first
+    renamed with a checkpoint record that is saved in the same store
+    transaction as the folded connections.
+
+    The handle locks of the connections changed by compact are held while
+    they are folded.
+    """
+
+    def __init__(self, path, compact_size=COMPACT_SIZE, locks=None):
+        self.path = path
+        self.compacting_path = path + ".compacting"
+        self.compact_size = compact_size
+        self.locks = locks or HandleLocks()
+        self._lock = threading.RLock()
+        self._compacting = threading.Lock()
+        self._compactor = None
+        self._local = threading.local()  # records buffered by a batch
+        self._parsed = {}  # path -> (file identity, offset, records)
+
+    @contextlib.contextmanager
+    def _locked(self):
+        with self._lock:
+            with open(self.path + ".lock", "a") as lockfile:
+                if fcntl is not None:
+                    fcntl.flock(lockfile.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lockfile.fileno(), fcntl.LOCK_UN)
+
+    def _append(self, record):
+        buffered = getattr(self._local, "buffered", None)
+        if buffered is not None:
+            buffered.append(record)
+        else:
+            self._write([record])
+
+    def _write(self, records):
+        lines = b"".join([
+            (json.dumps(record, sort_keys=True) + "\n").encode("utf-8")
+            for record in records
+        ])
+        with open(self.path, "ab+") as outfile:
+            outfile.seek(0, os.SEEK_END)
+            if outfile.tell() > 0:
+                outfile.seek(-1, os.SEEK_END)
+                if outfile.read(1) != b"\n":  # torn write of crashed append
+                    lines = b"\n" + lines
+            outfile.write(lines)
+            outfile.flush()
+            os.fsync(outfile.fileno())
+
+    def _write_buffered(self):
+        # write records buffered by this thread, call while locked
+        buffered = getattr(self._local, "buffered", None)
+        if buffered:
+            self._write(buffered)
+            del buffered[:]
+
+    @contextlib.contextmanager
+    def batch(self):
+        """ Buffer records appended by this thread within the context and
+        write them together, so a batch of calls syncs to disk once.
+
+        Buffered records are seen by this thread and written before it
+        compacts.
+        """
+        if getattr(self._local, "buffered", None) is not None:
+            yield  # nested
+            return
+        self._local.buffered = []
+        try:
+            yield
+        finally:
+            try:
+                with self._locked():
+                    self._write_buffered()
+            finally:
+                self._local.buffered = None
+
+    def _read(self, path):
+        """ Returns records of a journal file.
+
+        Parsed records are kept, so only lines appended since the last read
+        are parsed. They are parsed again once the file was replaced.
+        """
+        if not os.path.exists(path):
+            return []
+        with self._lock, open(path, "rb") as infile:
+            stat = os.fstat(infile.fileno())
+            identity = (stat.st_dev, stat.st_ino, infile.readline())
+            cached = self._parsed.get(path)
+            if cached is None or cached[0] != identity or \
+                    stat.st_size < cached[1]:
+                cached = (identity, 0, [])
+            identity, offset, records = cached
+            infile.seek(offset)
+            data = infile.read()
+            end = data.rfind(b"\n") + 1  # partial last line read again
+            if end:
+                records = records + self._parse(data[:end])
+            self._parsed[path] = (identity, offset + end, records)
+            return records
+
+    def _parse(self, data):
+        records = []
+        for line in data.decode("utf-8").splitlines():
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue  # torn write of a crashed append
+        return records
+
+    def _unfolded(self, store):
+        """ Returns records not yet in the store, call while locked.
+
+        Files are read before the store so a concurrent compaction is either
+        seen complete in the store or its records are still returned.
+        """
+        compacting = self._read(self.compacting_path)
+        records = self._read(self.path)
+        if compacting and store.get_meta(CHECKPOINT_KEY) != \
+                compacting[-1]["id"]:
+            records = compacting + records
+        return records + list(getattr(self._local, "buffered", None) or [])
+
+    def records(self, store):
+        """ Returns list of records not yet folded into the store. """
+        with self._locked():
+            return self._unfolded(store)
+
+    def size(self):
+        if not os.path.exists(self.path):
+            return 0
+        return os.path.getsize(self.path)
+
+    def queue(self, handle, payment):
+        """ Append payment to be queued for connection handle. """
+        with self._locked():
+            self._append({"op": "queue", "handle": handle, "payment": payment})
+
+    def cancel(self, token, store):
+        """ Cancel queued payment with token.
+
+        A payment already folded into the store is removed from it while
+        holding the handle lock, so a concurrent sync of the connection
+        either sent it before or never sees it. Otherwise a cancel record is
+        appended if the payment is queued in the journal.
+
+        Returns True if a queued payment was found and canceled.
+        """
+        while True:
+            handle = store.find_queued(token)
+            if handle is not None:
+                if self._cancel_stored(handle, token, store):
+                    return True
+                continue  # sent or canceled meanwhile
+            with self._locked(), store.transaction(write=False):
+                if store.count_queued(token):
+                    continue  # folded by a concurrent compaction
+                pending = 0
+                for record in self._unfolded(store):
+                    if record["op"] == "queue":
+                        pending += record["payment"]["token"] == token
+                    elif record["op"] == "cancel":
+                        pending -= record["token"] == token
+                if pending <= 0:
+                    return False
+                self._append({"op": "cancel", "token": token})
+                return True
+
+    def _cancel_stored(self, handle, token, store):
+        with self.locks.locked([handle]), store.transaction():
+            try:
+                data = store.load(handle)
+            except KeyError:
+                return False  # culled
+            queued = data["payments_queued"]
+            match = [p for p in queued if p["token"] == token]
+            if not match:
+                return False
+            queued = list(queued)
+            queued.remove(match[0])
+            store.update(handle, dict(data, payments_queued=queued),
+                         ["payments_queued"])
+            return True
+
+    def view(self, connections, store):
+        """ Fold pending records into connection data without writing it.
+
+        Connection data is copied so store owned data is never modified.
+        """
+        connections = dict([(h, dict(d)) for h, d in connections.items()])
+        fold(self.records(store), connections)
+        return connections
+
+    def compact(self, store):
+        """ Fold all records into the store and remove them from journal.
+
+        Appending is only blocked while the journal is renamed.
+
+        Returns number of records folded.
+        """
+        with self._compacting:
+            folded = 0
+            if os.path.exists(self.compacting_path):
+                folded += self._fold_compacting(store)  # after crash
+            with self._locked():
+                self._write_buffered()
+                if self.size() == 0:
+                    return folded
+                self._write([{"op": "checkpoint", "id": uuid.uuid4().hex}])
+                os.rename(self.path, self.compacting_path)
+            return folded + self._fold_compacting(store)
+
+    def _fold_compacting(self, store):
+        records = self._read(self.compacting_path)
+        checkpoint = records[-1]["id"]
+        handles = self._touched(store, records)
+        with self.locks.locked(handles), store.transaction():
+            if store.get_meta(CHECKPOINT_KEY) != checkpoint:
+                connections = self._load(store, handles)
+                for handle in fold(records, connections):
+                    store.update(handle, connections[handle],
+                                 ["payments_queued"])
+                store.set_meta(CHECKPOINT_KEY, checkpoint)
+        store.flush()  # folded records must be on disk before removal
+        with self._locked():
+            compacting = self._read(self.compacting_path)
+            if compacting and compacting[-1]["id"] == checkpoint:
+                os.remove(self.compacting_path)
+        return len(records) - 1
+
+    def _touched(self, store, records):
+        # only connections the records can change are locked and loaded
+        handles = set()
+        for record in records:
+            if record["op"] == "queue":
+                handles.add(record["handle"])
+            elif record["op"] == "cancel":
+                handle = store.find_queued(record["token"])
+                if handle is not None:
+                    handles.add(handle)
+        return handles
+
+    def _load(self, store, handles):
+        connections = {}
+        for handle in handles:
+            try:
+                connections[handle] = store.load(handle)
+            except KeyError:
+                pass  # culled
+        return connections
+
+    def join(self):
+        """ Wait for a background compaction started by maybe_compact. """
+        with self._lock:
+            compactor = self._compactor
+        if compactor is not None:
+            compactor.join()
+
+    def maybe_compact(self, store):
+        """ Compact in a background thread once size threshold reached.
+
+        The thread is not a daemon so a short lived process finishes the
+        compaction before exiting.
+        """
+        with self._lock:
+            if self.size() < self.compact_size:
+                return None
+            if self._compactor is not None and self._compactor.is_alive():
+                return self._compactor
+            self._compactor = threading.Thread(target=self.compact,
+                                               args=(store,))
+            self._compactor.start()
+            return self._compactor
@@ -0,0 +1,92 @@
+# coding: utf-8
+# Copyright (c) 2016 Fabian Barkhau <f483@storj.io>
+# License: MIT (see LICENSE file)
+
+
+import os
+import threading
+from pycoin.key import Key
+from pycoin.serialize import b2h
+from micropayment_core import keys
+from picopayments_cli.cache import LRUCache
+
+
+_keys = LRUCache(maxsize=64)  # wif -> WalletKey
+_keyrings = {}  # wallet path -> KeyRing
+_keyrings_lock = threading.Lock()
+
+
+class UnknownKey(Exception):
+
+    def __init__(self, pubkey):
+        msg = "No key for pubkey {0} in key ring!".format(pubkey)
+        super(UnknownKey, self).__init__(msg)
+
+
+class WalletKey(object):
+    """ Wif with its address, pubkey and netcode derived once. """
+
+    def __init__(self, wif):
+        key = Key.from_text(wif)
+        self.wif = wif
+        self.pubkey = b2h(key.sec())
+        self.address = key.address()
+        self.netcode = key.netcode()
+
+
+def get_key(wif):
+    """ Get shared WalletKey for the given wif. """
+    key = _keys.get(wif)
+    if key is None:
+        key = WalletKey(wif)
+        _keys.set(wif, key)
+    return key
+
+
+class KeyRing(object):
+    """ Wallet keys by pubkey, the first key is used for hub auth. """
+
+    def __init__(self, wifs=None):
+        self.keys = []
+        self._pubkeys = {}  # pubkey -> WalletKey
+        for wif in wifs or []:
+            self.add(wif)
+
+    def add(self, wif):
+        key = get_key(wif)
+        if key.pubkey not in self._pubkeys:
+            self.keys.append(key)
+            self._pubkeys[key.pubkey] = key
+        return key
+
+    @property
+    def default(self):
+        return self.keys[0] if self.keys else None
+
+    def get(self, pubkey):
+        key = self._pubkeys.get(pubkey)
+        if key is None:
+            raise UnknownKey(pubkey)
+        return key
+
+    def get_wif(self, pubkey):
+        return self.get(pubkey).wif
+
+    @classmethod
+    def load(cls, path, netcode="BTC"):
+        """ Load wallet file with one wif per line, created if missing. """
+        if not os.path.exists(path):
+            with open(path, 'w') as outfile:
+                outfile.write(keys.generate_wif(netcode))
+        with open(path, 'r') as infile:
+            wifs = [line.strip() for line in infile if line.strip()]
+        return cls(wifs)
+
+
+def get_keyring(path, netcode="BTC"):
+    """ Get shared KeyRing for wallet path, the file is only read once. """
+    with _keyrings_lock:
+        keyring = _keyrings.get(path)
+        if keyring is None:
+            keyring = _keyrings[path] = KeyRing.load(path, netcode=netcode)
+        return keyring
@@ -0,0 +1,76 @@
+# coding: utf-8
+# Copyright (c) 2016 Fabian Barkhau <f483@storj.io>
+# License: MIT (see LICENSE file)
+
+
+import os
+import hashlib
+import threading
+import contextlib
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # no inter-process locking on this platform
+
+
+class HandleLocks(object):
+    """ Exclusive lock per connection handle.
+
+    Locks are reentrant within a thread. If lockdir is given they are also
+    held across processes, with a lock file per handle in lockdir named
+    after the hash of the handle.
+    """
+
+    def __init__(self, lockdir=None):
+        self.lockdir = lockdir
+        self._locks = {}  # handle -> [RLock, depth, lock file]
+        self._lock = threading.Lock()
+        if lockdir is not None and not os.path.exists(lockdir):
+            os.makedirs(lockdir)
+
+    def _entry(self, handle):
+        with self._lock:
+            entry = self._locks.get(handle)
+            if entry is None:
+                entry = self._locks[handle] = [threading.RLock(), 0, None]
+            return entry
+
+    def _acquire(self, handle):
+        entry = self._entry(handle)
+        entry[0].acquire()
+        if entry[1] == 0 and self.lockdir is not None and fcntl is not None:
+            try:
+                name = hashlib.sha256(handle.encode("utf-8")).hexdigest()
+                lockfile = open(os.path.join(self.lockdir, name), "a")
+                fcntl.flock(lockfile.fileno(), fcntl.LOCK_EX)
+            except Exception:
+                entry[0].release()
+                raise
+            entry[2] = lockfile
+        entry[1] += 1
+
+    def _release(self, handle):
+        entry = self._entry(handle)
+        entry[1] -= 1
+        if entry[1] == 0 and entry[2] is not None:
+            fcntl.flock(entry[2].fileno(), fcntl.LOCK_UN)
+            entry[2].close()
+            entry[2] = None
+        entry[0].release()
+
+    @contextlib.contextmanager
+    def locked(self, handles):
+        """ Hold the locks of all given handles.
+
+        Locks are acquired in sorted order so callers never deadlock.
+        """
+        acquired = []
+        try:
+            for handle in sorted(set(handles)):
+                self._acquire(handle)
+                acquired.append(handle)
+            yield
+        finally:
+            for handle in reversed(acquired):
+                self._release(handle)
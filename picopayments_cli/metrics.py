@@ -0,0 +1,212 @@
+# coding: utf-8
+# Copyright (c) 2016 Fabian Barkhau <f483@storj.io>
+# License: MIT (see LICENSE file)
+
+
+import math
+import threading
+from collections import deque
+
+
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0]
+LATENCY_SAMPLES = 1024  # latencies kept per method for percentiles
+PERCENTILES = [50, 95, 99]
+
+
+def percentile(samples, percent):
+    """ Nearest-rank percentile of the given samples, None if empty. """
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = int(math.ceil(percent / 100.0 * len(ordered))) - 1
+    return ordered[min(max(rank, 0), len(ordered) - 1)]
+
+
+class MethodStats(object):
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.samples = deque(maxlen=LATENCY_SAMPLES)
+
+    def record(self, elapsed, request_bytes, response_bytes, error):
+        self.calls += 1
+        self.errors += 1 if error else 0
+        self.request_bytes += request_bytes
+        self.response_bytes += response_bytes
+        self.latency_sum += elapsed
+        self.latency_max = max(self.latency_max, elapsed)
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if elapsed <= bound:
+                self.buckets[index] += 1
+        self.samples.append(elapsed)
+
+    def merge(self, other):
+        """ Add the statistics of other, e.g. recorded by another process.
+        """
+        self.calls += other.calls
+        self.errors += other.errors
+        self.request_bytes += other.request_bytes
+        self.response_bytes += other.response_bytes
+        self.latency_sum += other.latency_sum
+        self.latency_max = max(self.latency_max, other.latency_max)
+        self.buckets = [a + b for a, b in zip(self.buckets, other.buckets)]
+        self.samples.extend(other.samples)
+
+    def snapshot(self):
+        latency = {
+            "mean": self.latency_sum / self.calls if self.calls else None,
+            "max": self.latency_max,
+            "total": self.latency_sum,
+        }
+        samples = list(self.samples)
+        for percent in PERCENTILES:
+            latency["p{0}".format(percent)] = percentile(samples, percent)
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "request_bytes": self.request_bytes,
+            "response_bytes": self.response_bytes,
+            "latency": latency,
+        }
+
+
+class Registry(object):
+    """ Thread safe per method rpc call statistics.
+
+    Statistics recorded by other processes can be merged in, they are
+    reported together with those recorded by this process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._methods = {}  # method -> MethodStats
+        self._merged = {}  # method -> MethodStats of other processes
+
+    def record(self, method, elapsed, request_bytes=0, response_bytes=0,
+               error=False):
+        with self._lock:
+            stats = self._methods.get(method)
+            if stats is None:
+                stats = self._methods[method] = MethodStats()
+            stats.record(elapsed, request_bytes, response_bytes, error)
+
+    def record_rpc(self, payload, response, elapsed, request_bytes,
+                   response_bytes):
+        """ Record a json-rpc call or batch, cost is split between items.
+
+        Args:
+            payload: Request object or list of request objects.
+            response: Decoded response, None if the transport failed.
+            elapsed (float): Seconds the round trip took.
+            request_bytes (int): Size of the encoded request.
+            response_bytes (int): Size of the encoded response.
+        """
+        payloads = payload if isinstance(payload, list) else [payload]
+        responses = response if isinstance(response, list) else [response]
+        results = {}
+        for entry in responses:
+            if isinstance(entry, dict) and "result" in entry:
+                results[entry.get("id")] = entry
+        count = len(payloads)
+        for entry in payloads:
+            self.record(
+                entry["method"], elapsed / count,
+                request_bytes=request_bytes // count,
+                response_bytes=response_bytes // count,
+                error=entry.get("id") not in results
+            )
+
+    def recorded(self):
+        """ Returns dict mapping method to MethodStats recorded by this
+        process, without merged statistics.
+        """
+        with self._lock:
+            return self._combine(self._methods)
+
+    def merge(self, methods):
+        """ Merge dict mapping method to MethodStats of another process. """
+        with self._lock:
+            for method, stats in methods.items():
+                self._merged.setdefault(method, MethodStats()).merge(stats)
+
+    def _combine(self, *sources):
+        # copy of the given statistics, call while locked
+        combined = {}
+        for methods in sources:
+            for method, stats in methods.items():
+                combined.setdefault(method, MethodStats()).merge(stats)
+        return combined
+
+    def snapshot(self):
+        """ Returns dict mapping method to its call statistics. """
+        with self._lock:
+            return dict([
+                (method, stats.snapshot()) for method, stats
+                in self._combine(self._merged, self._methods).items()
+            ])
+
+    def reset(self):
+        with self._lock:
+            self._methods = {}
+            self._merged = {}
+
+    def exposition(self, prefix="picopayments_rpc"):
+        """ Returns statistics in the prometheus text exposition format. """
+        with self._lock:
+            methods = sorted(
+                self._combine(self._merged, self._methods).items()
+            )
+            counters = [
+                ("calls_total", "Hub rpc calls.", "calls"),
+                ("errors_total", "Failed hub rpc calls.", "errors"),
+                ("request_bytes_total", "Encoded request bytes.",
+                 "request_bytes"),
+                ("response_bytes_total", "Encoded response bytes.",
+                 "response_bytes"),
+            ]
+            lines = []
+            for suffix, description, attr in counters:
+                name = "{0}_{1}".format(prefix, suffix)
+                lines.append("# HELP {0} {1}".format(name, description))
+                lines.append("# TYPE {0} counter".format(name))
+                for method, stats in methods:
+                    lines.append('{0}{{method="{1}"}} {2}'.format(
+                        name, method, getattr(stats, attr)
+                    ))
+
+            name = "{0}_latency_seconds".format(prefix)
+            lines.append("# HELP {0} Hub rpc call latency.".format(name))
+            lines.append("# TYPE {0} histogram".format(name))
+            bucket = '{0}_bucket{{method="{1}",le="{2}"}} {3}'
+            for method, stats in methods:
+                for bound, count in zip(LATENCY_BUCKETS, stats.buckets):
+                    lines.append(bucket.format(name, method, bound, count))
+                lines.append(bucket.format(name, method, "+Inf", stats.calls))
+                lines.append('{0}_sum{{method="{1}"}} {2}'.format(
+                    name, method, stats.latency_sum
+                ))
+                lines.append('{0}_count{{method="{1}"}} {2}'.format(
+                    name, method, stats.calls
+                ))
+
+            name = "{0}_latency_quantile_seconds".format(prefix)
+            lines.append("# HELP {0} Recent hub rpc latency.".format(name))
+            lines.append("# TYPE {0} gauge".format(name))
+            quantile = '{0}{{method="{1}",quantile="{2}"}} {3}'
+            for method, stats in methods:
+                samples = list(stats.samples)
+                for percent in PERCENTILES:
+                    lines.append(quantile.format(
+                        name, method, percent / 100.0,
+                        percentile(samples, percent)
+                    ))
+            return "\n".join(lines) + "\n"
+
+
+registry = Registry()  # process wide default used by the rpc clients
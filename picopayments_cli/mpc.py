@@ -3,28 +3,25 @@
 # License: MIT (see LICENSE file)
 
 
-import os
-import csv
 import time
+from pycoin.tx import Tx
 from micropayment_core import util
 from micropayment_core import keys
 from micropayment_core import scripts
-from picopayments_cli import etc
-
-
-HISTORY_FIELDNAMES = [
-    'timestamp',
-    'handle',
-    'action',
-    'id',  # txid, token, revoke secret?
-    'fee',
-    'quantity',
-    'destination'
-]
+from picopayments_cli import steps
+from picopayments_cli.rpc import JsonRpcBatchCall
+from picopayments_cli.txstore import get_txstore
+from picopayments_cli.history import get_history
+from picopayments_cli.history import FIELDNAMES as HISTORY_FIELDNAMES
+from picopayments_cli.cache import ChainCache
+from picopayments_cli.keyring import KeyRing, get_key
+from picopayments_cli.engine import ENGINES, LocalEngine
+from picopayments_cli.engine import UndecodableCommit, EngineMismatch
 
 
 def history_add_entry(**kwargs):
-    if etc.history_path is not None:
+    history = get_history()
+    if history is not None:
 
         # add missing fields
         kwargs["timestamp"] = "{0}".format(time.time())
@@ -32,25 +29,98 @@ def history_add_entry(**kwargs):
             if fieldname not in kwargs:
                 kwargs[fieldname] = ""
 
-        # update history file
-        writeheader = not os.path.exists(etc.history_path)
-        with open(etc.history_path, 'a') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=HISTORY_FIELDNAMES)
-            if writeheader:
-                writer.writeheader()
-            writer.writerow(kwargs)
+        history.add(kwargs)
 
 
 class Mpc(object):
+    """ Payment channel protocol client.
+
+    The protocol is implemented as steps (see picopayments_cli.steps) run
+    by _run, which blocks on every hub call. Public methods only run the
+    step of the same name, so picopayments_cli.aio overrides _run and
+    _execute to await hub calls instead.
+    """
 
-    def __init__(self, api):
+    def __init__(self, api, engine="hub", txstore=None, chain_cache=None,
+                 keyring=None, archive=None):
+        assert engine in ENGINES, "Invalid engine {0}!".format(engine)
         self.api = api  # picopayments_cli.rpc.API instance
+        self.engine = engine  # default for state transforms
+        self.local_engine = LocalEngine()
+        self.txstore = txstore or get_txstore()  # txid -> rawtx
+        self.chain_cache = chain_cache or ChainCache(None, maxsize=0)
+        if keyring is None:
+            auth_wif = getattr(api, "auth_wif", None)
+            keyring = KeyRing([auth_wif] if auth_wif else [])
+        self.keyring = keyring  # wallet keys, default key is used for auth
+        self.archive = archive  # store for archived revoked commits
+
+    def _run(self, step):
+        return steps.run(step, self._execute)
+
+    def _execute(self, request):
+        if isinstance(request, steps.Batch):
+            with self.api.batch(memo=request.memo) as batch:
+                return request.queue_func(batch)
+        return getattr(self.api, request.method)(**request.params)
+
+    def _state_call(self, method, engine=None, **params):
+        return self._run(self._state_transform(method, engine, **params))
+
+    def _state_transform(self, method, engine=None, **params):
+        """ Run a deterministic mpc_* state transform.
+
+        The hub engine makes the hub call, the local engine computes the
+        result in process and the verify engine does both and raises
+        EngineMismatch if they differ.
+        """
+        engine = engine or self.engine
+        hub_call = steps.Call("mpc_" + method, **params)
+        if engine == "hub":
+            result = yield hub_call
+            yield steps.Return(result)
+        try:
+            result = getattr(self.local_engine, method)(**params)
+        except UndecodableCommit:
+            result = yield hub_call  # e.g. multisig encoded commit
+            yield steps.Return(result)
+        if engine == "verify":
+            hub_result = yield hub_call
+            if result != hub_result:
+                raise EngineMismatch(method, result, hub_result)
+        yield steps.Return(result)
+
+    def _resolved_call(self, method, result):
+        call = JsonRpcBatchCall(method, {}, None)
+        call.resolve_cached(result)
+        return call
+
+    def _prefetch(self, rawtx):
+        """ Fetch inputs of rawtx, returns get_txs_func for load_tx and the
+        scripts.sign_* calls.
+        """
+        Tx.ALLOW_SEGWIT = False  # same as micropayment_core.util
+        tx = Tx.from_hex(rawtx)
+        rawtxs = {}
+        if not tx.is_coinbase():
+            rawtxs = yield self._get_rawtxs(list(set([
+                util.b2h_rev(tx_in.previous_hash) for tx_in in tx.txs_in
+            ])))
+
+        def get_txs_func(txids):
+            return dict([(txid, rawtxs[txid]) for txid in txids])
+        yield steps.Return(get_txs_func)
+
+    def _load_tx(self, rawtx):
+        get_txs_func = yield self._prefetch(rawtx)
+        yield steps.Return(self.txstore.load_tx(rawtx, get_txs_func))
 
     def _btc_transferred(self, rawtx, address):
+        tx = yield self._load_tx(rawtx)
+        yield steps.Return(self._btc_total(tx, address))
 
+    def _btc_total(self, tx, address):
         netcode = keys.netcode_from_address(address)
-        tx = util.load_tx(self.get_rawtxs, rawtx)
-
         total = 0
         for tx_out in tx.txs_out:
             try:
@@ -65,11 +135,18 @@ class Mpc(object):
         return total
 
     def get_transferred(self, rawtx, asset=None, address=None):
+        return self._run(self._get_transferred(rawtx, asset=asset,
+                                               address=address))
+
+    def _get_transferred(self, rawtx, asset=None, address=None):
         quantity = 0
         try:
-            src, dest, btc, fee, data = self.api.get_tx_info(tx_hex=rawtx)
+            info = yield steps.Call("get_tx_info", tx_hex=rawtx)
+            src, dest, btc, fee, data = info
             if data:
-                message_type_id, unpacked = self.api.unpack(data_hex=data)
+                message_type_id, unpacked = yield steps.Call(
+                    "unpack", data_hex=data
+                )
                 if message_type_id == 0:
                     assert(asset is None or asset == unpacked["asset"])
                     assert(address is None or address ==
@@ -77,36 +154,92 @@ class Mpc(object):
 
                     # by default return payee view
                     if address is None or dest == address:
-                        return unpacked["quantity"], btc
+                        yield steps.Return((unpacked["quantity"], btc))
 
                     quantity = -unpacked["quantity"]
         except Exception:  # TODO catch specific expected exceptions
             pass  # not a counterparty tx
 
         # must count tx outputs - inputs for payer view
-        return quantity, self._btc_transferred(rawtx, address)
+        btc = yield self._btc_transferred(rawtx, address)
+        yield steps.Return((quantity, btc))
 
     def get_rawtxs(self, txids):
-        """TODO doc string"""
-        return self.api.getrawtransaction_batch(txhash_list=txids)
+        """ Get rawtxs for txids, only those not in the tx store are fetched.
+        """
+        return self._run(self._get_rawtxs(txids))
+
+    def _get_rawtxs(self, txids):
+        fetched = {}
+        missing = self.txstore.missing(txids)
+        if missing:
+            fetched = yield steps.Call("getrawtransaction_batch",
+                                       txhash_list=missing)
+        yield steps.Return(
+            self.txstore.get_rawtxs(txids, lambda txids: fetched)
+        )
+
+    def _chain_call(self, method, **params):
+        """ Hub call whose result is cached until the chain tip changes. """
+        found, result = self.chain_cache.lookup(method, params)
+        if not found:
+            result = yield steps.Call(method, **params)
+            self.chain_cache.store(method, params, result)
+        yield steps.Return(result)
 
     def address_in_use(self, address):
-        for asset, quantity in self.get_balances(address).items():
+        return self._run(self._address_in_use(address))
+
+    def _address_in_use(self, address):
+        balances = yield self._get_balances(address)
+        for asset, quantity in balances.items():
             if quantity != 0:
-                return True
-        if self.api.get_unspent_txouts(address=address, unconfirmed=True):
-            return True
-        return False
+                yield steps.Return(True)
+        utxos = yield self._chain_call("get_unspent_txouts", address=address,
+                                       unconfirmed=True)
+        yield steps.Return(bool(utxos))
 
     def get_balances(self, address, assets=None):
         """Get confirmed balances for given assets."""
+        return self._run(self._get_balances(address, assets=assets))
+
+    def _get_balances(self, address, assets=None):
+        calls = yield steps.Batch(
+            lambda batch: self._queue_balances(batch, address, assets),
+            memo=self.chain_cache
+        )
+        result = yield self._balances_result(address, assets, calls)
+        yield steps.Return(result)
+
+    def _queue_balances(self, batch, address, assets):
+        calls = {
+            "entries": batch.get_balances(filters=[
+                {"field": "address", "op": "==", "value": address},
+            ])
+        }
+        if assets is None or "BTC" in assets:
+            calls["utxos"] = batch.get_unspent_txouts(
+                address=address, unconfirmed=False
+            )
+        if assets is not None:
+            calls["transactions"] = batch.search_raw_transactions(
+                address=address, unconfirmed=True
+            )
+        return calls
+
+    def _balances_result(self, address, assets, calls):
+        sends = {}
+        if assets is not None:
+            sends = yield self._unconfirmed_send_amounts(
+                address, assets, calls["transactions"].result()
+            )
+        yield steps.Return(self._sum_balances(assets, calls, sends))
+
+    def _sum_balances(self, assets, calls, unconfirmed_sends):
 
         # get asset balances
-        entries = self.api.get_balances(filters=[
-            {"field": "address", "op": "==", "value": address},
-        ])
         result = {}
-        for entrie in entries:
+        for entrie in calls["entries"].result():
             if assets and entrie["asset"] not in assets:
                 continue
             result[entrie["asset"]] = entrie["quantity"]
@@ -118,63 +251,95 @@ class Mpc(object):
 
         # get btc balance
         if assets is None or "BTC" in assets:
-            utxos = self.api.get_unspent_txouts(
-                address=address, unconfirmed=False
-            )
+            utxos = calls["utxos"].result()
             balance = sum(map(lambda u: util.to_satoshis(u["amount"]), utxos))
             result["BTC"] = balance
 
         # deduct unconfirmed sends
-        if assets is not None:
-            sends = self.get_unconfirmed_send_amounts(address, assets)
-            for send_asset, send_amount in sends.items():
-                result[send_asset] -= send_amount
+        for send_asset, send_amount in unconfirmed_sends.items():
+            result[send_asset] -= send_amount
 
         return result
 
     def get_unconfirmed_send_amounts(self, address, assets):
+        return self._run(self._get_unconfirmed_send_amounts(address, assets))
+
+    def _get_unconfirmed_send_amounts(self, address, assets):
+        transactions = yield self._chain_call(
+            "search_raw_transactions", address=address, unconfirmed=True
+        )
+        result = yield self._unconfirmed_send_amounts(address, assets,
+                                                      transactions)
+        yield steps.Return(result)
+
+    def _unconfirmed_send_amounts(self, address, assets, transactions):
 
         result = {}
-        transactions = self.api.search_raw_transactions(address=address,
-                                                        unconfirmed=True)
         for transaction in transactions:
             if transaction.get("confirmations", 0) != 0:
                 continue  # ignore confirmed
             for asset in assets:
-                asset_quantity, btc_quantity = self.get_transferred(
+                asset_quantity, btc_quantity = yield self._get_transferred(
                     transaction["hex"], asset=asset, address=address
                 )
                 if asset_quantity < 0:
                     result[asset] = result.get(asset, 0) - asset_quantity
 
-        return result
+        yield steps.Return(result)
 
     def block_send(self, **kwargs):
         """TODO doc string"""
+        return self._run(self._block_send(**kwargs))
+
+    def _block_send(self, **kwargs):
 
         # replace source wif with address
         wif = kwargs.pop("source")
-        kwargs["source"] = keys.address_from_wif(wif)
+        kwargs["source"] = get_key(wif).address
 
         # create, sign and publish transaction
-        unsigned_rawtx = self.api.create_send(**kwargs)
-        signed_rawtx = self.sign(unsigned_rawtx, wif)
-        return self.publish(signed_rawtx)
+        unsigned_rawtx = yield steps.Call("create_send", **kwargs)
+        signed_rawtx = yield self._sign(unsigned_rawtx, wif)
+        txid = yield self._publish(signed_rawtx)
+        yield steps.Return(txid)
 
     def sign(self, unsigned_rawtx, wif):
         """TODO doc string"""
+        return self._run(self._sign(unsigned_rawtx, wif))
 
-        return scripts.sign_deposit(self.get_rawtxs, wif, unsigned_rawtx)
+    def _sign(self, unsigned_rawtx, wif):
+        get_txs_func = yield self._prefetch(unsigned_rawtx)
+        yield steps.Return(
+            scripts.sign_deposit(get_txs_func, wif, unsigned_rawtx)
+        )
 
     def publish(self, rawtx):
-        return self.api.sendrawtransaction(tx_hex=rawtx)
+        return self._run(self._publish(rawtx))
+
+    def _publish(self, rawtx):
+        try:
+            txid = yield steps.Call("sendrawtransaction", tx_hex=rawtx)
+        finally:
+            self._published(rawtx)
+        yield steps.Return(txid)
+
+    def _published(self, rawtx):
+        """ Invalidation hook, runs after every publish attempt. """
+        self.chain_cache.invalidate()
 
     def create_signed_commit(self, wif, state, quantity,
                              revoke_secret_hash, delay_time):
+        return self._run(self._create_signed_commit(
+            wif, state, quantity, revoke_secret_hash, delay_time
+        ))
+
+    def _create_signed_commit(self, wif, state, quantity,
+                              revoke_secret_hash, delay_time):
 
         # create commit
-        result = self.api.mpc_create_commit(
-            state=state, revoke_secret_hash=revoke_secret_hash,
+        result = yield steps.Call(
+            "mpc_create_commit", state=state,
+            revoke_secret_hash=revoke_secret_hash,
             delay_time=delay_time, quantity=quantity
         )
         state = result["state"]
@@ -183,8 +348,9 @@ class Mpc(object):
         deposit_script_hex = result["tosign"]["deposit_script"]
 
         # sign commit
+        get_txs_func = yield self._prefetch(unsigned_rawtx)
         signed_rawtx = scripts.sign_created_commit(
-            self.get_rawtxs, wif, unsigned_rawtx, deposit_script_hex
+            get_txs_func, wif, unsigned_rawtx, deposit_script_hex
         )
 
         # replace unsigned rawtx of state commit with signed rawtx
@@ -192,25 +358,54 @@ class Mpc(object):
             if commit["script"] == commit_script:
                 commit["rawtx"] = signed_rawtx
 
-        return {
+        yield steps.Return({
             "state": state,
             "commit": {"rawtx": signed_rawtx, "script": commit_script}
-        }
+        })
 
     def full_duplex_transfer(self, wif, get_secret_func, send_state,
                              recv_state, quantity,
                              send_next_revoke_secret_hash,
-                             send_commit_delay_time):
+                             send_commit_delay_time, engine=None):
+        return self._run(self._full_duplex_transfer(
+            wif, get_secret_func, send_state, recv_state, quantity,
+            send_next_revoke_secret_hash, send_commit_delay_time,
+            engine=engine
+        ))
+
+    def _full_duplex_transfer(self, wif, get_secret_func, send_state,
+                              recv_state, quantity,
+                              send_next_revoke_secret_hash,
+                              send_commit_delay_time, engine=None):
+        engine = engine or self.engine
         commit = None
         revokes = []
 
+        # get independent transferred amounts in one round trip
+        if engine == "hub":
+            recv_moved_call, send_moved_call = yield steps.Batch(
+                lambda batch: (
+                    batch.mpc_transferred_amount(state=recv_state),
+                    batch.mpc_transferred_amount(state=send_state),
+                )
+            )
+            recv_moved_before = recv_moved_call.result()
+            send_moved_before = send_moved_call.result()
+        else:
+            recv_moved_before = yield self._state_transform(
+                "transferred_amount", engine, state=recv_state
+            )
+            send_moved_before = yield self._state_transform(
+                "transferred_amount", engine, state=send_state
+            )
+
         # revoke what we can to maximize liquidity
-        recv_moved_before = self.api.mpc_transferred_amount(state=recv_state)
         if recv_moved_before > 0:
             revoke_until_quantity = max(recv_moved_before - quantity, 0)
 
             # get hashes of secrets to publish
-            revoke_hashes = self.api.mpc_revoke_hashes_until(
+            revoke_hashes = yield self._state_transform(
+                "revoke_hashes_until", engine,
                 state=recv_state,
                 quantity=revoke_until_quantity,
                 surpass=False  # never revoke past the given quantity!!!
@@ -221,17 +416,20 @@ class Mpc(object):
 
             # revoke commits for secrets that will be published
             if revokes:
-                recv_state = self.api.mpc_revoke_all(
-                    state=recv_state, secrets=revokes
+                recv_state = yield self._state_transform(
+                    "revoke_all", engine, state=recv_state, secrets=revokes
                 )
 
         # create commit to send the rest
-        recv_moved_after = self.api.mpc_transferred_amount(state=recv_state)
+        recv_moved_after = recv_moved_before
+        if revokes:
+            recv_moved_after = yield self._state_transform(
+                "transferred_amount", engine, state=recv_state
+            )
         recv_revoked_quantity = recv_moved_before - recv_moved_after
         send_quantity = quantity - recv_revoked_quantity
-        send_moved_before = self.api.mpc_transferred_amount(state=send_state)
         if send_quantity > 0:
-            result = self.create_signed_commit(
+            result = yield self._create_signed_commit(
                 wif,
                 send_state,
                 send_moved_before + send_quantity,
@@ -241,60 +439,87 @@ class Mpc(object):
             send_state = result["state"]
             commit = result["commit"]
 
-        return {
+        yield steps.Return({
             "send_state": send_state, "recv_state": recv_state,
             "revokes": revokes, "commit": commit
-        }
+        })
 
     def recover_payout(self, get_wif_func, get_secret_func, payout_rawtx,
                        commit_script):
+        return self._run(self._recover_payout(
+            get_wif_func, get_secret_func, payout_rawtx, commit_script
+        ))
+
+    def _recover_payout(self, get_wif_func, get_secret_func, payout_rawtx,
+                        commit_script):
         pubkey = scripts.get_commit_payee_pubkey(commit_script)
         wif = get_wif_func(pubkey=pubkey)
         spend_secret_hash = scripts.get_commit_spend_secret_hash(commit_script)
         spend_secret = get_secret_func(spend_secret_hash)
+        get_txs_func = yield self._prefetch(payout_rawtx)
         signed_rawtx = scripts.sign_payout_recover(
-            self.get_rawtxs, wif, payout_rawtx, commit_script, spend_secret
+            get_txs_func, wif, payout_rawtx, commit_script, spend_secret
         )
-        if self.publish(signed_rawtx):
-            return signed_rawtx
-        return None
+        result = yield self._publish_recovered(signed_rawtx)
+        yield steps.Return(result)
 
     def recover_revoked(self, get_wif_func, revoke_rawtx, commit_script,
                         revoke_secret):
+        return self._run(self._recover_revoked(
+            get_wif_func, revoke_rawtx, commit_script, revoke_secret
+        ))
+
+    def _recover_revoked(self, get_wif_func, revoke_rawtx, commit_script,
+                         revoke_secret):
         pubkey = scripts.get_commit_payer_pubkey(commit_script)
         wif = get_wif_func(pubkey=pubkey)
+        get_txs_func = yield self._prefetch(revoke_rawtx)
         signed_rawtx = scripts.sign_revoke_recover(
-            self.get_rawtxs, wif, revoke_rawtx, commit_script, revoke_secret
+            get_txs_func, wif, revoke_rawtx, commit_script, revoke_secret
         )
-        if self.publish(signed_rawtx):
-            return signed_rawtx
-        return None
+        result = yield self._publish_recovered(signed_rawtx)
+        yield steps.Return(result)
 
     def recover_change(self, get_wif_func, change_rawtx, deposit_script,
                        spend_secret):
+        return self._run(self._recover_change(
+            get_wif_func, change_rawtx, deposit_script, spend_secret
+        ))
+
+    def _recover_change(self, get_wif_func, change_rawtx, deposit_script,
+                        spend_secret):
         pubkey = scripts.get_deposit_payer_pubkey(deposit_script)
         wif = get_wif_func(pubkey=pubkey)
+        get_txs_func = yield self._prefetch(change_rawtx)
         signed_rawtx = scripts.sign_change_recover(
-            self.get_rawtxs, wif, change_rawtx, deposit_script, spend_secret
+            get_txs_func, wif, change_rawtx, deposit_script, spend_secret
         )
-        if self.publish(signed_rawtx):
-            return signed_rawtx
-        return None
+        result = yield self._publish_recovered(signed_rawtx)
+        yield steps.Return(result)
 
     def recover_expired(self, get_wif_func, expire_rawtx, deposit_script):
+        return self._run(self._recover_expired(
+            get_wif_func, expire_rawtx, deposit_script
+        ))
+
+    def _recover_expired(self, get_wif_func, expire_rawtx, deposit_script):
         pubkey = scripts.get_deposit_payer_pubkey(deposit_script)
         wif = get_wif_func(pubkey=pubkey)
+        get_txs_func = yield self._prefetch(expire_rawtx)
         signed_rawtx = scripts.sign_expire_recover(
-            self.get_rawtxs, wif, expire_rawtx, deposit_script
+            get_txs_func, wif, expire_rawtx, deposit_script
         )
-        if self.publish(signed_rawtx):
-            return signed_rawtx
-        return None
+        result = yield self._publish_recovered(signed_rawtx)
+        yield steps.Return(result)
+
+    def _publish_recovered(self, signed_rawtx):
+        published = yield self._publish(signed_rawtx)
+        yield steps.Return(signed_rawtx if published else None)
 
     def _can_publish(self, rawtx, deposit_utxos):
 
         # check utxos not spent
-        tx = util.load_tx(self.get_rawtxs, rawtx)
+        tx = yield self._load_tx(rawtx)
         for tx_in in tx.txs_in:
             if tx_in.is_coinbase():
                 continue
@@ -307,32 +532,48 @@ class Mpc(object):
                     found = True
                     break
             if not found:
-                return False
+                yield steps.Return(False)
 
-        return tx.bad_signature_count() == 0
+        yield steps.Return(tx.bad_signature_count() == 0)
 
-    def finalize_commit(self, get_wif_func, state):
-        commit = self.api.mpc_highest_commit(state=state)
+    def finalize_commit(self, get_wif_func, state, engine=None):
+        return self._run(self._finalize_commit(get_wif_func, state,
+                                               engine=engine))
+
+    def _finalize_commit(self, get_wif_func, state, engine=None):
+        commit = yield self._state_transform("highest_commit", engine,
+                                             state=state)
         if commit is None:
-            return None
+            yield steps.Return(None)
         deposit_script = state["deposit_script"]
         pubkey = scripts.get_deposit_payee_pubkey(deposit_script)
         wif = get_wif_func(pubkey=pubkey)
+        get_txs_func = yield self._prefetch(commit["rawtx"])
         rawtx = scripts.sign_finalize_commit(
-            self.get_rawtxs, wif, commit["rawtx"], deposit_script
+            get_txs_func, wif, commit["rawtx"], deposit_script
         )
 
-        netcode = keys.netcode_from_wif(wif)
+        netcode = get_key(wif).netcode
         deposit_address = util.script_address(deposit_script, netcode)
-        deposit_utxos = self.api.get_unspent_txouts(address=deposit_address,
-                                                    unconfirmed=False)
+        deposit_utxos = yield self._chain_call("get_unspent_txouts",
+                                               address=deposit_address,
+                                               unconfirmed=False)
 
-        if self._can_publish(rawtx, deposit_utxos) and self.publish(rawtx):
-            return rawtx
-        return None
+        can_publish = yield self._can_publish(rawtx, deposit_utxos)
+        if can_publish:
+            published = yield self._publish(rawtx)
+            if published:
+                yield steps.Return(rawtx)
+        yield steps.Return(None)
 
     def full_duplex_recover_funds(self, get_wif_func, get_secret_func,
                                   recv_state, send_state):
+        return self._run(self._full_duplex_recover_funds(
+            get_wif_func, get_secret_func, recv_state, send_state
+        ))
+
+    def _full_duplex_recover_funds(self, get_wif_func, get_secret_func,
+                                   recv_state, send_state):
 
         # get send spend secret if known
         send_spend_secret_hash = scripts.get_deposit_spend_secret_hash(
@@ -349,71 +590,149 @@ class Mpc(object):
             "deposit": {},  # {"txid": "rawtx"}
         }
 
-        # get payouts
-        for payout_tx in self.api.mpc_payouts(state=recv_state):
-            rawtx = self.recover_payout(
+        # get payouts and recoverables in one round trip
+        payouts, recoverables = yield steps.Batch(lambda batch: (
+            batch.mpc_payouts(state=recv_state),
+            batch.mpc_recoverables(
+                state=send_state, spend_secret=send_spend_secret
+            ),
+        ))
+
+        for payout_tx in payouts.result():
+            rawtx = yield self._recover_payout(
                 get_wif_func=get_wif_func,
                 get_secret_func=get_secret_func,
                 **payout_tx
             )
             rawtxs["payout"][util.gettxid(rawtx)] = rawtx
 
-        rtxs = self.api.mpc_recoverables(state=send_state,
-                                         spend_secret=send_spend_secret)
+        rtxs = recoverables.result()
         for revoke_tx in rtxs["revoke"]:
-            rawtx = self.recover_revoked(
+            rawtx = yield self._recover_revoked(
                 get_wif_func=get_wif_func, **revoke_tx
             )
             rawtxs["revoke"][util.gettxid(rawtx)] = rawtx
 
         for change_tx in rtxs["change"]:
-            rawtx = self.recover_change(
+            rawtx = yield self._recover_change(
                 get_wif_func=get_wif_func, **change_tx
             )
             rawtxs["change"][util.gettxid(rawtx)] = rawtx
 
         for expire_tx in rtxs["expire"]:
-            rawtx = self.recover_expired(
+            rawtx = yield self._recover_expired(
                 get_wif_func=get_wif_func, **expire_tx
             )
             rawtxs["expire"][util.gettxid(rawtx)] = rawtx
 
-        return rawtxs
+        yield steps.Return(rawtxs)
 
     def full_duplex_channel_status(self, handle, netcode, send_state,
-                                   recv_state, get_secret_func, clearance=6):
+                                   recv_state, get_secret_func, clearance=6,
+                                   engine=None):
+        return self._run(self._full_duplex_channel_status(
+            handle, netcode, send_state, recv_state, get_secret_func,
+            clearance=clearance, engine=engine
+        ))
+
+    def _full_duplex_channel_status(self, handle, netcode, send_state,
+                                    recv_state, get_secret_func, clearance=6,
+                                    engine=None):
         assert(send_state["asset"] == recv_state["asset"])
         asset = send_state["asset"]
 
-        send_ttl = self.api.mpc_deposit_ttl(state=send_state,
-                                            clearance=clearance)
-        send_script = send_state["deposit_script"]
-        send_deposit_expire_time = scripts.get_deposit_expire_time(send_script)
-        send_deposit_address = util.script_address(
-            send_script, netcode=netcode
+        # query hub for everything in a single round trip
+        calls = yield steps.Batch(
+            lambda batch: self._queue_channel_status(
+                batch, netcode, send_state, recv_state, clearance,
+                engine=engine
+            ),
+            memo=self.chain_cache
+        )
+
+        send_balances = yield self._balances_result(
+            calls["send_deposit_address"], ["BTC", asset],
+            calls["send_balances"]
+        )
+        recv_balances = yield self._balances_result(
+            calls["recv_deposit_address"], ["BTC", asset],
+            calls["recv_balances"]
         )
-        send_balances = self.get_balances(send_deposit_address, ["BTC", asset])
+        send_secret_hash = scripts.get_deposit_spend_secret_hash(
+            send_state["deposit_script"]
+        )
+        send_secret = get_secret_func(send_secret_hash)
+        yield steps.Return(self._channel_status_result(
+            netcode, asset, calls, send_balances, recv_balances, send_secret
+        ))
+
+    def _queue_channel_status(self, batch, netcode, send_state, recv_state,
+                              clearance, engine=None):
+        engine = engine or self.engine
+        asset = send_state["asset"]
+        calls = {}
+        for prefix, state in [("send", send_state), ("recv", recv_state)]:
+            script = state["deposit_script"]
+            address = util.script_address(script, netcode=netcode)
+            calls[prefix + "_deposit_address"] = address
+            calls[prefix + "_deposit_expire_time"] = (
+                scripts.get_deposit_expire_time(script)
+            )
+            calls[prefix + "_ttl"] = batch.mpc_deposit_ttl(
+                state=state, clearance=clearance
+            )
+            calls[prefix + "_balances"] = self._queue_balances(
+                batch, address, ["BTC", asset]
+            )
+            calls[prefix + "_transferred"] = None
+            if len(state["commits_active"]) > 0:
+                calls[prefix + "_transferred"] = self._queue_transferred(
+                    batch, state, engine
+                )
+        calls["send_commits_published"] = batch.mpc_published_commits(
+            state=send_state
+        )
+        return calls
+
+    def _queue_transferred(self, batch, state, engine):
+        """ Queue hub call unless the local engine can compute it. """
+        if engine == "hub":
+            return batch.mpc_transferred_amount(state=state)
+        try:
+            local_result = self.local_engine.transferred_amount(state)
+        except UndecodableCommit:
+            return batch.mpc_transferred_amount(state=state)
+        if engine == "local":
+            return self._resolved_call("mpc_transferred_amount", local_result)
+        call = batch.mpc_transferred_amount(state=state)
+        call.local_result = local_result  # checked once batch resolved
+        return call
+
+    def _verify_transferred(self, call):
+        local_result = getattr(call, "local_result", None)
+        if local_result is not None and local_result != call.result():
+            raise EngineMismatch("transferred_amount", local_result,
+                                 call.result())
+        return call.result()
+
+    def _channel_status_result(self, netcode, asset, calls, send_balances,
+                               recv_balances, send_secret):
+        send_ttl = calls["send_ttl"].result()
         send_deposit = send_balances.get(asset, 0)
         send_transferred = 0
-        if len(send_state["commits_active"]) > 0:
-            send_transferred = self.api.mpc_transferred_amount(
-                state=send_state
+        if calls["send_transferred"] is not None:
+            send_transferred = self._verify_transferred(
+                calls["send_transferred"]
             )
 
-        recv_ttl = self.api.mpc_deposit_ttl(state=recv_state,
-                                            clearance=clearance)
-        recv_script = recv_state["deposit_script"]
-        recv_deposit_expire_time = scripts.get_deposit_expire_time(recv_script)
-        recv_deposit_address = util.script_address(
-            recv_script, netcode=netcode
-        )
-        recv_balances = self.get_balances(recv_deposit_address, ["BTC", asset])
+        recv_ttl = calls["recv_ttl"].result()
         recv_deposit = recv_balances.get(asset, 0)
         recv_transferred = 0
-        if len(recv_state["commits_active"]) > 0:
-            recv_transferred = self.api.mpc_transferred_amount(
-                state=recv_state
+        if calls["recv_transferred"] is not None:
+            recv_transferred = self._verify_transferred(
+                calls["recv_transferred"]
             )
+        send_commits_published = calls["send_commits_published"].result()
 
         send_balance = send_deposit + recv_transferred - send_transferred
         recv_balance = recv_deposit + send_transferred - recv_transferred
@@ -426,11 +745,6 @@ class Mpc(object):
         status = "opening"
         if send_ttl and recv_ttl:
             status = "open"
-        send_secret_hash = scripts.get_deposit_spend_secret_hash(send_script)
-        send_secret = get_secret_func(send_secret_hash)
-        send_commits_published = self.api.mpc_published_commits(
-            state=send_state
-        )
         expired = ttl == 0  # None explicitly ignore as channel opening
         if expired or send_secret or send_commits_published:
             status = "closed"
@@ -445,16 +759,16 @@ class Mpc(object):
             "balance": send_balance,
             "ttl": ttl,
             "send_balance": send_balance,
-            "send_deposit_address": send_deposit_address,
+            "send_deposit_address": calls["send_deposit_address"],
             "send_deposit_ttl": send_ttl,
             "send_deposit_balances": send_balances,
-            "send_deposit_expire_time": send_deposit_expire_time,
+            "send_deposit_expire_time": calls["send_deposit_expire_time"],
             "send_commits_published": send_commits_published,
             "send_transferred_quantity": send_transferred,
             "recv_balance": recv_balance,
-            "recv_deposit_address": recv_deposit_address,
+            "recv_deposit_address": calls["recv_deposit_address"],
             "recv_deposit_ttl": recv_ttl,
             "recv_deposit_balances": recv_balances,
-            "recv_deposit_expire_time": recv_deposit_expire_time,
+            "recv_deposit_expire_time": calls["recv_deposit_expire_time"],
             "recv_transferred_quantity": recv_transferred,
         }
@@ -6,21 +6,71 @@
 import os
 import time
 import copy
+import hmac
+import struct
+import hashlib
 from micropayment_core import util
-from micropayment_core import keys
 from micropayment_core import scripts
+from picopayments_cli import steps
 from .mpc import Mpc, history_add_entry
 
 
+def derive_secret(seed, index):
+    """ Returns secret number index of the per connection secret seed. """
+    message = struct.pack(">I", index)
+    return hmac.new(util.h2b(seed), message, hashlib.sha256).hexdigest()
+
+
+SEND_FIELDS = ["payee_handle", "amount", "token"]
+
+
+def new_payment(source, asset, destination, quantity, token=None):
+    """ Returns payment to be queued and adds it to the history. """
+    payment = make_payment(destination, quantity, token=token)
+    add_payment_history(source, asset, payment)
+    return payment
+
+
+def make_payment(destination, quantity, token=None):
+    """ Returns payment to be queued, a random token is used if None. """
+    if token is None:
+        token = util.b2h(os.urandom(32))
+    return {
+        "payee_handle": destination,
+        "amount": quantity,
+        "token": token,
+        "queued_at": time.time()
+    }
+
+
+def add_payment_history(source, asset, payment):
+    """ Adds history entry of payment queued for connection source. """
+    history_add_entry(
+        handle=source,
+        action="queue_micropayment",
+        id=payment["token"],
+        fee="{quantity}{asset}".format(quantity=0, asset=asset),
+        quantity='{quantity}{asset}'.format(quantity=payment["amount"],
+                                            asset=asset),
+        destination=payment["payee_handle"]
+    )
+
+
 class Mph(Mpc):
 
+    # revoked commits kept in the channel state sent to the hub, older ones
+    # are moved to the archive if one is given
+    HOT_REVOKED_COMMITS = 16
+
     _SERIALIZABLE_ATTRS = [
         "asset",  # set once
         "handle",  # set once
         "channel_terms",  # set once
         "client_pubkey",  # set once
         "hub_pubkey",  # set once
-        "secrets",  # TODO save elsewhere?
+        "secrets",  # legacy random secrets and hub provided secrets
+        "secret_seed",  # set once
+        "secret_index",  # mutable, number of derived secrets
         "c2h_state",  # mutable
         "c2h_spend_secret_hash",  # set once
         "c2h_commit_delay_time",  # set once
@@ -34,16 +84,28 @@ class Mph(Mpc):
     ]
 
     def __init__(self, *args, **kwargs):
+        self._changed = set()
+        self._secret_indexes = {}  # secret hash -> index, rebuilt lazily
         super(Mph, self).__init__(*args, **kwargs)
         for attr in self._SERIALIZABLE_ATTRS:
             setattr(self, attr, None)
 
+    def __setattr__(self, name, value):
+        if name in self._SERIALIZABLE_ATTRS:
+            self._changed.add(name)
+        super(Mph, self).__setattr__(name, value)
+
     @classmethod
-    def deserialize(cls, api, data):
-        """TODO doc string"""
-        obj = cls(api)
+    def deserialize(cls, api, data, **kwargs):
+        """ Create from connection data without copying it.
+
+        The data is only read, attributes are copied before they are
+        modified in place (see _writable).
+        """
+        obj = cls(api, **kwargs)
         for attr in obj._SERIALIZABLE_ATTRS:
-            setattr(obj, attr, data[attr])
+            setattr(obj, attr, data.get(attr))  # missing in old connections
+        obj._changed = set()
         return obj
 
     def serialize(self):
@@ -53,31 +115,47 @@ class Mph(Mpc):
             data[attr] = getattr(self, attr)
         return data
 
+    def changed(self):
+        """ Returns set of attributes changed since deserialized. """
+        return set(self._changed)
+
+    def _writable(self, attr):
+        # copy on first write so deserialized data is never modified
+        if attr not in self._changed:
+            value = getattr(self, attr)
+            setattr(self, attr, copy.copy(value))
+        return getattr(self, attr)
+
     def _history_add_published_c2h_deposit(self, rawtx):
-        self._history_add_rawtx(rawtx, "publish_c2h_deposit_tx")
+        yield self._history_add_rawtx(rawtx, "publish_c2h_deposit_tx")
 
     def _history_add_published_h2c_commit(self, rawtx):
-        self._history_add_rawtx(rawtx, "publish_h2c_commit_tx",
-                                wallet_tx=False)
+        yield self._history_add_rawtx(rawtx, "publish_h2c_commit_tx",
+                                      wallet_tx=False)
 
     def _history_add_update_rawtxs(self, rawtxs):
         for txid, rawtx in rawtxs["payout"].items():
-            self._history_add_rawtx(rawtx, "publish_h2c_payout_tx")
+            yield self._history_add_rawtx(rawtx, "publish_h2c_payout_tx")
         for txid, rawtx in rawtxs["revoke"].items():
-            self._history_add_rawtx(rawtx, "publish_c2h_revoke_tx")
+            yield self._history_add_rawtx(rawtx, "publish_c2h_revoke_tx")
         for txid, rawtx in rawtxs["change"].items():
-            self._history_add_rawtx(rawtx, "publish_c2h_change_tx")
+            yield self._history_add_rawtx(rawtx, "publish_c2h_change_tx")
         for txid, rawtx in rawtxs["expire"].items():
-            self._history_add_rawtx(rawtx, "publish_c2h_expire_tx")
+            yield self._history_add_rawtx(rawtx, "publish_c2h_expire_tx")
         # ignore commit as they are already added in close method
 
     def _history_add_rawtx(self, rawtx, action, wallet_tx=True):
         address = None
         if wallet_tx:  # TODO deduce from input/output addresses
-            address = keys.address_from_wif(self.api.auth_wif)
-        asset_quantity, btc_quantity = self.get_transferred(
+            address = self.keyring.default.address
+        asset_quantity, btc_quantity = yield self._get_transferred(
             rawtx, asset=self.asset, address=address
         )
+        self._history_add_transferred(rawtx, action, asset_quantity,
+                                      btc_quantity)
+
+    def _history_add_transferred(self, rawtx, action, asset_quantity,
+                                 btc_quantity):
         history_add_entry(
             handle=self.handle,
             action=action,
@@ -93,41 +171,41 @@ class Mph(Mpc):
     def connect(self, quantity, expire_time=1024, asset="XCP",
                 delay_time=2, own_url=None):
         """TODO doc string"""
+        return self._run(self._connect(
+            quantity, expire_time=expire_time, asset=asset,
+            delay_time=delay_time, own_url=own_url
+        ))
+
+    def _connect(self, quantity, expire_time=1024, asset="XCP",
+                 delay_time=2, own_url=None):
 
         self.asset = asset
         self.own_url = own_url
         self.closed = False
-        self.client_pubkey = keys.pubkey_from_wif(self.api.auth_wif)
+        self.client_pubkey = self.keyring.default.pubkey
         self.c2h_deposit_expire_time = expire_time
         self.c2h_deposit_quantity = quantity
         next_revoke_hash = self._create_initial_secrets()
-        self._request_connection()
+        yield self._request_connection()
         self._validate_matches_terms()
-        unsigned_c2h_deposit_rawtx = self._make_deposit()
-        h2c_deposit_script = self._exchange_deposit_scripts(next_revoke_hash)
-        signed_c2h_deposit_rawtx = self.sign(unsigned_c2h_deposit_rawtx,
-                                             self.api.auth_wif)
-        c2h_deposit_txid = self.publish(signed_c2h_deposit_rawtx)
-        self._history_add_published_c2h_deposit(signed_c2h_deposit_rawtx)
+        unsigned_c2h_deposit_rawtx = yield self._make_deposit()
+        h2c_deposit_script = yield self._exchange_deposit_scripts(
+            next_revoke_hash
+        )
+        signed_c2h_deposit_rawtx = yield self._sign(
+            unsigned_c2h_deposit_rawtx, self.keyring.default.wif
+        )
+        c2h_deposit_txid = yield self._publish(signed_c2h_deposit_rawtx)
+        yield self._history_add_published_c2h_deposit(
+            signed_c2h_deposit_rawtx
+        )
         self._set_initial_h2c_state(h2c_deposit_script)
         self._add_to_commits_requested(next_revoke_hash)
         self.payments_sent = []
         self.payments_received = []
         self.payments_queued = []
         self.c2h_commit_delay_time = delay_time
-        return c2h_deposit_txid
-
-    def _history_add_micro_send(self, destination, quantity, token):
-        history_add_entry(
-            handle=self.handle,
-            action="queue_micropayment",
-            id=token,
-            fee="{quantity}{asset}".format(quantity=0, asset=self.asset),
-            quantity='{quantity}{asset}'.format(
-                quantity=quantity, asset=self.asset
-            ),
-            destination=destination
-        )
+        yield steps.Return(c2h_deposit_txid)
 
     def _history_add_hub_sync(self, id, fee, quantity):
         history_add_entry(
@@ -143,41 +221,84 @@ class Mph(Mpc):
     def micro_send(self, handle, quantity, token=None):
         """TODO doc string"""
 
-        if token is None:
-            token = util.b2h(os.urandom(32))
-        self.payments_queued.append({
-            "payee_handle": handle,
-            "amount": quantity,
-            "token": token
-        })
-        self._history_add_micro_send(handle, quantity, token)
-        return token
-
-    def get_status(self, clearance=6):
-        netcode = keys.netcode_from_wif(self.api.auth_wif)
-        return self.full_duplex_channel_status(
+        payment = new_payment(self.handle, self.asset, handle, quantity,
+                              token=token)
+        self._writable("payments_queued").append(payment)
+        return payment["token"]
+
+    def get_status(self, clearance=6, engine=None):
+        return self._run(self._get_status(clearance=clearance,
+                                          engine=engine))
+
+    def _get_status(self, clearance=6, engine=None):
+        netcode = self.keyring.default.netcode
+        status = yield self._full_duplex_channel_status(
             self.handle, netcode, self.c2h_state,
-            self.h2c_state, self.secrets.get, clearance=clearance
+            self.h2c_state, self.get_secret, clearance=clearance,
+            engine=engine
+        )
+        if self._check_archived(status):
+            status = yield self._full_duplex_channel_status(
+                self.handle, netcode, self._full_state("c2h"),
+                self._full_state("h2c"), self.get_secret,
+                clearance=clearance, engine=engine
+            )
+        yield steps.Return(status)
+
+    def _check_archived(self, status):
+        # deposit spent while open, maybe by an archived revoked commit
+        deposit = status["send_deposit_balances"].get(self.asset, 0)
+        return (
+            self.archive is not None and status["status"] == "open" and
+            deposit < self.c2h_deposit_quantity
         )
 
-    def sync(self):
+    def _full_state(self, channel):
+        """ Returns channel state including archived revoked commits. """
+        state = getattr(self, channel + "_state")
+        if self.archive is None:
+            return state
+        archived = self.archive.load_archived(self.handle, channel)
+        if not archived:
+            return state
+        scripts = set([c["script"] for c in archived])
+        hot = [c for c in state["commits_revoked"]
+               if c["script"] not in scripts]
+        return dict(state, commits_revoked=archived + hot)
+
+    def _archive_revoked(self):
+        # archive first, a crash before saving only leaves duplicates
+        if self.archive is None:
+            return
+        for channel in ["c2h", "h2c"]:
+            state = getattr(self, channel + "_state")
+            revoked = state["commits_revoked"]
+            if len(revoked) <= self.HOT_REVOKED_COMMITS:
+                continue
+            split = len(revoked) - self.HOT_REVOKED_COMMITS
+            self.archive.archive_commits(self.handle, channel, revoked[:split])
+            setattr(self, channel + "_state",
+                    dict(state, commits_revoked=revoked[split:]))
+
+    def sync(self, engine=None):
         """TODO doc string"""
+        return self._run(self._sync(engine=engine))
+
+    def _sync(self, engine=None):
 
         # always pop payments, they are processed successful or not
-        payments = self.payments_queued
-        self.payments_queued = []
+        payments, quantity, sync_fee = self._pop_payments()
 
         # transfer payment funds (create commit/revokes)
-        sync_fee = self.channel_terms["sync_fee"]
-        quantity = sum([p["amount"] for p in payments]) + sync_fee
-        t_result = self.full_duplex_transfer(
-            self.api.auth_wif,
-            self.secrets.get,
-            copy.deepcopy(self.c2h_state),
-            copy.deepcopy(self.h2c_state),
+        t_result = yield self._full_duplex_transfer(
+            self.keyring.default.wif,
+            self.get_secret,
+            self.c2h_state,
+            self.h2c_state,
             quantity,
             self.c2h_next_revoke_secret_hash,
-            self.c2h_commit_delay_time
+            self.c2h_commit_delay_time,
+            engine=engine
         )
         commit = t_result["commit"]
         revokes = t_result["revokes"]
@@ -186,10 +307,10 @@ class Mph(Mpc):
         h2c_next_revoke_secret_hash = self._gen_secret()
 
         # sync with hub
-        s_result = self.api.mph_sync(
-            next_revoke_secret_hash=h2c_next_revoke_secret_hash,
+        s_result = yield steps.Call(
+            "mph_sync", next_revoke_secret_hash=h2c_next_revoke_secret_hash,
             handle=self.handle,
-            sends=payments,
+            sends=self._sends(payments),
             commit=commit,
             revokes=revokes
         )
@@ -203,151 +324,231 @@ class Mph(Mpc):
         self._update_payments(payments, receive_payments)
 
         # update h2c channel
-        self.h2c_state = t_result["recv_state"]
+        self._set_state("h2c", t_result["recv_state"])
         self._add_to_commits_requested(h2c_next_revoke_secret_hash)
         if h2c_commit:
-            self.h2c_state = self.api.mpc_add_commit(
+            self.h2c_state = yield self._state_transform(
+                "add_commit", engine,
                 state=self.h2c_state,
                 commit_rawtx=h2c_commit["rawtx"],
                 commit_script=h2c_commit["script"]
             )
 
         # update c2h channel
-        self.c2h_state = t_result["send_state"]
+        self._set_state("c2h", t_result["send_state"])
         if c2h_revokes:
-            self.c2h_state = self.api.mpc_revoke_all(
+            self.c2h_state = yield self._state_transform(
+                "revoke_all", engine,
                 state=self.c2h_state, secrets=c2h_revokes
             )
 
-        return receive_payments
+        self._archive_revoked()
+        yield steps.Return(receive_payments)
+
+    def _pop_payments(self):
+        payments = self.payments_queued
+        self.payments_queued = []
+        sync_fee = self.channel_terms["sync_fee"]
+        quantity = sum([p["amount"] for p in payments]) + sync_fee
+        return payments, quantity, sync_fee
+
+    def _sends(self, payments):
+        # only the fields the hub expects, queued payments have more
+        return [dict([(key, p[key]) for key in SEND_FIELDS])
+                for p in payments]
+
+    def _set_state(self, channel, state):
+        # transforms return new states, an unchanged one is still the
+        # deserialized data and must be copied on write (see _writable)
+        if state is not getattr(self, channel + "_state"):
+            setattr(self, channel + "_state", state)
 
     def _update_payments(self, payments_sent, payments_received):
         for payment in payments_sent:
-            self.payments_sent.append({
+            self._writable("payments_sent").append({
                 "handle": payment["payee_handle"],
                 "amount": payment["amount"],
                 "token": payment["token"],
                 "timestamp": time.time(),
             })
         for payment in payments_received:
-            self.payments_received.append({
+            self._writable("payments_received").append({
                 "handle": payment["payer_handle"],
                 "amount": payment["amount"],
                 "token": payment["token"],
                 "timestamp": time.time(),
             })
 
-    def close(self):
+    def close(self, engine=None):
+        return self._run(self._close(engine=engine))
+
+    def _close(self, engine=None):
 
         # publish h2c commit if possible
-        commit_rawtx = self.finalize_commit(self._get_wif, self.h2c_state)
+        commit_rawtx = yield self._finalize_commit(
+            self._get_wif, self.h2c_state, engine=engine
+        )
         if commit_rawtx is not None:
-            self._history_add_published_h2c_commit(commit_rawtx)
+            yield self._history_add_published_h2c_commit(commit_rawtx)
+
+        # tell hub to close the channel
+        result = yield steps.Call(
+            "mph_close", handle=self.handle,
+            spend_secret=self._h2c_close_spend_secret()
+        )
+        self._remember_c2h_spend_secret(result["spend_secret"])
+        yield steps.Return(commit_rawtx)
 
+    def _h2c_close_spend_secret(self):
         # get h2c spend secret if no commits for channel
-        h2c_spend_secret = None
         if len(self.h2c_state["commits_active"]) == 0:
             deposit_script = self.h2c_state["deposit_script"]
             spend_hash = scripts.get_deposit_spend_secret_hash(deposit_script)
-            h2c_spend_secret = self.secrets[spend_hash]
-
-        # tell hub to close the channel
-        result = self.api.mph_close(handle=self.handle,
-                                    spend_secret=h2c_spend_secret)
+            return self.get_secret(spend_hash)
+        return None
 
+    def _remember_c2h_spend_secret(self, c2h_spend_secret):
         # remember c2h spend secret if given
-        c2h_spend_secret = result["spend_secret"]
         if c2h_spend_secret:
             secret_hash = util.hash160hex(c2h_spend_secret)
-            self.secrets[secret_hash] = c2h_spend_secret
-
-        return commit_rawtx
+            self._writable("secrets")[secret_hash] = c2h_spend_secret
 
     def is_closed(self, clearance=6):
-        c2h = self.c2h_state
-        h2c = self.h2c_state
-        return (
-            self.api.mpc_deposit_ttl(state=c2h, clearance=clearance) == 0 or
-            self.api.mpc_deposit_ttl(state=h2c, clearance=clearance) == 0 or
-            self.api.mpc_published_commits(state=c2h) or
-            self.api.mpc_published_commits(state=h2c)
+        return self._run(self._is_closed(clearance=clearance))
+
+    def _is_closed(self, clearance=6):
+        c2h = self._full_state("c2h")
+        h2c = self._full_state("h2c")
+        calls = yield steps.Batch(lambda batch: [
+            batch.mpc_deposit_ttl(state=c2h, clearance=clearance),
+            batch.mpc_deposit_ttl(state=h2c, clearance=clearance),
+            batch.mpc_published_commits(state=c2h),
+            batch.mpc_published_commits(state=h2c),
+        ])
+        c2h_ttl, h2c_ttl, c2h_published, h2c_published = [
+            call.result() for call in calls
+        ]
+        yield steps.Return(
+            c2h_ttl == 0 or h2c_ttl == 0 or
+            bool(c2h_published) or bool(h2c_published)
         )
 
-    def update(self, clearance=6):
+    def update(self, clearance=6, engine=None):
+        return self._run(self._update(clearance=clearance, engine=engine))
+
+    def _update(self, clearance=6, engine=None):
 
         # close channel if needed
         commit_rawtx = None
-        h2c_closed = self.api.mpc_published_commits(state=self.h2c_state)
-        if self.is_closed(clearance=clearance) and not h2c_closed:
-            commit_rawtx = self.close()
+        h2c_closed = yield steps.Call("mpc_published_commits",
+                                      state=self._full_state("h2c"))
+        closed = yield self._is_closed(clearance=clearance)
+        if closed and not h2c_closed:
+            commit_rawtx = yield self._close(engine=engine)
 
         # recover funds if possible
-        rawtxs = self.full_duplex_recover_funds(
-            self._get_wif, self.secrets.get, self.h2c_state, self.c2h_state
+        rawtxs = yield self._full_duplex_recover_funds(
+            self._get_wif, self.get_secret, self._full_state("h2c"),
+            self._full_state("c2h")
         )
 
         if commit_rawtx is not None:
             rawtxs["commit"][util.gettxid(commit_rawtx)] = commit_rawtx
 
-        self._history_add_update_rawtxs(rawtxs)
-        return rawtxs
+        yield self._history_add_update_rawtxs(rawtxs)
+        yield steps.Return(rawtxs)
 
     def can_cull(self):
-        netcode = keys.netcode_from_wif(self.api.auth_wif)
-        scripts = [self.c2h_state["deposit_script"]]
-        scripts += [c["script"] for c in self.c2h_state["commits_active"]]
-        scripts += [c["script"] for c in self.c2h_state["commits_revoked"]]
-        scripts += [c["script"] for c in self.h2c_state["commits_active"]]
-        scripts += [c["script"] for c in self.h2c_state["commits_revoked"]]
-        for script in scripts:
+        return self._run(self._can_cull())
+
+    def _can_cull(self):
+        netcode = self.keyring.default.netcode
+        for script in self._cull_scripts():
             address = util.script_address(script, netcode)
-            if self.address_in_use(address):
-                return False
-        return True
+            in_use = yield self._address_in_use(address)
+            if in_use:
+                yield steps.Return(False)
+        yield steps.Return(True)
+
+    def _cull_scripts(self):
+        c2h_state = self._full_state("c2h")
+        h2c_state = self._full_state("h2c")
+        scripts = [c2h_state["deposit_script"]]
+        scripts += [c["script"] for c in c2h_state["commits_active"]]
+        scripts += [c["script"] for c in c2h_state["commits_revoked"]]
+        scripts += [c["script"] for c in h2c_state["commits_active"]]
+        scripts += [c["script"] for c in h2c_state["commits_revoked"]]
+        return scripts
 
     def _get_wif(self, pubkey):
-        apk = keys.pubkey_from_wif(self.api.auth_wif)
-        assert apk == pubkey, "Auth pubkey {0} != {1}!".format(apk, pubkey)
-        return self.api.auth_wif
+        return self.keyring.get_wif(pubkey)
 
     def _add_to_commits_requested(self, secret_hash):
         # emulates mpc_request_commit api call
-        self.h2c_state["commits_requested"].append(secret_hash)
+        h2c_state = self._writable("h2c_state")
+        h2c_state["commits_requested"] = (
+            h2c_state["commits_requested"] + [secret_hash]
+        )
+
+    def get_secret(self, secret_hash):
+        """ Returns secret for the given hash or None if unknown. """
+        secret = self.secrets.get(secret_hash)
+        if secret is not None:
+            return secret
+        index = self._secret_indexes.get(secret_hash)
+        count = self.secret_index or 0
+        if index is None and len(self._secret_indexes) < count:
+            for i in range(len(self._secret_indexes), count):
+                secret = derive_secret(self.secret_seed, i)
+                self._secret_indexes[util.hash160hex(secret)] = i
+            index = self._secret_indexes.get(secret_hash)
+        if index is None:
+            return None
+        return derive_secret(self.secret_seed, index)
 
     def _gen_secret(self):
-        secret_value = util.b2h(os.urandom(32))
-        secret_hash = util.hash160hex(secret_value)
-        self.secrets[secret_hash] = secret_value
+        if self.secret_seed is None:  # connection created before seeds
+            self.secret_seed = util.b2h(os.urandom(32))
+            self.secret_index = 0
+        index = self.secret_index
+        secret_hash = util.hash160hex(derive_secret(self.secret_seed, index))
+        if len(self._secret_indexes) == index:
+            self._secret_indexes[secret_hash] = index
+        self.secret_index = index + 1
         return secret_hash
 
     def _create_initial_secrets(self):
         self.secrets = {}
+        self.secret_seed = None
         self.h2c_spend_secret_hash = self._gen_secret()
         return self._gen_secret()
 
     def _request_connection(self):
-        result = self.api.mph_request(
-            asset=self.asset, url=self.own_url,
+        result = yield steps.Call(
+            "mph_request", asset=self.asset, url=self.own_url,
             spend_secret_hash=self.h2c_spend_secret_hash
         )
+        self._set_connection_terms(result)
+
+    def _set_connection_terms(self, result):
         self.handle = result["handle"]
         self.channel_terms = result["channel_terms"]
         self.hub_pubkey = result["pubkey"]
         self.c2h_spend_secret_hash = result["spend_secret_hash"]
 
     def _exchange_deposit_scripts(self, h2c_next_revoke_secret_hash):
-        result = self.api.mph_deposit(
-            handle=self.handle, asset=self.asset,
+        result = yield steps.Call(
+            "mph_deposit", handle=self.handle, asset=self.asset,
             deposit_script=self.c2h_state["deposit_script"],
             next_revoke_secret_hash=h2c_next_revoke_secret_hash
         )
         h2c_deposit_script = result["deposit_script"]
         self.c2h_next_revoke_secret_hash = result["next_revoke_secret_hash"]
-        return h2c_deposit_script
+        yield steps.Return(h2c_deposit_script)
 
     def _make_deposit(self):
-        result = self.api.mpc_make_deposit(
-            asset=self.asset,
+        result = yield steps.Call(
+            "mpc_make_deposit", asset=self.asset,
             payer_pubkey=self.client_pubkey,
             payee_pubkey=self.hub_pubkey,
             spend_secret_hash=self.c2h_spend_secret_hash,
@@ -355,7 +556,7 @@ class Mph(Mpc):
             quantity=self.c2h_deposit_quantity
         )
         self.c2h_state = result["state"]
-        return result["topublish"]
+        yield steps.Return(result["topublish"])
 
     def _validate_matches_terms(self):
         expire_max = self.channel_terms["expire_max"]
@@ -0,0 +1,58 @@
+# coding: utf-8
+# Copyright (c) 2016 Fabian Barkhau <f483@storj.io>
+# License: MIT (see LICENSE file)
+
+
+import time
+
+
+FEE = "fee"
+LATENCY = "latency"
+TTL = "ttl"
+
+
+class SyncPolicy(object):
+    """ Decides per connection when syncing queued payments is worth the fee.
+
+    Every sync costs the sync fee of the channel terms no matter how many
+    payments are sent, so payments are held back until one of:
+
+    * fee: The sync fee is at most max_fee_ratio of the queued amount.
+    * latency: The oldest queued payment waited max_latency seconds.
+    * ttl: The deposit expires within min_ttl blocks.
+
+    Args:
+        max_fee_ratio (float): Fee to queued amount ratio worth a sync.
+        max_latency (float): Seconds a queued payment may wait at most.
+        min_ttl (int): Blocks before expiry when payments are always sent.
+    """
+
+    def __init__(self, max_fee_ratio=0.01, max_latency=600.0, min_ttl=24):
+        self.max_fee_ratio = max_fee_ratio
+        self.max_latency = max_latency
+        self.min_ttl = min_ttl
+
+    def decide(self, payments_queued, sync_fee, ttl=None, now=None):
+        """ Returns the reason to sync now, or None to keep waiting.
+
+        Args:
+            payments_queued (list): Queued payments of the connection.
+            sync_fee (int): Fee charged per sync.
+            ttl (int): Blocks until the deposit expires, None if unknown.
+            now (float): Current unix timestamp.
+        """
+        if not payments_queued:
+            return None
+        amount = sum([p["amount"] for p in payments_queued])
+        if sync_fee <= amount * self.max_fee_ratio:
+            return FEE
+
+        # payments queued by older versions have no timestamp
+        now = time.time() if now is None else now
+        oldest = min([p.get("queued_at", 0) for p in payments_queued])
+        if now - oldest >= self.max_latency:
+            return LATENCY
+
+        if ttl is not None and ttl <= self.min_ttl:
+            return TTL
+        return None
@@ -5,13 +5,23 @@
 
 import time
 import json
+import threading
 import requests
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
-from collections import defaultdict
 from . import auth
+from . import metrics
+from .cache import MemoCache
 
 
-method_cumulative_calltime = defaultdict(float)
+DEFAULT_POOL_SIZE = 10
+DEFAULT_MEMO_SIZE = 4096
+AUTH_METHODS = ["mph_request", "mph_deposit", "mph_sync", "mph_close"]
+
+
+_sessions = {}  # (pool_size, keep_alive) -> requests.Session
+_sessions_lock = threading.Lock()
+_memos = {}  # maxsize -> MemoCache
 
 
 class JsonRpcCallFailed(Exception):
@@ -21,22 +31,89 @@ class JsonRpcCallFailed(Exception):
         super(JsonRpcCallFailed, self).__init__(msg)
 
 
-def jsonrpc_call(url, method, params={}, verify_ssl_cert=True,
-                 username=None, password=None):
-    payload = {"method": method, "params": params, "jsonrpc": "2.0", "id": 0}
+class JsonRpcBatchPending(Exception):
+
+    def __init__(self, method):
+        msg = "Result of batched {0} call requested before execution!"
+        super(JsonRpcBatchPending, self).__init__(msg.format(method))
+
+
+def get_session(pool_size=DEFAULT_POOL_SIZE, keep_alive=True):
+    """ Get shared pooled http session for the given settings.
+
+    Sessions are created once per process and reused by every call, so
+    established tcp/tls connections to the hub are kept alive between calls
+    instead of doing a new handshake each time.
+
+    Args:
+        pool_size (int): Max connections kept open per host.
+        keep_alive (bool): Keep connections open after a call.
+
+    Returns:
+        requests.Session instance.
+    """
+    key = (pool_size, keep_alive)
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size,
+                                  pool_maxsize=pool_size)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            if not keep_alive:
+                session.headers["Connection"] = "close"
+            _sessions[key] = session
+        return session
+
+
+def get_memo(maxsize=DEFAULT_MEMO_SIZE):
+    """ Get shared memo cache for pure hub calls, maxsize 0 disables it. """
+    with _sessions_lock:
+        memo = _memos.get(maxsize)
+        if memo is None:
+            memo = _memos[maxsize] = MemoCache(maxsize=maxsize)
+        return memo
+
+
+def _post(url, payload, verify_ssl_cert=True, username=None, password=None,
+          session=None):
+    data = json.dumps(payload)
     kwargs = {
         "url": url,
         "headers": {'content-type': 'application/json'},
-        "data": json.dumps(payload),
+        "data": data,
         "verify": verify_ssl_cert,
     }
     if username and password:
         kwargs["auth"] = HTTPBasicAuth(username, password)
+    session = session or get_session()
 
-    global method_cumulative_calltime
     begin = time.time()
-    response = requests.post(**kwargs).json()
-    method_cumulative_calltime[method] += (time.time() - begin)
+    try:
+        content = session.post(**kwargs).content
+        response = json.loads(content.decode("utf-8"))
+    except Exception:
+        metrics.registry.record_rpc(payload, None, time.time() - begin,
+                                    len(data), 0)
+        raise
+    metrics.registry.record_rpc(payload, response, time.time() - begin,
+                                len(data), len(content))
+    return response
+
+
+def _index_batch_responses(responses):
+    if not isinstance(responses, list):  # whole batch rejected
+        return {}
+    return dict([(r.get("id"), r) for r in responses if isinstance(r, dict)])
+
+
+def jsonrpc_call(url, method, params={}, verify_ssl_cert=True,
+                 username=None, password=None, session=None):
+    payload = {"method": method, "params": params, "jsonrpc": "2.0", "id": 0}
+
+    response = _post(url, payload, verify_ssl_cert=verify_ssl_cert,
+                     username=username, password=password, session=session)
 
     if "result" not in response:
         raise JsonRpcCallFailed(payload, response)
@@ -44,13 +121,15 @@ def jsonrpc_call(url, method, params={}, verify_ssl_cert=True,
 
 
 def auth_jsonrpc_call(url, method, params={}, verify_ssl_cert=True,
-                      auth_wif=None, username=None, password=None):
+                      auth_wif=None, username=None, password=None,
+                      session=None):
 
     if auth_wif:
         params = auth.sign_json(params, auth_wif)
 
     result = jsonrpc_call(url, method, params=params, username=username,
-                          password=password, verify_ssl_cert=verify_ssl_cert)
+                          password=password, verify_ssl_cert=verify_ssl_cert,
+                          session=session)
 
     if auth_wif:
         auth.verify_json(result)
@@ -58,32 +137,158 @@ def auth_jsonrpc_call(url, method, params={}, verify_ssl_cert=True,
     return result
 
 
+def jsonrpc_batch_call(url, payloads, verify_ssl_cert=True,
+                       username=None, password=None, session=None):
+    """ Send multiple payloads as one json-rpc 2.0 batch.
+
+    Returns:
+        Dict mapping request id to response object.
+    """
+    responses = _post(url, payloads, verify_ssl_cert=verify_ssl_cert,
+                      username=username, password=password, session=session)
+    return _index_batch_responses(responses)
+
+
+class JsonRpcBatchCall(object):
+    """ Result placeholder for a call queued in a JsonRpcBatch. """
+
+    def __init__(self, method, params, id, verify=False):
+        self.payload = {
+            "method": method, "params": params, "jsonrpc": "2.0", "id": id
+        }
+        self.verify = verify
+        self.done = False
+        self._result = None
+        self._error = None
+
+    @property
+    def ok(self):
+        return self.done and self._error is None
+
+    def resolve(self, response):
+        self.done = True
+        if response is None or "result" not in response:
+            self._error = JsonRpcCallFailed(self.payload, response)
+            return
+        self._result = response["result"]
+        if self.verify:
+            auth.verify_json(self._result)
+
+    def resolve_cached(self, result):
+        self.done = True
+        self._result = result
+
+    def result(self):
+        if not self.done:
+            raise JsonRpcBatchPending(self.payload["method"])
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+
+class JsonRpcBatch(object):
+    """ Collects calls and sends them to the hub in a single round trip.
+
+    Usage:
+        with api.batch() as batch:
+            ttl = batch.mpc_deposit_ttl(state=state, clearance=6)
+            utxos = batch.get_unspent_txouts(address=address)
+        ttl.result(), utxos.result()
+    """
+
+    def __init__(self, rpc, memo=None):
+        self._rpc = rpc
+        self._calls = []
+        self._memos = [rpc.memo] + ([memo] if memo is not None else [])
+
+    def __getattr__(self, name):
+
+        def wrapper(**kwargs):
+            for memo in self._memos:
+                found, result = memo.lookup(name, kwargs)
+                if found:  # no need to send it
+                    call = JsonRpcBatchCall(name, kwargs, None)
+                    call.resolve_cached(result)
+                    return call
+            auth_wif = self._rpc.auth_wif if name in AUTH_METHODS else None
+            if auth_wif:
+                kwargs = auth.sign_json(kwargs, auth_wif)
+            call = JsonRpcBatchCall(name, kwargs, len(self._calls),
+                                    verify=bool(auth_wif))
+            self._calls.append(call)
+            return call
+        return wrapper
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.execute()
+
+    def execute(self):
+        calls, self._calls = self._calls, []
+        if not calls:
+            return
+        responses = jsonrpc_batch_call(
+            self._rpc.url, [call.payload for call in calls],
+            verify_ssl_cert=self._rpc.verify_ssl_cert,
+            username=self._rpc.username,
+            password=self._rpc.password,
+            session=self._rpc.session
+        )
+        self._resolve(calls, responses)
+
+    def _resolve(self, calls, responses):
+        for call in calls:
+            call.resolve(responses.get(call.payload["id"]))
+            if call.ok:
+                for memo in self._memos:
+                    memo.store(call.payload["method"],
+                               call.payload["params"], call.result())
+
+
 class JsonRpc(object):
 
     def __init__(self, url, auth_wif=None, verify_ssl_cert=True,
-                 username=None, password=None):
+                 username=None, password=None, session=None, memo=None):
         self.url = url
         self.auth_wif = auth_wif
         self.username = username
         self.password = password
         self.verify_ssl_cert = verify_ssl_cert
+        self.session = session or get_session()
+        self.memo = memo or get_memo()
 
     def __getattribute__(self, name):
-        props = ["url", "auth_wif", "verify_ssl_cert", "username", "password"]
-        auth_methods = ["mph_request", "mph_deposit", "mph_sync", "mph_close"]
+        props = ["url", "auth_wif", "verify_ssl_cert", "username", "password",
+                 "session", "memo", "batch"]
 
         if name in props:
             return object.__getattribute__(self, name)
 
         def wrapper(**kwargs):
-            auth_wif = self.auth_wif if name in auth_methods else None
-            return auth_jsonrpc_call(
+            found, result = self.memo.lookup(name, kwargs)
+            if found:
+                return result
+            auth_wif = self.auth_wif if name in AUTH_METHODS else None
+            result = auth_jsonrpc_call(
                 url=self.url,
                 method=name,
                 params=kwargs,
                 auth_wif=auth_wif,
                 verify_ssl_cert=self.verify_ssl_cert,
                 username=self.username,
-                password=self.password
+                password=self.password,
+                session=self.session
             )
+            self.memo.store(name, kwargs, result)
+            return result
         return wrapper
+
+    def batch(self, memo=None):
+        """ Returns a JsonRpcBatch to group calls into one round trip.
+
+        Results are also looked up in and stored to the optional memo.
+        """
+        return JsonRpcBatch(self, memo=memo)
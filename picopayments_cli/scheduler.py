@@ -0,0 +1,181 @@
+# coding: utf-8
+# Copyright (c) 2016 Fabian Barkhau <f483@storj.io>
+# License: MIT (see LICENSE file)
+
+
+import time
+import threading
+
+try:
+    import queue
+except ImportError:  # pragma: no cover
+    import Queue as queue  # python 2
+
+
+class ConnectionStats(object):
+
+    def __init__(self):
+        self.queued = 0  # queue depth when last polled
+        self.syncs = 0
+        self.errors = 0
+        self.last_sync = None  # unix timestamp the last sync finished
+        self.last_sync_latency = None  # seconds the last sync took
+        self.last_error = None
+
+    def snapshot(self):
+        return {
+            "queued": self.queued,
+            "syncs": self.syncs,
+            "errors": self.errors,
+            "last_sync": self.last_sync,
+            "last_sync_latency": self.last_sync_latency,
+            "last_error": self.last_error,
+        }
+
+
+class SyncScheduler(object):
+    """ Syncs connections in the background on a bounded worker pool.
+
+    Every interval seconds poll is called to get the queue depth of every
+    connection and if it is due, those due are submitted to the workers.
+    Every recover_interval seconds all connections are submitted, so
+    closed connections are recovered. A connection is never submitted
+    again while its previous job is pending.
+
+    Args:
+        poll: Callable returning dict mapping handle to (queue depth, due).
+        sync: Callable syncing the connection of the given handle.
+        interval (float): Seconds between polls.
+        recover_interval (float): Seconds between submitting all, 0 never.
+        workers (int): Number of worker threads.
+    """
+
+    def __init__(self, poll, sync, interval=10.0, recover_interval=600.0,
+                 workers=4):
+        self.poll = poll
+        self.sync = sync
+        self.interval = interval
+        self.recover_interval = recover_interval
+        self.workers = workers
+        self._jobs = queue.Queue()
+        self._pending = set()  # handles submitted and not yet synced
+        self._stats = {}  # handle -> ConnectionStats
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._threads = []
+        self._last_recover = None
+        self.poll_errors = 0
+
+    def start(self):
+        ticker = threading.Thread(target=self._run)
+        ticker.daemon = True
+        ticker.start()
+        self._threads.append(ticker)
+        for i in range(self.workers):
+            worker = threading.Thread(target=self._work)
+            worker.daemon = True
+            worker.start()
+            self._threads.append(worker)
+
+    def stop(self):
+        """ Stop polling and wait for running jobs, queued ones are dropped.
+        """
+        self._stopped.set()
+        for i in range(self.workers):
+            self._jobs.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self.tick()
+            except Exception:
+                self.poll_errors += 1
+            self._stopped.wait(self.interval)
+
+    def tick(self, now=None):
+        """ Poll connections and submit those due, returns submitted handles.
+        """
+        now = time.time() if now is None else now
+        recover = bool(self.recover_interval) and (
+            self._last_recover is None or
+            now - self._last_recover >= self.recover_interval
+        )
+        if recover:
+            self._last_recover = now
+        depths = self.poll()  # handle -> (queue depth, due)
+        submitted = []
+        with self._lock:
+            for handle in list(self._stats.keys()):
+                if handle not in depths:
+                    del self._stats[handle]  # culled
+            for handle, (queued, due) in sorted(depths.items()):
+                self._stats.setdefault(handle, ConnectionStats()).queued = \
+                    queued
+                if (due or recover) and handle not in self._pending:
+                    self._pending.add(handle)
+                    submitted.append(handle)
+        for handle in submitted:
+            self._jobs.put(handle)
+        return submitted
+
+    def _work(self):
+        while True:
+            handle = self._jobs.get()
+            if handle is None or self._stopped.is_set():
+                return
+            begin = time.time()
+            error = None
+            try:
+                self.sync(handle)
+            except Exception as e:
+                error = repr(e)
+            finally:
+                end = time.time()
+                with self._lock:
+                    self._pending.discard(handle)
+                    stats = self._stats.setdefault(handle, ConnectionStats())
+                    stats.syncs += 1
+                    stats.errors += 1 if error else 0
+                    stats.last_error = error
+                    stats.last_sync = end
+                    stats.last_sync_latency = end - begin
+
+    def snapshot(self):
+        """ Returns dict mapping handle to its sync statistics. """
+        with self._lock:
+            return dict([
+                (handle, stats.snapshot())
+                for handle, stats in self._stats.items()
+            ])
+
+    def exposition(self, prefix="picopayments_sync"):
+        """ Returns statistics in the prometheus text exposition format. """
+        with self._lock:
+            connections = sorted(self._stats.items())
+            series = [
+                ("queued_payments", "Payments queued per connection.",
+                 "queued"),
+                ("last_latency_seconds", "Duration of the last sync.",
+                 "last_sync_latency"),
+                ("last_timestamp_seconds", "Time the last sync finished.",
+                 "last_sync"),
+                ("total", "Syncs run per connection.", "syncs"),
+                ("errors_total", "Failed syncs per connection.", "errors"),
+            ]
+            lines = []
+            for suffix, description, attr in series:
+                name = "{0}_{1}".format(prefix, suffix)
+                kind = "counter" if suffix.endswith("total") else "gauge"
+                lines.append("# HELP {0} {1}".format(name, description))
+                lines.append("# TYPE {0} {1}".format(name, kind))
+                for handle, stats in connections:
+                    value = getattr(stats, attr)
+                    if value is None:
+                        continue
+                    lines.append('{0}{{handle="{1}"}} {2}'.format(
+                        name, handle, value
+                    ))
+            return "\n".join(lines) + "\n"
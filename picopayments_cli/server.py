@@ -0,0 +1,127 @@
+# coding: utf-8
+# Copyright (c) 2016 Fabian Barkhau <f483@storj.io>
+# License: MIT (see LICENSE file)
+
+
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+from werkzeug.serving import BaseWSGIServer, ForkingWSGIServer
+
+try:
+    import queue
+except ImportError:  # pragma: no cover
+    import Queue as queue  # python 2
+
+
+class ThreadPoolWSGIServer(BaseWSGIServer):
+    """ Handles requests in a fixed number of worker threads. """
+
+    multithread = True
+
+    def __init__(self, host, port, app, threads, **kwargs):
+        BaseWSGIServer.__init__(self, host, port, app, **kwargs)
+        self._requests = queue.Queue()
+        self._workers = []
+        for i in range(threads):
+            worker = threading.Thread(target=self._work)
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def process_request(self, request, client_address):
+        self._requests.put((request, client_address))
+
+    def _work(self):
+        while True:
+            item = self._requests.get()
+            if item is None:
+                return  # closed
+            request, client_address = item
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    def server_close(self):
+        """ Stop accepting requests and wait for queued ones to finish. """
+        BaseWSGIServer.server_close(self)
+        for worker in self._workers:
+            self._requests.put(None)
+        for worker in self._workers:
+            worker.join()
+
+
+class ForkingServer(ForkingWSGIServer):
+    """ Handles every request in a forked process.
+
+    Forked processes exit without running exit handlers, so on_exit is
+    called in the forked process once its request was handled. The value
+    it returns is passed to merge in the server process before the next
+    request is forked, or while idle.
+    """
+
+    def __init__(self, host, port, app, processes, on_exit=None,
+                 merge=None):
+        ForkingWSGIServer.__init__(self, host, port, app, processes)
+        self.on_exit = on_exit
+        self.merge = merge
+        self._results = tempfile.mkdtemp()  # on_exit value per process
+
+    def finish_request(self, request, client_address):
+        try:
+            ForkingWSGIServer.finish_request(self, request, client_address)
+        finally:
+            if self.on_exit is not None:
+                self._save_result(self.on_exit())
+
+    def _save_result(self, result):
+        path = os.path.join(self._results, str(os.getpid()))
+        with open(path + ".tmp", "wb") as outfile:
+            pickle.dump(result, outfile, protocol=2)
+        os.rename(path + ".tmp", path)
+
+    def merge_results(self):
+        """ Pass values returned by on_exit of exited processes to merge. """
+        for name in sorted(os.listdir(self._results)):
+            if name.endswith(".tmp"):
+                continue
+            path = os.path.join(self._results, name)
+            with open(path, "rb") as infile:
+                result = pickle.load(infile)
+            os.remove(path)
+            if self.merge is not None:
+                self.merge(result)
+
+    def process_request(self, request, client_address):
+        self.merge_results()
+        ForkingWSGIServer.process_request(self, request, client_address)
+
+    def service_actions(self):
+        ForkingWSGIServer.service_actions(self)
+        self.merge_results()
+
+    def server_close(self):
+        ForkingWSGIServer.server_close(self)
+        shutil.rmtree(self._results, ignore_errors=True)
+
+
+def make_server(host, port, app, threads=1, processes=1, on_exit=None,
+                merge=None):
+    """ Create server handling requests in threads or forked processes,
+    or one at a time if both are 1.
+
+    The on_exit and merge callbacks are passed to the ForkingServer.
+    """
+    if threads > 1 and processes > 1:
+        raise ValueError("Cannot have multiple threads and processes!")
+    if threads > 1:
+        return ThreadPoolWSGIServer(host, port, app, threads)
+    if processes > 1:
+        return ForkingServer(host, port, app, processes, on_exit=on_exit,
+                             merge=merge)
+    return BaseWSGIServer(host, port, app)
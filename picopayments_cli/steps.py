@@ -0,0 +1,107 @@
+# coding: utf-8
+# Copyright (c) 2016 Fabian Barkhau <f483@storj.io>
+# License: MIT (see LICENSE file)
+
+
+# Protocol steps are generators that yield the hub requests they need and
+# are sent the results, so the same step runs blocking (see run) or in an
+# event loop (see picopayments_cli.aio). Steps never do hub IO themselves.
+#
+#     def _step(self, address):
+#         balances = yield self._get_balances(address)  # sub-step
+#         utxos = yield Call("get_unspent_txouts", address=address)
+#         yield Return((balances, utxos))
+
+
+import types
+
+
+class Call(object):
+    """ Request a single hub call, the step is sent its result. """
+
+    def __init__(self, method, **params):
+        self.method = method
+        self.params = params
+
+
+class Batch(object):
+    """ Request a batch, queue_func is passed the batch to queue its calls
+    and the step is sent what queue_func returned once the batch executed.
+    """
+
+    def __init__(self, queue_func, memo=None):
+        self.queue_func = queue_func
+        self.memo = memo
+
+
+class Return(object):
+    """ Ends the step and sends value to the calling step or driver.
+
+    Generators cannot return values in python 2, so steps yield this.
+    """
+
+    def __init__(self, value=None):
+        self.value = value
+
+
+class Runner(object):
+    """ Runs a step and its sub-steps until a Call or Batch is yielded.
+
+    Exceptions raised by requests are thrown into the step that made them,
+    those a sub-step does not handle are thrown into its caller.
+    """
+
+    def __init__(self, step):
+        self.done = False
+        self.value = None  # returned by the step once done
+        self._stack = [step]
+
+    def resume(self, value=None, error=None):
+        """ Resume with the result or exception of the last request.
+
+        Returns the next Call or Batch request, or None once done.
+        """
+        while self._stack:
+            step = self._stack[-1]
+            try:
+                if error is None:
+                    request = step.send(value)
+                else:
+                    thrown, error = error, None
+                    request = step.throw(thrown)
+            except StopIteration:
+                self._stack.pop()
+                value = None
+                continue
+            except Exception as e:
+                self._stack.pop()
+                if not self._stack:
+                    self.done = True
+                    raise
+                value, error = None, e
+                continue
+            if isinstance(request, Return):
+                step.close()
+                self._stack.pop()
+                value = request.value
+            elif isinstance(request, types.GeneratorType):
+                self._stack.append(request)
+                value = None
+            else:
+                return request
+        self.done = True
+        self.value = value
+        return None
+
+
+def run(step, execute):
+    """ Run step blocking, execute is called with every request. """
+    runner = Runner(step)
+    request = runner.resume()
+    while not runner.done:
+        try:
+            value, error = execute(request), None
+        except Exception as e:
+            value, error = None, e
+        request = runner.resume(value, error)
+    return runner.value
@@ -0,0 +1,850 @@
+# coding: utf-8
+# Copyright (c) 2016 Fabian Barkhau <f483@storj.io>
+# License: MIT (see LICENSE file)
+
+
+import os
+import json
+import mmap
+import sqlite3
+import threading
+import contextlib
+from picopayments_cli import codec
+
+
+class Store(object):
+    """ Backend interface for persisting connection data.
+
+    Connection data is the dict returned by Mph.serialize, stored by handle.
+    """
+
+    def handles(self):
+        """ Returns list of stored connection handles. """
+        raise NotImplementedError()
+
+    def load(self, handle):
+        """ Returns connection data, raises KeyError if unknown. """
+        raise NotImplementedError()
+
+    def load_all(self):
+        """ Returns dict mapping handle to connection data. """
+        return dict([(handle, self.load(handle)) for handle in self.handles()])
+
+    def save(self, handle, data):
+        """ Create or replace the connection data of a handle. """
+        raise NotImplementedError()
+
+    def update(self, handle, data, changed):
+        """ Write the changed attributes of stored connection data.
+
+        Backends may skip writing attributes not listed in changed.
+        """
+        if changed:
+            self.save(handle, data)
+
+    def delete(self, handle):
+        raise NotImplementedError()
+
+    def cancel_payment(self, token):
+        """ Remove queued payment, returns True if it was found. """
+        raise NotImplementedError()
+
+    def archive_commits(self, handle, channel, commits):
+        """ Append revoked commits moved out of a c2h or h2c channel state.
+        """
+        raise NotImplementedError()
+
+    def load_archived(self, handle, channel):
+        """ Returns archived revoked commits of a channel, oldest first. """
+        raise NotImplementedError()
+
+    def count_queued(self, token):
+        """ Returns number of queued payments with the given token. """
+        raise NotImplementedError()
+
+    def find_queued(self, token):
+        """ Returns handle with a queued payment of token or None. """
+        raise NotImplementedError()
+
+    def get_meta(self, key):
+        """ Returns store metadata value or None if not set. """
+        raise NotImplementedError()
+
+    def set_meta(self, key, value):
+        raise NotImplementedError()
+
+    @contextlib.contextmanager
+    def transaction(self, write=True):
+        """ Writes within the context are committed together or not at all.
+        """
+        yield self
+
+    def flush(self):
+        """ Write buffered changes to disk, nothing is buffered by default.
+        """
+        pass
+
+    @contextlib.contextmanager
+    def hold(self):
+        """ Buffered changes are only written by flush within the context.
+        """
+        yield self
+
+
+class JsonStore(Store):
+    """ All connections in a single json document, rewritten on save. """
+
+    def __init__(self, path):
+        self.path = path
+        self._data = None  # loaded document while in a transaction
+        self._lock = threading.RLock()
+
+    def _load_data(self):
+        if self._data is not None:
+            return self._data
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as infile:
+                return json.load(infile)
+        return {"connections": {}}
+
+    def _save_data(self, data):
+        if self._data is not None:
+            return  # written when transaction ends
+        with open(self.path, 'w') as outfile:
+            json.dump(data, outfile, indent=2, sort_keys=True)
+
+    @contextlib.contextmanager
+    def transaction(self, write=True):
+        with self._lock:
+            if self._data is not None:  # nested
+                yield self
+                return
+            self._data = self._load_data()
+            try:
+                yield self
+                data, self._data = self._data, None
+                if write:
+                    self._save_data(data)
+            finally:
+                self._data = None
+
+    def handles(self):
+        return list(self._load_data()["connections"].keys())
+
+    def load(self, handle):
+        return self._load_data()["connections"][handle]
+
+    def load_all(self):
+        return self._load_data()["connections"]
+
+    def save(self, handle, data):
+        with self._lock:
+            document = self._load_data()
+            document["connections"][handle] = data
+            self._save_data(document)
+
+    def delete(self, handle):
+        with self._lock:
+            document = self._load_data()
+            del document["connections"][handle]
+            document.get("archive", {}).pop(handle, None)
+            self._save_data(document)
+
+    def cancel_payment(self, token):
+        with self._lock:
+            document = self._load_data()
+            for handle, data in document["connections"].items():
+                for payment in data["payments_queued"]:
+                    if payment["token"] == token:
+                        data["payments_queued"].remove(payment)
+                        self._save_data(document)
+                        return True
+            return False
+
+    def archive_commits(self, handle, channel, commits):
+        with self._lock:
+            document = self._load_data()
+            archive = document.setdefault("archive", {})
+            archive.setdefault(handle, {}).setdefault(channel, []).extend(
+                commits
+            )
+            self._save_data(document)
+
+    def load_archived(self, handle, channel):
+        archive = self._load_data().get("archive", {})
+        return archive.get(handle, {}).get(channel, [])
+
+    def count_queued(self, token):
+        return len([
+            payment for data in self.load_all().values()
+            for payment in data["payments_queued"]
+            if payment["token"] == token
+        ])
+
+    def find_queued(self, token):
+        for handle, data in self.load_all().items():
+            for payment in data["payments_queued"]:
+                if payment["token"] == token:
+                    return handle
+        return None
+
+    def get_meta(self, key):
+        return self._load_data().get("meta", {}).get(key)
+
+    def set_meta(self, key, value):
+        with self._lock:
+            document = self._load_data()
+            document.setdefault("meta", {})[key] = value
+            self._save_data(document)
+
+
+class BinaryStore(JsonStore):
+    """ The JsonStore document in the compact binary codec encoding.
+
+    Hex strings are stored as raw bytes, so the file is about half the size
+    of the json document. The file is memory mapped and only an index of
+    connection byte ranges is read up front, a connection is decoded when
+    it is accessed. Unchanged connections are copied as is when the file is
+    replaced, which is done atomically.
+    """
+
+    MAGIC = b"PPB1"
+    _SECTIONS = ["connections", "archive"]  # dicts indexed by handle
+
+    def __init__(self, path):
+        super(BinaryStore, self).__init__(path)
+        self._mapped = (None, None)  # (file identity, document index)
+
+    def _index(self):
+        if not os.path.exists(self.path):
+            return codec.LazyDict(connections=codec.LazyDict())
+        stat = os.stat(self.path)
+        identity = (stat.st_ino, stat.st_size, stat.st_mtime)
+        if self._mapped[0] != identity:
+            with open(self.path, 'rb') as infile:
+                data = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+            if data[:len(self.MAGIC)] != self.MAGIC:
+                raise codec.DecodeError("Not a binary data file!")
+            index = codec.lazy_dict_at(data, len(self.MAGIC))[0]
+            for name in self._SECTIONS:
+                if name in index:
+                    start = dict.__getitem__(index, name).start
+                    section = codec.lazy_dict_at(data, start)[0]
+                    dict.__setitem__(index, name, section)
+            self._mapped = (identity, index)
+        return self._mapped[1]
+
+    def _raw(self, name, key):
+        # encoded value of key in the index section, None if missing
+        section = dict.get(self._index(), name)
+        if section is None:
+            return None
+        return dict.get(section, key)
+
+    def _load_data(self):
+        if self._data is not None:
+            return self._data
+        document = self._index().copy()
+        for name in self._SECTIONS:
+            if name in document:
+                document[name] = document[name].copy()
+        return document
+
+    def _save_data(self, data):
+        if self._data is not None:
+            return  # written when transaction ends
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'wb') as outfile:
+            outfile.write(self.MAGIC + codec.encode(data))
+        os.rename(tmp_path, self.path)
+
+    def handles(self):
+        if self._data is not None:
+            return super(BinaryStore, self).handles()
+        return list(self._index()["connections"].keys())
+
+    def load(self, handle):
+        if self._data is not None:
+            return super(BinaryStore, self).load(handle)
+        raw = self._raw("connections", handle)
+        if raw is None:
+            raise KeyError(handle)
+        return raw.decode()
+
+    def load_all(self):
+        if self._data is not None:
+            return super(BinaryStore, self).load_all()
+        return dict([(h, self.load(h)) for h in self.handles()])
+
+    def load_archived(self, handle, channel):
+        if self._data is not None:
+            return super(BinaryStore, self).load_archived(handle, channel)
+        raw = self._raw("archive", handle)
+        return raw.decode().get(channel, []) if raw is not None else []
+
+    def _payments_queued(self):
+        # yields (handle, queued payments) decoding only the queued lists
+        connections = self._load_data()["connections"]
+        for handle in list(connections.keys()):
+            data = dict.__getitem__(connections, handle)
+            if isinstance(data, codec.Raw):
+                data = codec.lazy_dict_at(data.data, data.start)[0]
+            yield handle, data["payments_queued"]
+
+    def cancel_payment(self, token):
+        with self._lock:
+            handle = self.find_queued(token)
+            if handle is None:
+                return False
+            document = self._load_data()
+            payments = document["connections"][handle]["payments_queued"]
+            for payment in payments:
+                if payment["token"] == token:
+                    payments.remove(payment)
+                    break
+            self._save_data(document)
+            return True
+
+    def count_queued(self, token):
+        return len([
+            payment for handle, payments in self._payments_queued()
+            for payment in payments if payment["token"] == token
+        ])
+
+    def find_queued(self, token):
+        for handle, payments in self._payments_queued():
+            for payment in payments:
+                if payment["token"] == token:
+                    return handle
+        return None
+
+    def get_meta(self, key):
+        if self._data is not None:
+            return super(BinaryStore, self).get_meta(key)
+        raw = dict.get(self._index(), "meta")
+        return raw.decode().get(key) if raw is not None else None
+
+
+class SqliteStore(Store):
+    """ One row per connection, queued payments and secrets in own tables.
+
+    Saving a connection only writes its own rows and every call runs in a
+    sqlite transaction, so a crash never leaves partially written data.
+    """
+
+    SCHEMA = [
+        """CREATE TABLE IF NOT EXISTS connections (
+            handle TEXT PRIMARY KEY,
+            data TEXT NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS payments_queued (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            handle TEXT NOT NULL,
+            token TEXT,
+            payment TEXT NOT NULL
+        )""",
+        """CREATE INDEX IF NOT EXISTS payments_queued_handle
+            ON payments_queued (handle)""",
+        """CREATE INDEX IF NOT EXISTS payments_queued_token
+            ON payments_queued (token)""",
+        """CREATE TABLE IF NOT EXISTS secrets (
+            handle TEXT NOT NULL,
+            secret_hash TEXT NOT NULL,
+            secret TEXT NOT NULL,
+            PRIMARY KEY (handle, secret_hash)
+        )""",
+        """CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )""",
+        """CREATE TABLE IF NOT EXISTS payments_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            handle TEXT NOT NULL,
+            attr TEXT NOT NULL,
+            payment TEXT NOT NULL
+        )""",
+        """CREATE INDEX IF NOT EXISTS payments_log_handle
+            ON payments_log (handle, attr)""",
+        """CREATE TABLE IF NOT EXISTS commits_archive (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            handle TEXT NOT NULL,
+            channel TEXT NOT NULL,
+            commit_data TEXT NOT NULL
+        )""",
+        """CREATE INDEX IF NOT EXISTS commits_archive_handle
+            ON commits_archive (handle, channel)""",
+    ]
+
+    # append only connection data lists kept in payments_log
+    _LOG_ATTRS = ["payments_sent", "payments_received"]
+
+    # connection data attributes kept in their own tables
+    _SPLIT_ATTRS = ["secrets", "payments_queued"] + _LOG_ATTRS
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()  # sqlite connection per thread
+        with self.transaction() as cursor:
+            for statement in self.SCHEMA:
+                cursor.execute(statement)
+
+    def _db(self):
+        db = getattr(self._local, "db", None)
+        # connections must not be used by forked processes
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=60)
+            db.isolation_level = None  # transactions managed explicitly
+            self._local.db = db
+            self._local.depth = 0
+            self._local.pid = os.getpid()
+        return db
+
+    @contextlib.contextmanager
+    def transaction(self, write=True):
+        db = self._db()
+        cursor = db.cursor()
+        if self._local.depth == 0:
+            cursor.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+        self._local.depth += 1
+        try:
+            yield cursor
+        except Exception:
+            self._local.depth -= 1
+            if self._local.depth == 0:
+                db.rollback()
+            raise
+        else:
+            self._local.depth -= 1
+            if self._local.depth == 0:
+                db.commit()
+
+    def handles(self):
+        cursor = self._db().execute("SELECT handle FROM connections")
+        return [row[0] for row in cursor.fetchall()]
+
+    def load(self, handle):
+        with self.transaction(write=False) as cursor:
+            cursor.execute("SELECT data FROM connections WHERE handle = ?",
+                           (handle,))
+            row = cursor.fetchone()
+            if row is None:
+                raise KeyError(handle)
+            data = json.loads(row[0])
+            cursor.execute(
+                "SELECT payment FROM payments_queued WHERE handle = ? "
+                "ORDER BY id", (handle,)
+            )
+            data["payments_queued"] = [
+                json.loads(row[0]) for row in cursor.fetchall()
+            ]
+            cursor.execute(
+                "SELECT secret_hash, secret FROM secrets WHERE handle = ?",
+                (handle,)
+            )
+            data["secrets"] = dict(cursor.fetchall())
+            for attr in self._LOG_ATTRS:
+                data[attr] = []
+            cursor.execute(
+                "SELECT attr, payment FROM payments_log WHERE handle = ? "
+                "ORDER BY id", (handle,)
+            )
+            for attr, payment in cursor.fetchall():
+                data[attr].append(json.loads(payment))
+            return data
+
+    def save(self, handle, data):
+        with self.transaction() as cursor:
+            cursor.execute("DELETE FROM payments_log WHERE handle = ?",
+                           (handle,))
+            self._write(cursor, handle, data, data.keys())
+
+    def update(self, handle, data, changed):
+        with self.transaction() as cursor:
+            self._write(cursor, handle, data, changed)
+
+    def _write(self, cursor, handle, data, changed):
+        changed = set(changed)
+        if changed.difference(self._SPLIT_ATTRS):
+            self._write_row(cursor, handle, data)
+        if "payments_queued" in changed:
+            self._write_payments_queued(cursor, handle, data)
+        if "secrets" in changed:
+            self._write_secrets(cursor, handle, data)
+        for attr in changed.intersection(self._LOG_ATTRS):
+            # only entries beyond the stored ones are new
+            cursor.execute(
+                "SELECT COUNT(*) FROM payments_log "
+                "WHERE handle = ? AND attr = ?", (handle, attr)
+            )
+            stored = cursor.fetchone()[0]
+            payments = data.get(attr) or []
+            self._append_log(cursor, handle, attr, payments[stored:])
+
+    def _write_row(self, cursor, handle, data):
+        row = dict([
+            (k, v) for k, v in data.items() if k not in self._SPLIT_ATTRS
+        ])
+        cursor.execute(
+            "INSERT OR REPLACE INTO connections (handle, data) "
+            "VALUES (?, ?)", (handle, json.dumps(row, sort_keys=True))
+        )
+
+    def _write_payments_queued(self, cursor, handle, data):
+        cursor.execute("DELETE FROM payments_queued WHERE handle = ?",
+                       (handle,))
+        cursor.executemany(
+            "INSERT INTO payments_queued (handle, token, payment) "
+            "VALUES (?, ?, ?)", [
+                (handle, p.get("token"), json.dumps(p, sort_keys=True))
+                for p in data.get("payments_queued") or []
+            ]
+        )
+
+    def _write_secrets(self, cursor, handle, data):
+        secrets = data.get("secrets") or {}
+        cursor.execute("SELECT secret_hash FROM secrets WHERE handle = ?",
+                       (handle,))
+        stored = set([row[0] for row in cursor.fetchall()])
+        cursor.executemany(
+            "INSERT INTO secrets (handle, secret_hash, secret) "
+            "VALUES (?, ?, ?)", [
+                (handle, secret_hash, secret)
+                for secret_hash, secret in secrets.items()
+                if secret_hash not in stored
+            ]
+        )
+        cursor.executemany(
+            "DELETE FROM secrets WHERE handle = ? AND secret_hash = ?",
+            [(handle, h) for h in stored if h not in secrets]
+        )
+
+    def _append_log(self, cursor, handle, attr, payments):
+        cursor.executemany(
+            "INSERT INTO payments_log (handle, attr, payment) "
+            "VALUES (?, ?, ?)", [
+                (handle, attr, json.dumps(p, sort_keys=True))
+                for p in payments
+            ]
+        )
+
+    def delete(self, handle):
+        with self.transaction() as cursor:
+            for table in ["connections", "payments_queued", "secrets",
+                          "payments_log", "commits_archive"]:
+                cursor.execute(
+                    "DELETE FROM {0} WHERE handle = ?".format(table), (handle,)
+                )
+
+    def cancel_payment(self, token):
+        with self.transaction() as cursor:
+            cursor.execute(
+                "SELECT id FROM payments_queued WHERE token = ? "
+                "ORDER BY id LIMIT 1", (token,)
+            )
+            row = cursor.fetchone()
+            if row is None:
+                return False
+            cursor.execute("DELETE FROM payments_queued WHERE id = ?", row)
+            return True
+
+    def archive_commits(self, handle, channel, commits):
+        with self.transaction() as cursor:
+            cursor.executemany(
+                "INSERT INTO commits_archive (handle, channel, commit_data) "
+                "VALUES (?, ?, ?)", [
+                    (handle, channel, json.dumps(c, sort_keys=True))
+                    for c in commits
+                ]
+            )
+
+    def load_archived(self, handle, channel):
+        cursor = self._db().execute(
+            "SELECT commit_data FROM commits_archive "
+            "WHERE handle = ? AND channel = ? ORDER BY id", (handle, channel)
+        )
+        return [json.loads(row[0]) for row in cursor.fetchall()]
+
+    def count_queued(self, token):
+        cursor = self._db().execute(
+            "SELECT COUNT(*) FROM payments_queued WHERE token = ?", (token,)
+        )
+        return cursor.fetchone()[0]
+
+    def find_queued(self, token):
+        cursor = self._db().execute(
+            "SELECT handle FROM payments_queued WHERE token = ? "
+            "ORDER BY id LIMIT 1", (token,)
+        )
+        row = cursor.fetchone()
+        return row[0] if row is not None else None
+
+    def get_meta(self, key):
+        cursor = self._db().execute("SELECT value FROM meta WHERE key = ?",
+                                    (key,))
+        row = cursor.fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def set_meta(self, key, value):
+        with self.transaction() as cursor:
+            cursor.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                (key, json.dumps(value))
+            )
+
+
+class ResidentStore(Store):
+    """ Keeps connections of a backing store deserialized in memory.
+
+    All connections are loaded once on first access, reads never touch the
+    disk afterwards. Writes are applied in memory and written behind to the
+    backing store in a single transaction at most write_delay seconds
+    later, or when flush is called. Only one process may use the backing
+    store while it is resident.
+    """
+
+    def __init__(self, backing, write_delay=1.0):
+        self.backing = backing
+        self.write_delay = write_delay
+        self._connections = None  # handle -> data, loaded on first access
+        self._archived = {}  # (handle, channel) -> commits
+        self._meta = {}
+        self._dirty = {}  # handle -> changed attrs, None if saved
+        self._deleted = set()
+        self._archive_pending = []  # (handle, channel, commits)
+        self._meta_pending = {}
+        self._timer = None
+        self._depth = 0  # nested transactions
+        self._holds = 0  # write behind deferred while held
+        self._lock = threading.RLock()
+        self._flushing = threading.Lock()
+
+    def _loaded(self):
+        with self._lock:
+            if self._connections is None:
+                self._connections = dict(self.backing.load_all())
+            return self._connections
+
+    def _written(self):
+        # start the write behind timer, call while locked
+        if self._timer is None and not self._holds:
+            self._timer = threading.Timer(self.write_delay, self._write_behind)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _write_behind(self):
+        with self._lock:
+            if self._holds:
+                self._timer = None  # restarted when released
+                return
+        self.flush()
+
+    def _pending(self):
+        return bool(self._dirty or self._deleted or self._archive_pending or
+                    self._meta_pending)
+
+    @contextlib.contextmanager
+    def hold(self):
+        """ Defer write behind within the context, e.g. while a batch of
+        calls runs, so its changes are written by a single flush.
+        """
+        with self._lock:
+            self._holds += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._holds -= 1
+                if not self._holds and self._pending():
+                    self._written()
+
+    def handles(self):
+        return list(self._loaded().keys())
+
+    def load(self, handle):
+        # shallow copy, stored data is replaced and never modified
+        return dict(self._loaded()[handle])
+
+    def load_all(self):
+        return dict([(h, dict(d)) for h, d in self._loaded().items()])
+
+    def save(self, handle, data):
+        with self._lock:
+            self._loaded()[handle] = dict(data)
+            self._dirty[handle] = None
+            self._written()
+
+    def update(self, handle, data, changed):
+        if not changed:
+            return
+        with self._lock:
+            connections = self._loaded()
+            stored = dict(connections[handle])
+            for attr in changed:
+                stored[attr] = data[attr]
+            connections[handle] = stored
+            if handle not in self._dirty:
+                self._dirty[handle] = set(changed)
+            elif self._dirty[handle] is not None:
+                self._dirty[handle].update(changed)
+            self._written()
+
+    def delete(self, handle):
+        with self._lock:
+            del self._loaded()[handle]
+            self._dirty.pop(handle, None)
+            self._deleted.add(handle)
+            self._archive_pending = [
+                entry for entry in self._archive_pending if entry[0] != handle
+            ]
+            for channel in ["c2h", "h2c"]:
+                self._archived.pop((handle, channel), None)
+            self._written()
+
+    def cancel_payment(self, token):
+        with self._lock:
+            handle = self.find_queued(token)
+            if handle is None:
+                return False
+            queued = list(self._loaded()[handle]["payments_queued"])
+            queued.remove([p for p in queued if p["token"] == token][0])
+            self.update(handle, {"payments_queued": queued},
+                        ["payments_queued"])
+            return True
+
+    def archive_commits(self, handle, channel, commits):
+        with self._lock:
+            archived = self.load_archived(handle, channel)
+            self._archived[(handle, channel)] = archived + list(commits)
+            self._archive_pending.append((handle, channel, list(commits)))
+            self._written()
+
+    def load_archived(self, handle, channel):
+        with self._lock:
+            key = (handle, channel)
+            if key not in self._archived:
+                self._archived[key] = self.backing.load_archived(handle,
+                                                                 channel)
+            return self._archived[key]
+
+    def count_queued(self, token):
+        return len([
+            payment for data in list(self._loaded().values())
+            for payment in data["payments_queued"]
+            if payment["token"] == token
+        ])
+
+    def find_queued(self, token):
+        for handle, data in list(self._loaded().items()):
+            for payment in data["payments_queued"]:
+                if payment["token"] == token:
+                    return handle
+        return None
+
+    def get_meta(self, key):
+        with self._lock:
+            if key not in self._meta:
+                self._meta[key] = self.backing.get_meta(key)
+            return self._meta[key]
+
+    def set_meta(self, key, value):
+        with self._lock:
+            self._meta[key] = value
+            self._meta_pending[key] = value
+            self._written()
+
+    def _state(self):
+        return (
+            dict(self._loaded()), dict(self._archived), dict(self._meta),
+            dict([(h, c and set(c)) for h, c in self._dirty.items()]),
+            set(self._deleted), list(self._archive_pending),
+            dict(self._meta_pending),
+        )
+
+    @contextlib.contextmanager
+    def transaction(self, write=True):
+        with self._lock:
+            state = self._state() if write and self._depth == 0 else None
+            self._depth += 1
+            try:
+                yield self
+            except Exception:
+                if state is not None:  # roll back in memory changes
+                    (self._connections, self._archived, self._meta,
+                     self._dirty, self._deleted, self._archive_pending,
+                     self._meta_pending) = state
+                raise
+            finally:
+                self._depth -= 1
+
+    def flush(self):
+        """ Write all changes made since the last flush to the backing store.
+        """
+        with self._flushing:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                connections = self._connections or {}
+                deleted, self._deleted = self._deleted, set()
+                dirty, self._dirty = self._dirty, {}
+                saved = dict([(h, connections[h]) for h in dirty])
+                archive, self._archive_pending = self._archive_pending, []
+                meta, self._meta_pending = self._meta_pending, {}
+            try:
+                with self.backing.transaction():
+                    for handle in deleted:
+                        try:
+                            self.backing.delete(handle)
+                        except KeyError:
+                            pass  # created and deleted before written
+                    for handle, changed in dirty.items():
+                        if changed is None:
+                            self.backing.save(handle, saved[handle])
+                        else:
+                            self.backing.update(handle, saved[handle],
+                                                changed)
+                    for handle, channel, commits in archive:
+                        self.backing.archive_commits(handle, channel, commits)
+                    for key, value in meta.items():
+                        self.backing.set_meta(key, value)
+            except Exception:
+                self._unflushed(deleted, dirty, archive, meta)
+                raise
+
+    def _unflushed(self, deleted, dirty, archive, meta):
+        # merge changes of a failed flush with those made since
+        with self._lock:
+            self._deleted.update(deleted)
+            for handle, changed in dirty.items():
+                if handle not in self._connections:
+                    continue  # deleted since
+                if changed is None or self._dirty.get(handle, ()) is None:
+                    self._dirty[handle] = None
+                else:
+                    self._dirty[handle] = changed.union(
+                        self._dirty.get(handle, ())
+                    )
+            self._archive_pending = [
+                entry for entry in archive if entry[0] in self._connections
+            ] + self._archive_pending
+            for key, value in meta.items():
+                self._meta_pending.setdefault(key, value)
+            self._written()
+
+
+BACKENDS = {
+    "json": JsonStore,
+    "binary": BinaryStore,
+    "sqlite": SqliteStore,
+}
+
+
+def migrate(source, destination):
+    """ Copy all connections from source to destination store. """
+    with destination.transaction():
+        for handle, data in source.load_all().items():
+            destination.save(handle, data)
+            for channel in ["c2h", "h2c"]:
+                destination.archive_commits(
+                    handle, channel, source.load_archived(handle, channel)
+                )
@@ -0,0 +1,139 @@
+# coding: utf-8
+# Copyright (c) 2016 Fabian Barkhau <f483@storj.io>
+# License: MIT (see LICENSE file)
+
+
+import os
+import threading
+from pycoin.tx import Tx
+from micropayment_core import util
+from picopayments_cli.cache import LRUCache
+
+
+DEFAULT_CACHE_SIZE = 1024
+
+
+_stores = {}  # (path, cache_size) -> TxStore
+_stores_lock = threading.Lock()
+
+
+class TxidMismatch(Exception):
+
+    def __init__(self, txid, rawtx):
+        msg = "Rawtx {0} does not hash to txid {1}!".format(rawtx, txid)
+        super(TxidMismatch, self).__init__(msg)
+
+
+def get_txstore(path=None, cache_size=DEFAULT_CACHE_SIZE):
+    """ Get shared tx store for the given path, None for memory only. """
+    key = (path, cache_size)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = TxStore(path=path, cache_size=cache_size)
+        return store
+
+
+class TxStore(object):
+    """ Content addressed txid -> rawtx store.
+
+    Raw transactions are saved as one file per txid in the given directory,
+    an in-memory LRU of parsed pycoin Tx objects sits in front of it. As
+    a txid is the hash of the rawtx, entries never need to be invalidated.
+    """
+
+    def __init__(self, path=None, cache_size=DEFAULT_CACHE_SIZE):
+        self.path = path
+        self._rawtxs = LRUCache(maxsize=cache_size)  # txid -> rawtx
+        self._txs = LRUCache(maxsize=cache_size)  # txid -> Tx
+        if path is not None and not os.path.exists(path):
+            os.makedirs(path)
+
+    def _file(self, txid):
+        return os.path.join(self.path, txid)
+
+    def get(self, txid):
+        """ Returns rawtx for txid or None if not stored. """
+        rawtx = self._rawtxs.get(txid)
+        if rawtx is None and self.path is not None:
+            try:
+                with open(self._file(txid), "r") as infile:
+                    rawtx = infile.read().strip()
+            except (IOError, OSError):
+                return None
+            self._rawtxs.set(txid, rawtx)
+        return rawtx
+
+    def get_tx(self, txid, rawtx=None):
+        """ Returns parsed Tx for txid or None if not stored.
+
+        The returned Tx is shared, callers must not modify it.
+        """
+        tx = self._txs.get(txid)
+        if tx is None:
+            rawtx = rawtx or self.get(txid)
+            if rawtx is None:
+                return None
+            Tx.ALLOW_SEGWIT = False  # same as micropayment_core.util
+            tx = Tx.from_hex(rawtx)
+            self._txs.set(txid, tx)
+        return tx
+
+    def put(self, txid, rawtx):
+        """ Store rawtx, raises TxidMismatch if it does not match txid. """
+        Tx.ALLOW_SEGWIT = False  # same as micropayment_core.util
+        tx = Tx.from_hex(rawtx)
+        if util.b2h_rev(tx.hash()) != txid:
+            raise TxidMismatch(txid, rawtx)
+        self._rawtxs.set(txid, rawtx)
+        self._txs.set(txid, tx)
+        if self.path is not None and not os.path.exists(self._file(txid)):
+            tmp_path = "{0}.{1}.tmp".format(self._file(txid), os.getpid())
+            with open(tmp_path, "w") as outfile:
+                outfile.write(rawtx)
+            os.rename(tmp_path, self._file(txid))  # atomic, never partial
+
+    def missing(self, txids):
+        return [txid for txid in txids if self.get(txid) is None]
+
+    def get_rawtxs(self, txids, fetch_func):
+        """ Get rawtxs for txids, fetching only those not already stored.
+
+        Args:
+            txids (list): Txids of the wanted transactions.
+            fetch_func: Called with a list of missing txids, returns
+                        a dict mapping txid to rawtx.
+
+        Returns:
+            Dict mapping txid to rawtx.
+        """
+        result = {}
+        missing = []
+        for txid in txids:
+            rawtx = self.get(txid)
+            if rawtx is None:
+                missing.append(txid)
+            else:
+                result[txid] = rawtx
+        if missing:
+            fetched = fetch_func(missing)
+            self.put_many(fetched)
+            result.update(fetched)
+        return result
+
+    def put_many(self, rawtxs):
+        for txid, rawtx in rawtxs.items():
+            self.put(txid, rawtx)
+
+    def load_tx(self, rawtx, fetch_func):
+        """ Parse rawtx with unspents set from the stored input txs. """
+        Tx.ALLOW_SEGWIT = False  # same as micropayment_core.util
+        tx = Tx.from_hex(rawtx)
+        if tx.is_coinbase():
+            return tx
+        txids = [util.b2h_rev(tx_in.previous_hash) for tx_in in tx.txs_in]
+        rawtxs = self.get_rawtxs(list(set(txids)), fetch_func)
+        for txid, tx_in in zip(txids, tx.txs_in):
+            utxo_tx = self.get_tx(txid, rawtx=rawtxs[txid])
+            tx.unspents.append(utxo_tx.txs_out[tx_in.previous_index])
+        return tx
@@ -0,0 +1,83 @@
+import asyncio
+import unittest
+from tests.mock_rpc_server import start
+from picopayments_cli import aio
+from picopayments_cli import rpc
+from tests.steps_test import HubApi
+
+
+class AsyncHubApi(object):
+
+    def __init__(self):
+        self.api = HubApi()
+
+    def __getattr__(self, name):
+        func = getattr(self.api, name)
+
+        async def wrapper(**kwargs):
+            await asyncio.sleep(0)
+            return func(**kwargs)
+        return wrapper
+
+
+class TestAio(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_hub_process = start()
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+        self.mock_hub_process.terminate()
+
+    def _api(self):
+        auth_wif = "cNXoRUC2eqcBEv1AmvPgM6NgCYV1ReTTHuAmVxaAh6AvVLHroSfU"
+        url = "https://127.0.0.1:16000/api/"
+        return aio.AsyncJsonRpc(auth_wif=auth_wif, url=url,
+                                verify_ssl_cert=False)
+
+    def test_async_auth_call(self):
+
+        async def func():
+            api = self._api()
+            results = await asyncio.gather(api.mph_sync(), api.mph_sync())
+            await api.close()
+            return results
+
+        for result in self.loop.run_until_complete(func()):
+            self.assertIn("foo", result)
+
+    def test_async_batch_call(self):
+
+        async def func():
+            api = self._api()
+            async with api.batch() as batch:
+                found = batch.mph_sync()
+                missing = batch.non_existant()
+            await api.close()
+            return found, missing
+
+        found, missing = self.loop.run_until_complete(func())
+        self.assertIn("foo", found.result())
+        self.assertRaises(rpc.JsonRpcCallFailed, missing.result)
+
+    def test_async_mpc_steps(self):
+        api = AsyncHubApi()
+        mpc = aio.AsyncMpc(api)
+        published = []
+        mpc._published = published.append
+
+        async def func():
+            transferred = await mpc.get_transferred("rawtx", asset="XCP")
+            with self.assertRaises(ValueError):
+                await mpc.publish("rawtx")
+            return transferred
+
+        self.assertEqual(self.loop.run_until_complete(func()), (5, 7))
+        self.assertEqual(api.api.calls,
+                         ["get_tx_info", "unpack", "sendrawtransaction"])
+        self.assertEqual(published, ["rawtx"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,185 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+import requests
+from werkzeug.test import Client
+from werkzeug.wrappers import Response
+from picopayments_cli import api
+from picopayments_cli import etc
+from picopayments_cli.server import make_server
+from picopayments_cli.history import get_history, close_histories
+
+
+class ApiTest(unittest.TestCase):
+
+    def setUp(self):
+        self.settings = dict(vars(etc))
+        self.basedir = tempfile.mkdtemp()
+        etc.load(self.basedir, True)
+        api._store().save("handle_a", {
+            "asset": "XCP", "handle": "handle_a", "payments_queued": [],
+        })
+        self.client = Client(api._application, Response)
+
+    def tearDown(self):
+        close_histories()
+        vars(etc).update(self.settings)  # dont leave removed paths loaded
+        shutil.rmtree(self.basedir)
+
+    def call(self, calls):
+        response = self.client.post("/", data=json.dumps(calls),
+                                    content_type="application/json")
+        return json.loads(response.data.decode("utf-8"))
+
+
+class TestBatch(ApiTest):
+
+    def test_batch(self):
+        calls = [
+            {"jsonrpc": "2.0", "id": i, "method": "queuepayment", "params": {
+                "source": "handle_a", "destination": "handle_b",
+                "quantity": 1, "token": "token_{0}".format(i)
+            }} for i in range(3)
+        ]
+        calls.insert(1, {"jsonrpc": "2.0", "id": 9, "method": "queuepayment",
+                         "params": {"source": "unknown",
+                                    "destination": "handle_b",
+                                    "quantity": 1}})
+        calls.append({"jsonrpc": "2.0", "id": 10, "method": "cancelpayment",
+                      "params": {"token": "token_2"}})
+        results = self.call(calls)
+
+        # results in order, errors per call
+        self.assertEqual([r["id"] for r in results], [0, 9, 1, 2, 10])
+        self.assertIn("error", results[1])
+        self.assertEqual([r.get("result") for r in results],
+                         ["token_0", None, "token_1", "token_2", True])
+
+        # journal written once at the end of the batch
+        with open(etc.journal_path) as infile:
+            self.assertEqual(len(infile.readlines()), 4)
+        api._journal().compact(api._store())
+        queued = api._store().load("handle_a")["payments_queued"]
+        self.assertEqual([p["token"] for p in queued],
+                         ["token_0", "token_1"])
+
+    def test_queuepayments(self):
+        source, destination = "a" * 64, "b" * 64
+        api._store().save(source, {
+            "asset": "XCP", "handle": source, "payments_queued": [],
+        })
+        path = os.path.join(self.basedir, "payments.csv")
+        with open(path, "w") as outfile:
+            outfile.write("source,destination,quantity,token\n")
+            for i in range(3):
+                outfile.write("{0},{1},{2},{3:02x}\n".format(
+                    source, destination, i + 1, i
+                ))
+
+        # queued with history before the tokens are iterated
+        tokens = api.queuepayments(path)
+        self.assertEqual(len(api._journal().records(api._store())), 3)
+        entries = get_history().entries(action="queue_micropayment")
+        self.assertEqual(sorted([e["id"] for e in entries]),
+                         ["00", "01", "02"])
+        self.assertEqual(list(tokens), ["00", "01", "02"])
+
+        results = self.call([{
+            "jsonrpc": "2.0", "id": 1, "method": "queuepayments",
+            "params": {"payments": [
+                {"source": source, "destination": destination,
+                 "quantity": 4, "token": "03"},
+            ]}
+        }, {
+            "jsonrpc": "2.0", "id": 2, "method": "queuepayments",
+            "params": {"payments": [
+                {"source": source, "destination": destination,
+                 "quantity": 5},
+                {"source": destination, "destination": source,
+                 "quantity": 6},  # unknown source, nothing queued
+            ]}
+        }])
+        self.assertEqual(results[0]["result"], ["03"])
+        self.assertIn("error", results[1])
+
+        api._journal().compact(api._store())
+        queued = api._store().load(source)["payments_queued"]
+        self.assertEqual([p["amount"] for p in queued], [1, 2, 3, 4])
+
+
+class TestHubApi(ApiTest):
+
+    def test_wif_loaded_once(self):
+        loaded = []
+        load_wif = api.load_wif
+
+        def counting_load_wif():
+            loaded.append(True)
+            return load_wif()
+
+        api.load_wif = counting_load_wif
+        try:
+            hub_api = api._hub_api()
+            self.assertIs(api._hub_api(), hub_api)
+        finally:
+            api.load_wif = load_wif
+        self.assertEqual(len(loaded), 1)
+        self.assertEqual(hub_api.auth_wif, load_wif())
+
+
+class TestCancel(ApiTest):
+
+    def test_cancel_after_scheduled_compaction(self):
+        token = api.queuepayment("handle_a", "handle_b", 1)
+        self.assertEqual(api._sync_queue()["handle_a"][0], 1)  # compacted
+        self.assertTrue(api.cancelpayment(token))
+        self.assertEqual(api._store().load("handle_a")["payments_queued"], [])
+        self.assertFalse(api.cancelpayment(token))
+
+
+class TestProcesses(ApiTest):
+
+    def test_forked_request_history_written(self):
+        server = make_server("localhost", 0, api._application, processes=2,
+                             on_exit=api._exit_forked,
+                             merge=api._merge_forked)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            response = requests.post(
+                "http://localhost:{0}".format(server.server_port),
+                data=json.dumps({
+                    "jsonrpc": "2.0", "id": 1, "method": "queuepayment",
+                    "params": {"source": "handle_a", "destination": "b",
+                               "quantity": 1, "token": "token_a"}
+                }), headers={"content-type": "application/json"}
+            )
+            self.assertEqual(response.json()["result"], "token_a")
+
+            # history is buffered, written before the process exits
+            entries = []
+            for i in range(100):
+                entries = list(get_history().entries(
+                    action="queue_micropayment"
+                ))
+                if entries:
+                    break
+                time.sleep(0.05)
+            self.assertEqual([e["id"] for e in entries], ["token_a"])
+        finally:
+            server.shutdown()
+            thread.join()
+            server.server_close()
+
+    def test_no_background_syncs(self):
+        etc.serve_processes = 2
+        etc.serve_sync_interval = 10.0
+        self.assertRaises(AssertionError, api.serve, "localhost", 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+# coding: utf-8
+# Copyright (c) 2016 Fabian Barkhau <f483@storj.io>
+# License: MIT (see LICENSE file)
+
+
+# Throughput of auth.sign_json/verify_json on channel states of increasing
+# size, compared to the previous implementation that derived the keys from
+# the wif and deep copied the data on every call.
+#
+# Usage: python tests/auth_benchmark.py
+
+
+import os
+import copy
+import json
+import time
+from micropayment_core import util
+from micropayment_core import keys
+from micropayment_core import scripts
+from picopayments_cli import auth
+
+
+COMMIT_COUNTS = [0, 10, 100, 500]
+MIN_SECONDS = 1.0
+
+
+def legacy_sign_json(json_data, auth_wif):
+    privkey = keys.wif_to_privkey(auth_wif)
+    json_data["pubkey"] = keys.pubkey_from_privkey(privkey)
+    data = json.dumps(json_data, sort_keys=True)
+    json_data["signature"] = keys.sign_sha256(privkey, data.encode("utf-8"))
+    return json_data
+
+
+def legacy_verify_json(json_data):
+    json_data = copy.deepcopy(json_data)
+    pubkey = json_data["pubkey"]
+    signature = json_data.pop("signature")
+    data = json.dumps(json_data, sort_keys=True)
+    return keys.verify_sha256(pubkey, signature, data.encode("utf-8"))
+
+
+def random_secret():
+    return util.b2h(os.urandom(32))
+
+
+def make_state(commit_count):
+    payer = keys.pubkey_from_wif(keys.generate_wif())
+    payee = keys.pubkey_from_wif(keys.generate_wif())
+    spend_secret_hash = util.hash160hex(random_secret())
+    commits = []
+    for i in range(commit_count):
+        commits.append({
+            "rawtx": util.b2h(os.urandom(250)),  # typical commit size
+            "script": scripts.compile_commit_script(
+                payer, payee, spend_secret_hash,
+                util.hash160hex(random_secret()), 2
+            )
+        })
+    return {
+        "asset": "XCP",
+        "deposit_script": scripts.compile_deposit_script(
+            payer, payee, spend_secret_hash, 1024
+        ),
+        "commits_requested": [
+            util.hash160hex(random_secret()) for i in range(commit_count)
+        ],
+        "commits_active": commits[:len(commits) // 2],
+        "commits_revoked": [
+            {"script": c["script"], "revoke_secret": random_secret()}
+            for c in commits[len(commits) // 2:]
+        ],
+    }
+
+
+def throughput(func, make_args):
+    count = 0
+    elapsed = 0.0
+    while elapsed < MIN_SECONDS:
+        args = make_args()  # fresh data, not part of the timing
+        begin = time.time()
+        func(*args)
+        elapsed += time.time() - begin
+        count += 1
+    return count / elapsed
+
+
+def main():
+    wif = keys.generate_wif()
+    row = "{0:>8} {1:>10} {2:>10} {3:>10} {4:>10} {5:>10}"
+    print(row.format("commits", "bytes", "sign/s", "legacy/s",
+                     "verify/s", "legacy/s"))
+    for commit_count in COMMIT_COUNTS:
+        payload = {"handle": random_secret(), "state": make_state(
+            commit_count
+        )}
+        signed = auth.sign_json(copy.deepcopy(payload), wif)
+        assert legacy_verify_json(signed) and auth.verify_json(signed)
+        size = len(json.dumps(signed))
+
+        def make_sign_args():
+            return [dict(payload), wif]  # sign only touches top level
+
+        def make_verify_args():
+            return [signed]
+
+        print(row.format(
+            commit_count, size,
+            int(throughput(auth.sign_json, make_sign_args)),
+            int(throughput(legacy_sign_json, make_sign_args)),
+            int(throughput(auth.verify_json, make_verify_args)),
+            int(throughput(legacy_verify_json, make_verify_args)),
+        ))
+
+
+if __name__ == "__main__":
+    main()
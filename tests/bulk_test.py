@@ -0,0 +1,54 @@
+import io
+import unittest
+from picopayments_cli import bulk
+
+
+SOURCE = "a" * 64
+DESTINATION = "b" * 64
+
+
+class TestReadPayments(unittest.TestCase):
+
+    def test_jsonl(self):
+        infile = io.StringIO(
+            u'{"source": "%s", "destination": "%s", "quantity": 3}\n'
+            u'\n'
+            u'{"source": "%s", "destination": "%s", "quantity": "4", '
+            u'"token": "ff"}\n' % (SOURCE, DESTINATION, SOURCE, DESTINATION)
+        )
+        self.assertEqual(list(bulk.read_payments(infile)), [
+            {"source": SOURCE, "destination": DESTINATION, "quantity": 3,
+             "token": None},
+            {"source": SOURCE, "destination": DESTINATION, "quantity": 4,
+             "token": "ff"},
+        ])
+
+    def test_csv(self):
+        infile = io.StringIO(
+            u"source,destination,quantity,token\n"
+            u"%s,%s,3,\n" % (SOURCE, DESTINATION)
+        )
+        self.assertEqual(list(bulk.read_payments(infile, "csv")), [
+            {"source": SOURCE, "destination": DESTINATION, "quantity": 3,
+             "token": None},
+        ])
+
+    def test_invalid(self):
+        cases = [
+            u'{"source": "%s", "destination": "%s", "quantity": -1}\n',
+            u'{"source": "%s", "destination": "%s"}\n',
+            u'{"source": "%s", "destination": "%s", "quantity": 1, "x": 1}\n',
+            u'{"source": "%s", "destination": "%s", "quantity": 1\n',
+            u'{"source": "%s", "destination": "%s", "quantity": 1.9}\n',
+            u'{"source": "%s", "destination": "%s", "quantity": true}\n',
+            u'{"source": "%s", "destination": "%s", "quantity": "1.9"}\n',
+        ]
+        for case in cases:
+            infile = io.StringIO(u"\n" + case % (SOURCE, DESTINATION))
+            with self.assertRaises((AssertionError, ValueError)) as context:
+                list(bulk.read_payments(infile))
+            self.assertTrue(str(context.exception).startswith("Line 2:"))
+
+
+if __name__ == "__main__":
+    unittest.main()
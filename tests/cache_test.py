@@ -0,0 +1,123 @@
+import unittest
+from picopayments_cli import cache
+
+
+class TestCache(unittest.TestCase):
+
+    def test_lru_eviction(self):
+        lru = cache.LRUCache(maxsize=2)
+        lru.set("a", 1)
+        lru.set("b", 2)
+        self.assertEqual(lru.get("a"), 1)  # b is now least recently used
+        lru.set("c", 3)
+        self.assertNotIn("b", lru)
+        self.assertIn("a", lru)
+        self.assertEqual(lru.hits, 1)
+        self.assertIsNone(lru.get("b"))
+        self.assertEqual(lru.misses, 1)
+
+    def test_canonical_key(self):
+        key_a = cache.canonical_key("m", {"a": 1, "b": [1, 2]})
+        key_b = cache.canonical_key("m", {"b": [1, 2], "a": 1})
+        self.assertEqual(key_a, key_b)
+        self.assertNotEqual(key_a, cache.canonical_key("n", {"a": 1}))
+
+    def test_memo_only_pure_methods(self):
+        memo = cache.MemoCache(maxsize=8)
+        state = {"commits_active": [{"rawtx": "00", "script": "51"}]}
+        memo.store("mpc_transferred_amount", {"state": state}, 1337)
+        memo.store("mpc_deposit_ttl", {"state": state}, 5)
+        self.assertEqual(
+            memo.lookup("mpc_transferred_amount", {"state": state}),
+            (True, 1337)
+        )
+        self.assertEqual(memo.lookup("mpc_deposit_ttl", {"state": state}),
+                         (False, None))
+        stats = memo.snapshot()["methods"]["mpc_transferred_amount"]
+        self.assertEqual(stats, {"hits": 1, "misses": 0})
+
+    def test_memo_results_not_shared(self):
+        memo = cache.MemoCache(maxsize=8)
+        params = {"state": {}, "quantity": 0, "surpass": False}
+        memo.store("mpc_revoke_hashes_until", params, ["aa"])
+        found, result = memo.lookup("mpc_revoke_hashes_until", params)
+        result.append("bb")
+        found, result = memo.lookup("mpc_revoke_hashes_until", params)
+        self.assertEqual(result, ["aa"])
+
+    def test_memo_merge(self):
+        memo = cache.MemoCache(maxsize=8)
+        memo.lookup("mpc_highest_commit", {"state": {}})
+        other = cache.MemoCache(maxsize=8)
+        other.store("mpc_highest_commit", {"state": {}}, None)
+        other.lookup("mpc_highest_commit", {"state": {}})
+        memo.merge(other.recorded())
+        snapshot = memo.snapshot()
+        self.assertEqual((snapshot["hits"], snapshot["misses"]), (1, 1))
+        self.assertEqual(snapshot["methods"]["mpc_highest_commit"],
+                         {"hits": 1, "misses": 1})
+        self.assertEqual(memo.recorded()["hits"], 0)
+
+    def test_memo_disabled(self):
+        memo = cache.MemoCache(maxsize=0)
+        memo.store("mpc_highest_commit", {"state": {}}, None)
+        self.assertEqual(memo.lookup("mpc_highest_commit", {"state": {}}),
+                         (False, None))
+
+
+class TestChainCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tip = 100
+        self.tip_queries = 0
+        self.cache = cache.ChainCache(self.get_tip, tip_interval=0)
+        self.params = {"address": "addr", "unconfirmed": False}
+
+    def get_tip(self):
+        self.tip_queries += 1
+        return self.tip
+
+    def test_valid_until_tip_changes(self):
+        self.cache.store("get_unspent_txouts", self.params, [1])
+        found, result = self.cache.lookup("get_unspent_txouts", self.params)
+        self.assertTrue(found)
+        self.assertEqual(result, [1])
+        self.tip = 101
+        found, result = self.cache.lookup("get_unspent_txouts", self.params)
+        self.assertFalse(found)
+
+    def test_tip_interval(self):
+        self.cache.tip_interval = 3600
+        self.cache.store("get_balances", self.params, [])
+        for i in range(3):
+            self.cache.lookup("get_balances", self.params)
+        self.assertEqual(self.tip_queries, 1)
+
+    def test_invalidate_and_max_age(self):
+        self.cache.store("get_balances", self.params, [])
+        self.cache.invalidate()
+        self.assertFalse(self.cache.lookup("get_balances", self.params)[0])
+        self.cache.max_age = -1
+        self.cache.store("get_balances", self.params, [])
+        self.assertFalse(self.cache.lookup("get_balances", self.params)[0])
+
+    def test_unconfirmed_not_cached(self):
+        params = {"address": "addr", "unconfirmed": True}
+        for method in ["get_unspent_txouts", "search_raw_transactions"]:
+            self.cache.store(method, params, [1])
+            self.assertFalse(self.cache.lookup(method, params)[0])
+        self.assertEqual(len(self.cache._cache), 0)
+        self.assertEqual(self.tip_queries, 0)
+
+    def test_tip_failure(self):
+
+        def get_tip():
+            raise Exception("hub down")
+
+        self.cache.get_tip_func = get_tip
+        self.cache.store("get_balances", self.params, [])
+        self.assertFalse(self.cache.lookup("get_balances", self.params)[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
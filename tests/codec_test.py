@@ -0,0 +1,38 @@
+import os
+import json
+import unittest
+from micropayment_core import util
+from picopayments_cli import codec
+
+
+class TestCodec(unittest.TestCase):
+
+    def test_roundtrip(self):
+        values = [
+            None, True, False, 0, 1, -1, 2 ** 70, -(2 ** 70), 1.5,
+            "", "abc", u"ä", "00ff", "00FF", "0f0", [], {},
+            [1, "a", [None]], {"a": {"b": [1, 2]}, "c": "dead"},
+        ]
+        for value in values:
+            self.assertEqual(codec.decode(codec.encode(value)), value)
+
+    def test_hex_as_bytes(self):
+        rawtx = util.b2h(os.urandom(200))
+        data = {"rawtx": rawtx, "commits": [{"script": rawtx}]}
+        encoded = codec.encode(data)
+        self.assertTrue(len(encoded) < len(json.dumps(data)) * 0.6)
+        self.assertEqual(codec.decode(encoded), data)
+
+    def test_hex_with_trailing_newline(self):
+        for value in ["ab\n", {"a": "ab\n"}, "00ff\n\n"]:
+            self.assertEqual(codec.decode(codec.encode(value)), value)
+
+    def test_invalid(self):
+        encoded = codec.encode({"a": [1, 2, 3]})
+        self.assertRaises(codec.DecodeError, codec.decode, encoded[:-1])
+        self.assertRaises(codec.DecodeError, codec.decode, encoded + b"N")
+        self.assertRaises(codec.DecodeError, codec.decode, b"X")
+
+
+if __name__ == "__main__":
+    unittest.main()
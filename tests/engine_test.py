@@ -0,0 +1,152 @@
+import os
+import struct
+import unittest
+from pycoin.tx import Tx, TxIn, TxOut
+from micropayment_core import util
+from micropayment_core import keys
+from micropayment_core import scripts
+from picopayments_cli import engine
+from picopayments_cli.mpc import Mpc
+
+
+PAYER_PUBKEY = keys.pubkey_from_wif(keys.generate_wif())
+PAYEE_PUBKEY = keys.pubkey_from_wif(keys.generate_wif())
+SPEND_SECRET_HASH = util.hash160hex(util.b2h(os.urandom(32)))
+
+
+def make_send_rawtx(quantity):
+    previous_hash = os.urandom(32)
+    data = engine.COUNTERPARTY_PREFIX + struct.pack(">IQQ", 0, 1, quantity)
+    data = engine.arc4(previous_hash[::-1], data)
+    script = bytes(bytearray([engine.OP_RETURN, len(data)])) + data
+    tx = Tx(1, [TxIn(previous_hash, 0)], [TxOut(0, script)])
+    return tx.as_hex()
+
+
+def make_commit(quantity, revoke_secret):
+    script = scripts.compile_commit_script(
+        PAYER_PUBKEY, PAYEE_PUBKEY, SPEND_SECRET_HASH,
+        util.hash160hex(revoke_secret), 2
+    )
+    return {"rawtx": make_send_rawtx(quantity), "script": script}
+
+
+def make_state(commits):
+    return {
+        "asset": "XCP",
+        "deposit_script": scripts.compile_deposit_script(
+            PAYER_PUBKEY, PAYEE_PUBKEY, SPEND_SECRET_HASH, 1024
+        ),
+        "commits_requested": [],
+        "commits_active": commits,
+        "commits_revoked": [],
+    }
+
+
+class TestEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = engine.LocalEngine()
+        self.secrets = [util.b2h(os.urandom(32)) for i in range(3)]
+        self.commits = [
+            make_commit(quantity, secret)
+            for quantity, secret in zip([10, 30, 20], self.secrets)
+        ]
+        self.state = make_state(self.commits)
+
+    def test_arc4(self):
+        result = engine.arc4(b"Key", b"Plaintext")
+        self.assertEqual(util.b2h(result), "bbf316e8d940af0ad3")
+
+    def test_decode_send_quantity(self):
+        rawtx = make_send_rawtx(1337)
+        self.assertEqual(engine.decode_send_quantity(rawtx), 1337)
+        tx = Tx(1, [TxIn(os.urandom(32), 0)], [TxOut(0, b"\x6a\x01\x00")])
+        self.assertIsNone(engine.decode_send_quantity(tx.as_hex()))
+        self.assertRaises(engine.UndecodableCommit,
+                          self.engine.commit_quantity, tx.as_hex())
+
+    def test_transferred_amount(self):
+        self.assertEqual(self.engine.transferred_amount(self.state), 30)
+        self.assertEqual(self.engine.transferred_amount(make_state([])), 0)
+
+    def test_highest_commit(self):
+        self.assertEqual(self.engine.highest_commit(self.state),
+                         self.commits[1])
+        self.assertIsNone(self.engine.highest_commit(make_state([])))
+
+    def test_revoke_hashes_until(self):
+        hashes = [util.hash160hex(secret) for secret in self.secrets]
+        self.assertEqual(
+            self.engine.revoke_hashes_until(self.state, 15, False),
+            [hashes[1]]
+        )
+        self.assertEqual(
+            self.engine.revoke_hashes_until(self.state, 15, True),
+            [hashes[1], hashes[2]]
+        )
+        self.assertEqual(
+            self.engine.revoke_hashes_until(self.state, 20, False),
+            [hashes[1]]
+        )
+
+    def test_revoke_all(self):
+        state = self.engine.revoke_all(self.state, self.secrets[1:2])
+        self.assertEqual(len(self.state["commits_active"]), 3)  # unchanged
+        self.assertEqual(len(state["commits_active"]), 2)
+        revoked = state["commits_revoked"][0]
+        self.assertEqual(revoked["revoke_secret"], self.secrets[1])
+        self.assertNotIn("rawtx", revoked)
+        self.assertEqual(self.engine.transferred_amount(state), 20)
+
+    def test_add_commit(self):
+        secret = util.b2h(os.urandom(32))
+        commit = make_commit(40, secret)
+        self.state["commits_requested"].append(util.hash160hex(secret))
+        state = self.engine.add_commit(
+            self.state, commit["rawtx"], commit["script"]
+        )
+        self.assertEqual(state["commits_requested"], [])
+        self.assertEqual(self.engine.transferred_amount(state), 40)
+
+        # revoke hash must have been requested
+        commit = make_commit(50, util.b2h(os.urandom(32)))
+        self.assertRaises(engine.InvalidCommit, self.engine.add_commit,
+                          state, commit["rawtx"], commit["script"])
+
+
+class HubApi(object):
+
+    def __init__(self, transferred_amount):
+        self.calls = 0
+        self.transferred_amount = transferred_amount
+
+    def mpc_transferred_amount(self, state):
+        self.calls += 1
+        return self.transferred_amount
+
+
+class TestMpcEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.state = make_state([make_commit(10, util.b2h(os.urandom(32)))])
+
+    def test_local(self):
+        api = HubApi(10)
+        mpc = Mpc(api, engine="local")
+        result = mpc._state_call("transferred_amount", state=self.state)
+        self.assertEqual(result, 10)
+        self.assertEqual(api.calls, 0)
+        mpc._state_call("transferred_amount", "hub", state=self.state)
+        self.assertEqual(api.calls, 1)
+
+    def test_verify(self):
+        mpc = Mpc(HubApi(10), engine="verify")
+        mpc._state_call("transferred_amount", state=self.state)
+        mpc = Mpc(HubApi(11), engine="verify")
+        self.assertRaises(engine.EngineMismatch, mpc._state_call,
+                          "transferred_amount", state=self.state)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from picopayments_cli import history
+
+
+def make_entry(number, handle="handle_a", action="hub_sync"):
+    return {
+        "timestamp": "{0}".format(1000.0 + number),
+        "handle": handle,
+        "action": action,
+        "id": "id_{0}".format(number),
+        "fee": "0XCP",
+        "quantity": "{0}XCP".format(number),
+        "destination": "",
+    }
+
+
+class HistoryTest(object):
+
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        self.history = self.create_history()
+        for number in range(10):
+            handle = "handle_a" if number % 2 else "handle_b"
+            action = "queue_micropayment" if number == 7 else "hub_sync"
+            self.history.add(make_entry(number, handle, action))
+
+    def tearDown(self):
+        self.history.close()
+        shutil.rmtree(self.basedir)
+
+    def ids(self, **kwargs):
+        return [e["id"] for e in self.history.entries(**kwargs)]
+
+    def test_all(self):
+        entries = list(self.history.entries())
+        self.assertEqual(len(entries), 10)
+        entry = dict(entries[3])
+        del entry["cursor"]
+        self.assertEqual(entry, make_entry(3, "handle_a"))
+
+    def test_filter(self):
+        self.assertEqual(self.ids(handle="handle_a"),
+                         ["id_1", "id_3", "id_5", "id_7", "id_9"])
+        self.assertEqual(self.ids(action="queue_micropayment"), ["id_7"])
+        self.assertEqual(self.ids(since=1002.0, until=1004.0),
+                         ["id_2", "id_3"])
+
+    def test_newest_first(self):
+        self.assertEqual(self.ids(handle="handle_a", newest_first=True,
+                                  limit=2), ["id_9", "id_7"])
+
+    def test_pages(self):
+        for newest_first in [False, True]:
+            ids, cursor = [], None
+            while True:
+                page = list(self.history.entries(
+                    handle="handle_b", cursor=cursor, limit=2,
+                    newest_first=newest_first
+                ))
+                if not page:
+                    break
+                ids += [e["id"] for e in page]
+                cursor = page[-1]["cursor"]
+            expected = ["id_0", "id_2", "id_4", "id_6", "id_8"]
+            if newest_first:
+                expected.reverse()
+            self.assertEqual(ids, expected)
+
+
+class TestCsvHistory(HistoryTest, unittest.TestCase):
+
+    def create_history(self):
+        return history.CsvHistory(os.path.join(self.basedir, "history.csv"))
+
+
+class TestRotatedCsvHistory(HistoryTest, unittest.TestCase):
+
+    def create_history(self):
+        return history.CsvHistory(
+            os.path.join(self.basedir, "history.csv"), rotate_size=200,
+            compress=True, flush_size=3
+        )
+
+    def test_rotated(self):
+        self.history.flush()
+        segments = self.history.segments()
+        self.assertTrue(len(segments) > 1)
+        self.assertTrue(all(s.endswith(".gz") for s in segments))
+
+
+class TestBuffered(unittest.TestCase):
+
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        self.path = os.path.join(self.basedir, "history.csv")
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def test_flush_size(self):
+        buffered = history.CsvHistory(self.path, flush_size=3)
+        buffered.add(make_entry(0))
+        buffered.add(make_entry(1))
+        self.assertFalse(os.path.exists(self.path))
+        buffered.add(make_entry(2))
+        self.assertEqual(len(list(history.CsvHistory(self.path).entries())),
+                         3)
+
+    def test_flush_on_read(self):
+        buffered = history.CsvHistory(self.path, flush_size=100)
+        buffered.add(make_entry(0))
+        self.assertEqual(len(list(buffered.entries())), 1)
+
+    def test_flush_interval(self):
+        buffered = history.CsvHistory(self.path, flush_size=100,
+                                      flush_interval=0.01)
+        buffered.add(make_entry(0))
+        for i in range(100):
+            if os.path.exists(self.path):
+                break
+            time.sleep(0.01)
+        self.assertTrue(os.path.exists(self.path))
+
+
+class TestSqliteHistory(HistoryTest, unittest.TestCase):
+
+    def create_history(self):
+        return history.SqliteHistory(os.path.join(self.basedir, "history.db"))
+
+    def test_import_csv(self):
+        csv_path = os.path.join(self.basedir, "history.csv")
+        csv_history = history.CsvHistory(csv_path)
+        for number in range(3):
+            csv_history.add(make_entry(number))
+        imported = history.SqliteHistory(os.path.join(self.basedir, "db"))
+        history.import_csv(csv_path, imported)
+        self.assertEqual(list(imported.entries()),
+                         list(csv_history.entries()))
+
+
+if __name__ == "__main__":
+    unittest.main()
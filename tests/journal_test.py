@@ -0,0 +1,216 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from picopayments_cli import store
+from picopayments_cli import journal
+
+
+def make_data(handle):
+    return {
+        "asset": "XCP",
+        "handle": handle,
+        "secrets": {},
+        "payments_queued": [
+            {"payee_handle": "dest", "amount": 1, "token": "token_a"},
+        ],
+    }
+
+
+def make_payment(token, amount=1):
+    return {"payee_handle": "dest", "amount": amount, "token": token}
+
+
+class JournalTest(object):
+
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        self.store = self.create_store()
+        self.store.save("handle_a", make_data("handle_a"))
+        self.store.save("handle_b", make_data("handle_b"))
+        self.journal = journal.PaymentJournal(
+            os.path.join(self.basedir, "journal")
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def queued_tokens(self, handle):
+        return [p["token"] for p in
+                self.store.load(handle)["payments_queued"]]
+
+    def test_queue_not_stored_until_compact(self):
+        self.journal.queue("handle_a", make_payment("token_b"))
+        self.journal.queue("handle_a", make_payment("token_c"))
+        self.assertEqual(self.queued_tokens("handle_a"), ["token_a"])
+
+        view = self.journal.view(self.store.load_all(), self.store)
+        tokens = [p["token"] for p in view["handle_a"]["payments_queued"]]
+        self.assertEqual(tokens, ["token_a", "token_b", "token_c"])
+        self.assertEqual(self.queued_tokens("handle_a"), ["token_a"])
+
+        self.assertEqual(self.journal.compact(self.store), 2)
+        self.assertEqual(self.queued_tokens("handle_a"),
+                         ["token_a", "token_b", "token_c"])
+        self.assertEqual(self.journal.size(), 0)
+        self.assertEqual(self.journal.compact(self.store), 0)
+
+    def test_cancel(self):
+        self.journal.queue("handle_b", make_payment("token_b"))
+        self.assertTrue(self.journal.cancel("token_b", self.store))
+        self.assertFalse(self.journal.cancel("token_b", self.store))
+        self.assertTrue(self.journal.cancel("token_a", self.store))
+        self.assertTrue(self.journal.cancel("token_a", self.store))
+        self.assertFalse(self.journal.cancel("token_a", self.store))
+        self.journal.compact(self.store)
+        self.assertEqual(self.queued_tokens("handle_a"), [])
+        self.assertEqual(self.queued_tokens("handle_b"), [])
+
+    def test_cancel_waits_for_sync(self):
+        self.journal.queue("handle_a", make_payment("token_b"))
+        self.journal.compact(self.store)
+        canceled = []
+        cancel = threading.Thread(target=lambda: canceled.append(
+            self.journal.cancel("token_b", self.store)
+        ))
+
+        # sync holding the handle lock sends the folded payment
+        with self.journal.locks.locked(["handle_a"]):
+            cancel.start()
+            cancel.join(0.2)
+            self.assertTrue(cancel.is_alive())
+            data = self.store.load("handle_a")
+            self.store.update("handle_a", dict(data, payments_queued=[]),
+                              ["payments_queued"])
+        cancel.join()
+        self.assertEqual(canceled, [False])
+
+        # canceled in the store once folded
+        self.journal.queue("handle_a", make_payment("token_c"))
+        self.journal.compact(self.store)
+        self.assertTrue(self.journal.cancel("token_c", self.store))
+        self.assertEqual(self.queued_tokens("handle_a"), [])
+        self.assertEqual(self.journal.records(self.store), [])
+
+    def test_unknown_handle_dropped(self):
+        self.journal.queue("unknown", make_payment("token_b"))
+        self.journal.compact(self.store)
+        self.assertEqual(sorted(self.store.handles()),
+                         ["handle_a", "handle_b"])
+
+    def test_compaction_not_repeated_after_crash(self):
+        self.journal.queue("handle_a", make_payment("token_b"))
+        self.journal.compact(self.store)
+
+        # crash after store commit but before compacted journal removed
+        with open(self.journal.compacting_path, "w") as outfile:
+            outfile.write(
+                '{"handle": "handle_a", "op": "queue", "payment": '
+                '{"amount": 1, "payee_handle": "dest", "token": "token_b"}}\n'
+                '{"id": "%s", "op": "checkpoint"}\n' %
+                self.store.get_meta(journal.CHECKPOINT_KEY)
+            )
+        self.assertEqual(self.journal.records(self.store), [])
+        self.journal.queue("handle_a", make_payment("token_c"))
+        self.journal.compact(self.store)
+        self.assertEqual(self.queued_tokens("handle_a"),
+                         ["token_a", "token_b", "token_c"])
+        self.assertFalse(os.path.exists(self.journal.compacting_path))
+
+    def test_torn_write_skipped(self):
+        self.journal.queue("handle_a", make_payment("token_b"))
+        with open(self.journal.path, "a") as outfile:
+            outfile.write('{"handle": "handle_a", "op": "qu')
+        self.journal.queue("handle_a", make_payment("token_c"))
+        self.journal.compact(self.store)
+        self.assertEqual(self.queued_tokens("handle_a"),
+                         ["token_a", "token_b", "token_c"])
+
+    def test_parsed_records_kept(self):
+        self.journal.queue("handle_a", make_payment("token_b"))
+        self.journal.records(self.store)
+        parsed = []
+        parse = self.journal._parse
+
+        def counted_parse(data):
+            parsed.append(data)
+            return parse(data)
+
+        self.journal._parse = counted_parse
+        self.journal.queue("handle_a", make_payment("token_c"))
+        records = self.journal.records(self.store)
+        self.assertEqual([r["payment"]["token"] for r in records],
+                         ["token_b", "token_c"])
+        self.assertEqual(len(parsed), 1)  # only the appended line
+        self.assertNotIn(b"token_b", parsed[0])
+
+        # parsed again once replaced by compaction
+        self.journal.compact(self.store)
+        self.journal.queue("handle_b", make_payment("token_d"))
+        records = self.journal.records(self.store)
+        self.assertEqual([r["payment"]["token"] for r in records],
+                         ["token_d"])
+
+    def test_maybe_compact(self):
+        self.journal.compact_size = 1
+        self.assertIsNone(self.journal.maybe_compact(self.store))
+        self.journal.queue("handle_a", make_payment("token_b"))
+        self.journal.maybe_compact(self.store).join()
+        self.assertEqual(self.queued_tokens("handle_a"),
+                         ["token_a", "token_b"])
+
+    def test_batch_written_once(self):
+        with self.journal.batch():
+            self.journal.queue("handle_a", make_payment("token_b"))
+            self.journal.queue("handle_b", make_payment("token_c"))
+            self.assertEqual(self.journal.size(), 0)
+
+            # seen by calls of the same batch
+            self.assertTrue(self.journal.cancel("token_c", self.store))
+            view = self.journal.view(self.store.load_all(), self.store)
+            self.assertEqual(view["handle_b"]["payments_queued"],
+                             [make_payment("token_a")])
+        self.assertEqual(len(self.journal.records(self.store)), 3)
+        self.journal.compact(self.store)
+        self.assertEqual(self.queued_tokens("handle_a"),
+                         ["token_a", "token_b"])
+        self.assertEqual(self.queued_tokens("handle_b"), ["token_a"])
+
+    def test_batch_compact(self):
+        with self.journal.batch():
+            self.journal.queue("handle_a", make_payment("token_b"))
+            self.assertEqual(self.journal.compact(self.store), 1)
+            self.assertEqual(self.queued_tokens("handle_a"),
+                             ["token_a", "token_b"])
+        self.assertEqual(self.journal.records(self.store), [])
+
+
+class TestJsonStoreJournal(JournalTest, unittest.TestCase):
+
+    def create_store(self):
+        return store.JsonStore(os.path.join(self.basedir, "data"))
+
+
+class TestSqliteStoreJournal(JournalTest, unittest.TestCase):
+
+    def create_store(self):
+        return store.SqliteStore(os.path.join(self.basedir, "db"))
+
+
+class TestResidentStoreJournal(JournalTest, unittest.TestCase):
+
+    def create_store(self):
+        self.backing = store.SqliteStore(os.path.join(self.basedir, "db"))
+        return store.ResidentStore(self.backing, write_delay=60.0)
+
+    def test_flushed_before_journal_removed(self):
+        self.journal.queue("handle_a", make_payment("token_b"))
+        self.journal.compact(self.store)
+        tokens = [p["token"] for p in
+                  self.backing.load("handle_a")["payments_queued"]]
+        self.assertEqual(tokens, ["token_a", "token_b"])
+
+
+if __name__ == "__main__":
+    unittest.main()
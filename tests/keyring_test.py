@@ -0,0 +1,44 @@
+import os
+import shutil
+import tempfile
+import unittest
+from micropayment_core import keys
+from picopayments_cli import keyring
+
+
+class TestKeyRing(unittest.TestCase):
+
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        self.wallet_path = os.path.join(self.basedir, "testnet.wif")
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def test_derived_once(self):
+        wif = keys.generate_wif("XTN")
+        key = keyring.get_key(wif)
+        self.assertIs(key, keyring.get_key(wif))
+        self.assertEqual(key.pubkey, keys.pubkey_from_wif(wif))
+        self.assertEqual(key.address, keys.address_from_wif(wif))
+        self.assertEqual(key.netcode, "XTN")
+
+    def test_several_keys(self):
+        wifs = [keys.generate_wif("XTN") for i in range(3)]
+        ring = keyring.KeyRing(wifs + wifs[:1])
+        self.assertEqual(len(ring.keys), 3)
+        self.assertEqual(ring.default.wif, wifs[0])
+        pubkey = keys.pubkey_from_wif(wifs[2])
+        self.assertEqual(ring.get_wif(pubkey), wifs[2])
+        self.assertRaises(keyring.UnknownKey, ring.get, "00" * 33)
+
+    def test_wallet_loaded_once(self):
+        ring = keyring.get_keyring(self.wallet_path, netcode="XTN")
+        self.assertEqual(ring.default.netcode, "XTN")
+        os.remove(self.wallet_path)
+        self.assertIs(ring, keyring.get_keyring(self.wallet_path))
+        self.assertFalse(os.path.exists(self.wallet_path))
+
+
+if __name__ == "__main__":
+    unittest.main()
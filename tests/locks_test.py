@@ -0,0 +1,73 @@
+import shutil
+import tempfile
+import threading
+import unittest
+from picopayments_cli.locks import HandleLocks
+
+
+class TestHandleLocks(unittest.TestCase):
+
+    def setUp(self):
+        self.lockdir = tempfile.mkdtemp()
+        self.locks = HandleLocks(self.lockdir)
+
+    def tearDown(self):
+        shutil.rmtree(self.lockdir)
+
+    def locked_elsewhere(self, handle):
+        # True if another thread can not acquire the lock of handle
+        result = []
+
+        def func():
+            entry = self.locks._entry(handle)
+            acquired = entry[0].acquire(False)
+            if acquired:
+                entry[0].release()
+            result.append(not acquired)
+
+        thread = threading.Thread(target=func)
+        thread.start()
+        thread.join()
+        return result[0]
+
+    def test_reentrant(self):
+        with self.locks.locked(["handle_a"]):
+            with self.locks.locked(["handle_a", "handle_b"]):
+                self.assertTrue(self.locked_elsewhere("handle_b"))
+            self.assertFalse(self.locked_elsewhere("handle_b"))
+            self.assertTrue(self.locked_elsewhere("handle_a"))
+        self.assertFalse(self.locked_elsewhere("handle_a"))
+
+    def test_per_handle(self):
+        with self.locks.locked(["handle_a"]):
+            self.assertTrue(self.locked_elsewhere("handle_a"))
+            self.assertFalse(self.locked_elsewhere("handle_b"))
+
+    def test_serialized(self):
+        counts = {"handle_a": 0}
+
+        def increment():
+            for i in range(200):
+                with self.locks.locked(["handle_a"]):
+                    count = counts["handle_a"]
+                    counts["handle_a"] = count + 1
+
+        threads = [threading.Thread(target=increment) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(counts["handle_a"], 800)
+
+    def test_released_on_error(self):
+
+        def func():
+            with self.locks.locked(["handle_a"]):
+                raise Exception("error")
+
+        self.assertRaises(Exception, func)
+        self.assertFalse(self.locked_elsewhere("handle_a"))
+
+
+if __name__ == "__main__":
+    unittest.main()
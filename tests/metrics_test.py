@@ -0,0 +1,77 @@
+import unittest
+from picopayments_cli import metrics
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_percentile(self):
+        samples = list(range(1, 101))
+        self.assertEqual(metrics.percentile(samples, 50), 50)
+        self.assertEqual(metrics.percentile(samples, 95), 95)
+        self.assertEqual(metrics.percentile(samples, 99), 99)
+        self.assertIsNone(metrics.percentile([], 50))
+
+    def test_record_rpc_batch(self):
+        registry = metrics.Registry()
+        payload = [
+            {"method": "mpc_deposit_ttl", "params": {}, "id": 0},
+            {"method": "get_balances", "params": {}, "id": 1},
+        ]
+        response = [
+            {"result": 5, "id": 0},
+            {"error": {"code": -32601}, "id": 1},
+        ]
+        registry.record_rpc(payload, response, 0.2, 100, 50)
+        snapshot = registry.snapshot()
+        self.assertEqual(snapshot["mpc_deposit_ttl"]["calls"], 1)
+        self.assertEqual(snapshot["mpc_deposit_ttl"]["errors"], 0)
+        self.assertEqual(snapshot["mpc_deposit_ttl"]["request_bytes"], 50)
+        self.assertEqual(snapshot["get_balances"]["errors"], 1)
+        self.assertAlmostEqual(
+            snapshot["get_balances"]["latency"]["p99"], 0.1
+        )
+
+    def test_transport_failure_counts_error(self):
+        registry = metrics.Registry()
+        payload = {"method": "mph_sync", "params": {}, "id": 0}
+        registry.record_rpc(payload, None, 1.0, 10, 0)
+        self.assertEqual(registry.snapshot()["mph_sync"]["errors"], 1)
+
+    def test_merge(self):
+        registry = metrics.Registry()
+        registry.record("mph_sync", 0.02, 10, 20)
+        other = metrics.Registry()
+        other.record("mph_sync", 0.5, 30, 40, error=True)
+        other.record("get_balances", 0.1)
+        registry.merge(other.recorded())
+        snapshot = registry.snapshot()
+        self.assertEqual(snapshot["mph_sync"]["calls"], 2)
+        self.assertEqual(snapshot["mph_sync"]["errors"], 1)
+        self.assertEqual(snapshot["mph_sync"]["request_bytes"], 40)
+        self.assertEqual(snapshot["mph_sync"]["latency"]["max"], 0.5)
+        self.assertEqual(snapshot["get_balances"]["calls"], 1)
+        self.assertIn('picopayments_rpc_calls_total{method="mph_sync"} 2',
+                      registry.exposition())
+
+        # merged statistics are not recorded by this process
+        self.assertEqual(registry.recorded()["mph_sync"].calls, 1)
+        self.assertNotIn("get_balances", registry.recorded())
+
+    def test_exposition(self):
+        registry = metrics.Registry()
+        registry.record("mph_sync", 0.02, 10, 20)
+        text = registry.exposition()
+        self.assertIn('picopayments_rpc_calls_total{method="mph_sync"} 1',
+                      text)
+        self.assertIn(
+            'picopayments_rpc_latency_seconds_bucket'
+            '{method="mph_sync",le="0.025"} 1', text
+        )
+        self.assertIn(
+            'picopayments_rpc_latency_seconds_bucket'
+            '{method="mph_sync",le="0.01"} 0', text
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
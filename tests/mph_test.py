@@ -0,0 +1,198 @@
+import os
+import unittest
+from micropayment_core import util
+from picopayments_cli import steps
+from picopayments_cli.mph import Mph
+
+
+def make_data():
+    return {
+        "asset": "XCP",
+        "handle": "handle_a",
+        "channel_terms": {"sync_fee": 1},
+        "client_pubkey": "client_pubkey",
+        "hub_pubkey": "hub_pubkey",
+        "secrets": {"hash_a": "secret_a"},
+        "c2h_state": {"commits_active": []},
+        "c2h_spend_secret_hash": "hash_a",
+        "c2h_commit_delay_time": 2,
+        "c2h_next_revoke_secret_hash": "hash_b",
+        "c2h_deposit_expire_time": 1024,
+        "c2h_deposit_quantity": 42,
+        "h2c_state": {"commits_requested": ["hash_c"], "commits_revoked": []},
+        "payments_sent": [],
+        "payments_received": [],
+        "payments_queued": [],
+    }
+
+
+class TestMphChanges(unittest.TestCase):
+
+    def setUp(self):
+        self.data = make_data()
+        self.client = Mph.deserialize(object(), self.data)
+
+    def test_nothing_changed(self):
+        self.assertEqual(self.client.changed(), set())
+        self.assertEqual(self.client.serialize(), dict(
+            make_data(), secret_seed=None, secret_index=None
+        ))
+
+    def test_copy_on_write(self):
+        secret_hash = self.client._gen_secret()
+        self.client._add_to_commits_requested(secret_hash)
+        self.client.micro_send("handle_b", 7, token="token_a")
+        self.assertEqual(self.client.changed(), set([
+            "secret_seed", "secret_index", "h2c_state", "payments_queued"
+        ]))
+
+        # deserialized data not modified
+        self.assertEqual(self.data, make_data())
+        data = self.client.serialize()
+        self.assertEqual(data["h2c_state"]["commits_requested"],
+                         ["hash_c", secret_hash])
+        self.assertEqual(len(data["payments_queued"]), 1)
+
+    def test_sync_copies_on_write(self):
+
+        class Key(object):
+            wif = "wif"
+
+        class Keyring(object):
+            default = Key()
+
+        class HubApi(object):
+
+            def mph_sync(self, **kwargs):
+                return {"commit": None, "revokes": [], "receive": [],
+                        "next_revoke_secret_hash": "hash_d"}
+
+        def transfer(wif, get_secret, send_state, recv_state, *args,
+                     **kwargs):
+            yield steps.Return({"send_state": send_state,
+                                "recv_state": recv_state,
+                                "revokes": [], "commit": None})
+
+        client = Mph.deserialize(HubApi(), self.data, keyring=Keyring())
+        client._full_duplex_transfer = transfer
+        self.assertEqual(client.sync(), [])
+        self.assertIs(client.c2h_state, self.data["c2h_state"])
+        self.assertNotIn("c2h_state", client.changed())
+        self.assertEqual(len(client.h2c_state["commits_requested"]), 2)
+        self.assertEqual(self.data, make_data())
+
+    def test_assigned(self):
+        self.client._pop_payments()
+        self.assertEqual(self.client.changed(), set(["payments_queued"]))
+
+
+class TestMphSecrets(unittest.TestCase):
+
+    def test_derived(self):
+        client = Mph.deserialize(object(), make_data())
+        hashes = [client._gen_secret() for i in range(5)]
+        data = client.serialize()
+        self.assertEqual(data["secret_index"], 5)
+        self.assertEqual(data["secrets"], {"hash_a": "secret_a"})
+
+        # rebuilt from seed
+        client = Mph.deserialize(object(), data)
+        for secret_hash in reversed(hashes):
+            secret = client.get_secret(secret_hash)
+            self.assertEqual(util.hash160hex(secret), secret_hash)
+        self.assertEqual(client.get_secret("hash_a"), "secret_a")
+        self.assertIsNone(client.get_secret(util.b2h(os.urandom(20))))
+
+    def test_unknown_without_seed(self):
+        client = Mph.deserialize(object(), make_data())
+        self.assertIsNone(client.get_secret("hash_b"))
+
+
+class Archive(object):
+
+    def __init__(self):
+        self.commits = {"c2h": [], "h2c": []}
+
+    def archive_commits(self, handle, channel, commits):
+        self.commits[channel].extend(commits)
+
+    def load_archived(self, handle, channel):
+        return list(self.commits[channel])
+
+
+class HubApi(object):
+
+    def __init__(self, published_scripts):
+        self.published_scripts = published_scripts
+
+    def mpc_published_commits(self, state):
+        return [c for c in state["commits_revoked"]
+                if c["script"] in self.published_scripts]
+
+
+class TestMphArchive(unittest.TestCase):
+
+    def setUp(self):
+        self.data = make_data()
+        self.revoked = [{"script": str(i)} for i in range(20)]
+        self.data["c2h_state"] = {
+            "commits_active": [], "commits_revoked": self.revoked
+        }
+        self.archive = Archive()
+        self.client = Mph.deserialize(object(), self.data,
+                                      archive=self.archive)
+
+    def test_hot_state_bounded(self):
+        self.client._archive_revoked()
+        hot = self.client.c2h_state["commits_revoked"]
+        self.assertEqual(len(hot), Mph.HOT_REVOKED_COMMITS)
+        self.assertEqual(hot, self.revoked[-Mph.HOT_REVOKED_COMMITS:])
+        self.assertEqual(self.archive.commits["c2h"],
+                         self.revoked[:-Mph.HOT_REVOKED_COMMITS])
+        self.assertEqual(self.client.changed(), set(["c2h_state"]))
+        self.assertEqual(len(self.data["c2h_state"]["commits_revoked"]), 20)
+
+        full = self.client._full_state("c2h")
+        self.assertEqual(full["commits_revoked"], self.revoked)
+
+    def test_duplicates_after_crash(self):
+        self.archive.archive_commits("handle_a", "c2h", self.revoked[:4])
+        full = self.client._full_state("c2h")
+        self.assertEqual(full["commits_revoked"], self.revoked)
+
+    def test_update_sees_published_archived_commit(self):
+        self.data["h2c_state"] = {
+            "commits_active": [], "commits_revoked": self.revoked
+        }
+        client = Mph.deserialize(HubApi(["0"]), self.data,
+                                 archive=self.archive)
+        client._archive_revoked()
+        self.assertNotIn(self.revoked[0], client.h2c_state["commits_revoked"])
+        closed = []
+
+        def is_closed(clearance=6):
+            yield steps.Return(True)
+
+        def close(engine=None):
+            closed.append(engine)
+            yield steps.Return(None)
+
+        def recover_funds(*args):
+            yield steps.Return(dict([(key, {}) for key in [
+                "payout", "revoke", "change", "expire", "commit", "deposit"
+            ]]))
+
+        client._is_closed = is_closed
+        client._close = close
+        client._full_duplex_recover_funds = recover_funds
+        client.update()
+        self.assertEqual(closed, [])  # hub published archived commit
+
+    def test_without_archive(self):
+        client = Mph.deserialize(object(), self.data)
+        client._archive_revoked()
+        self.assertEqual(client.c2h_state["commits_revoked"], self.revoked)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+from picopayments_cli import policy
+
+
+def make_payments(amounts, queued_at=1000.0):
+    return [
+        {"payee_handle": "dest", "amount": amount, "token": "token",
+         "queued_at": queued_at}
+        for amount in amounts
+    ]
+
+
+class TestSyncPolicy(unittest.TestCase):
+
+    def setUp(self):
+        self.policy = policy.SyncPolicy(max_fee_ratio=0.01, max_latency=60.0,
+                                        min_ttl=10)
+
+    def test_nothing_queued(self):
+        self.assertIsNone(self.policy.decide([], 1, ttl=1, now=2000.0))
+
+    def test_fee(self):
+        self.assertIsNone(self.policy.decide(make_payments([50, 49]), 1,
+                                             now=1001.0))
+        self.assertEqual(self.policy.decide(make_payments([50, 50]), 1,
+                                            now=1001.0), policy.FEE)
+        self.assertEqual(self.policy.decide(make_payments([1]), 0,
+                                            now=1001.0), policy.FEE)
+
+    def test_latency(self):
+        payments = make_payments([1])
+        self.assertIsNone(self.policy.decide(payments, 10, now=1059.0))
+        self.assertEqual(self.policy.decide(payments, 10, now=1060.0),
+                         policy.LATENCY)
+
+        # payments queued before timestamps were added are overdue
+        del payments[0]["queued_at"]
+        self.assertEqual(self.policy.decide(payments, 10, now=1001.0),
+                         policy.LATENCY)
+
+    def test_ttl(self):
+        payments = make_payments([1])
+        self.assertIsNone(self.policy.decide(payments, 10, ttl=11,
+                                             now=1001.0))
+        self.assertEqual(self.policy.decide(payments, 10, ttl=10,
+                                            now=1001.0), policy.TTL)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -29,6 +29,27 @@ class TestRpc(unittest.TestCase):
             api.non_existant()
         self.assertRaises(rpc.JsonRpcCallFailed, function)
 
+    def test_batch_call(self):
+        auth_wif = "cNXoRUC2eqcBEv1AmvPgM6NgCYV1ReTTHuAmVxaAh6AvVLHroSfU"
+        url = "https://127.0.0.1:16000/api/"
+        api = rpc.JsonRpc(auth_wif=auth_wif, url=url, verify_ssl_cert=False)
+        with api.batch() as batch:
+            first = batch.mph_sync()
+            missing = batch.non_existant()
+            second = batch.mph_sync()
+            self.assertRaises(rpc.JsonRpcBatchPending, first.result)
+        self.assertIn("foo", first.result())
+        self.assertIn("foo", second.result())
+        self.assertRaises(rpc.JsonRpcCallFailed, missing.result)
+
+    def test_session_shared(self):
+        url = "https://127.0.0.1:16000/api/"
+        api_a = rpc.JsonRpc(url=url, verify_ssl_cert=False)
+        api_b = rpc.JsonRpc(url=url, verify_ssl_cert=False)
+        self.assertIs(api_a.session, api_b.session)
+        self.assertIs(rpc.get_session(pool_size=5), rpc.get_session(5))
+        self.assertIsNot(rpc.get_session(pool_size=5), api_a.session)
+
 
 if __name__ == "__main__":
     unittest.main()
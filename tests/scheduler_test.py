@@ -0,0 +1,96 @@
+import time
+import threading
+import unittest
+from picopayments_cli.scheduler import SyncScheduler
+
+
+class TestSyncScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.depths = {"handle_a": 2, "handle_b": 0}
+        self.synced = []
+        self.release = threading.Event()
+        self.release.set()
+        self.scheduler = SyncScheduler(self.poll, self.sync, interval=60.0,
+                                       recover_interval=600.0, workers=2)
+
+    def poll(self):
+        # due if more than one payment queued
+        return dict([(h, (d, d > 1)) for h, d in self.depths.items()])
+
+    def sync(self, handle):
+        self.release.wait(10)
+        if handle == "fail":
+            raise Exception("hub down")
+        self.synced.append(handle)
+        self.depths[handle] = 0
+
+    def wait_idle(self):
+        for i in range(1000):
+            if not self.scheduler._pending:
+                return
+            time.sleep(0.01)
+        self.fail("jobs not finished")
+
+    def test_queued_and_recover(self):
+        # first tick submits all to recover
+        self.assertEqual(self.scheduler.tick(), ["handle_a", "handle_b"])
+        self.scheduler.start()
+        try:
+            self.wait_idle()
+            self.assertEqual(sorted(self.synced), ["handle_a", "handle_b"])
+
+            self.depths["handle_b"] = 1  # queued but not due
+            self.assertEqual(self.scheduler.tick(now=time.time() + 1), [])
+            self.depths["handle_b"] = 2
+            self.assertEqual(self.scheduler.tick(now=time.time() + 1),
+                             ["handle_b"])
+            self.wait_idle()
+            self.assertEqual(self.scheduler.tick(now=time.time() + 2), [])
+            self.assertEqual(self.scheduler.tick(now=time.time() + 601),
+                             ["handle_a", "handle_b"])
+            self.wait_idle()
+        finally:
+            self.scheduler.stop()
+
+        stats = self.scheduler.snapshot()
+        self.assertEqual(stats["handle_b"]["syncs"], 3)
+        self.assertIsNotNone(stats["handle_b"]["last_sync_latency"])
+        self.assertIn('picopayments_sync_queued_payments{handle="handle_a"}',
+                      self.scheduler.exposition())
+
+    def test_not_submitted_while_pending(self):
+        self.release.clear()
+        self.scheduler.tick()
+        self.scheduler.start()
+        try:
+            self.assertEqual(self.scheduler.tick(now=time.time() + 1),
+                             [])  # still pending from first tick
+            self.release.set()
+            self.wait_idle()
+        finally:
+            self.scheduler.stop()
+
+    def test_errors(self):
+        self.depths = {"fail": 2}
+        self.scheduler.tick()
+        self.scheduler.start()
+        try:
+            self.wait_idle()
+        finally:
+            self.scheduler.stop()
+        stats = self.scheduler.snapshot()["fail"]
+        self.assertEqual(stats["errors"], 1)
+        self.assertIn("hub down", stats["last_error"])
+
+    def test_culled_dropped(self):
+        self.scheduler.recover_interval = 0
+        self.scheduler.tick()
+        del self.depths["handle_b"]
+        self.scheduler.tick()
+        self.assertEqual(list(self.scheduler.snapshot().keys()),
+                         ["handle_a"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import json
+import time
+import threading
+import unittest
+import requests
+from werkzeug.wrappers import Request, Response
+from picopayments_cli.server import make_server, ThreadPoolWSGIServer
+from picopayments_cli.server import ForkingServer
+
+
+class TestThreadPoolServer(unittest.TestCase):
+
+    def test_concurrent_requests(self):
+        release = threading.Event()
+
+        @Request.application
+        def application(request):
+            if request.path == "/slow":
+                release.wait(10)
+            return Response(json.dumps(request.path))
+
+        server = make_server("localhost", 0, application, threads=2)
+        self.assertIsInstance(server, ThreadPoolWSGIServer)
+        url = "http://localhost:{0}".format(server.server_port)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            slow = threading.Thread(target=requests.get, args=(url + "/slow",))
+            slow.start()
+            # answered while the slow request is still being handled
+            self.assertEqual(requests.get(url + "/fast").json(), "/fast")
+            release.set()
+            slow.join()
+        finally:
+            release.set()
+            server.shutdown()
+            thread.join()
+
+    def test_threads_and_processes(self):
+        self.assertRaises(ValueError, make_server, "localhost", 0, None,
+                          threads=2, processes=2)
+
+
+class TestForkingServer(unittest.TestCase):
+
+    def test_exit_result_merged(self):
+
+        @Request.application
+        def application(request):
+            return Response(json.dumps(os.getpid()))
+
+        merged = []
+        server = make_server("localhost", 0, application, processes=2,
+                             on_exit=os.getpid, merge=merged.append)
+        self.assertIsInstance(server, ForkingServer)
+        url = "http://localhost:{0}".format(server.server_port)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            pid = requests.get(url).json()
+            self.assertNotEqual(pid, os.getpid())
+            for i in range(100):
+                if merged:
+                    break
+                time.sleep(0.05)  # merged by the server loop
+            self.assertEqual(merged, [pid])
+        finally:
+            server.shutdown()
+            thread.join()
+            server.server_close()
+
+
+if __name__ == "__main__":
+    unittest.main()
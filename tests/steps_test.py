@@ -0,0 +1,99 @@
+import unittest
+from picopayments_cli import steps
+from picopayments_cli.mpc import Mpc
+
+
+def double(value):
+    result = yield steps.Call("echo", value=value)
+    yield steps.Return(result * 2)
+
+
+def add_doubled(a, b):
+    doubled_a = yield double(a)
+    doubled_b = yield double(b)
+    yield steps.Return(doubled_a + doubled_b)
+
+
+def recover(value):
+    try:
+        yield steps.Call("fail")
+    except ValueError:
+        pass
+    result = yield double(value)
+    yield steps.Return(result)
+
+
+def execute(request):
+    if request.method == "fail":
+        raise ValueError("failed")
+    return request.params["value"]
+
+
+class HubApi(object):
+
+    def __init__(self):
+        self.calls = []
+
+    def get_tx_info(self, tx_hex):
+        self.calls.append("get_tx_info")
+        return ["source", "destination", 7, 1, "data"]
+
+    def unpack(self, data_hex):
+        self.calls.append("unpack")
+        return [0, {"asset": "XCP", "quantity": 5}]
+
+    def sendrawtransaction(self, tx_hex):
+        self.calls.append("sendrawtransaction")
+        raise ValueError("rejected")
+
+
+class TestSteps(unittest.TestCase):
+
+    def test_sub_steps(self):
+        self.assertEqual(steps.run(add_doubled(1, 2), execute), 6)
+
+    def test_error_thrown_into_step(self):
+        self.assertEqual(steps.run(recover(3), execute), 6)
+
+    def test_unhandled_error_raised(self):
+
+        def step():
+            yield double(1)
+            yield steps.Call("fail")
+
+        self.assertRaises(ValueError, steps.run, step(), execute)
+
+    def test_return_ends_step(self):
+
+        def step():
+            yield steps.Return(1)
+            yield steps.Call("fail")
+
+        self.assertEqual(steps.run(step(), execute), 1)
+
+    def test_runner_requests(self):
+        runner = steps.Runner(add_doubled(1, 2))
+        request = runner.resume()
+        self.assertEqual(request.method, "echo")
+        self.assertEqual(request.params, {"value": 1})
+        request = runner.resume(10)
+        self.assertEqual(request.params, {"value": 2})
+        self.assertIsNone(runner.resume(20))
+        self.assertTrue(runner.done)
+        self.assertEqual(runner.value, 60)
+
+    def test_mpc_steps(self):
+        api = HubApi()
+        mpc = Mpc(api)
+        self.assertEqual(mpc.get_transferred("rawtx", asset="XCP"), (5, 7))
+        self.assertEqual(api.calls, ["get_tx_info", "unpack"])
+
+        # publish hook runs on failed publish and the error is raised
+        published = []
+        mpc._published = published.append
+        self.assertRaises(ValueError, mpc.publish, "rawtx")
+        self.assertEqual(published, ["rawtx"])
+
+
+if __name__ == "__main__":
+    unittest.main()
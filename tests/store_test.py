@@ -0,0 +1,271 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+import unittest
+from picopayments_cli import codec
+from picopayments_cli import store
+
+
+def make_data(handle):
+    return {
+        "asset": "XCP",
+        "handle": handle,
+        "secrets": {"hash_a": "secret_a", "hash_b": "secret_b"},
+        "c2h_state": {"commits_active": [], "commits_revoked": []},
+        "payments_sent": [],
+        "payments_received": [],
+        "payments_queued": [
+            {"payee_handle": "dest", "amount": 1, "token": "token_a"},
+            {"payee_handle": "dest", "amount": 2, "token": "token_b"},
+        ],
+    }
+
+
+class StoreTest(object):
+
+    def test_save_load(self):
+        data = make_data("handle_a")
+        self.store.save("handle_a", data)
+        self.store.save("handle_b", make_data("handle_b"))
+        self.assertEqual(self.store.load("handle_a"), data)
+        self.assertEqual(sorted(self.store.handles()),
+                         ["handle_a", "handle_b"])
+        self.assertRaises(KeyError, self.store.load, "unknown")
+
+        # replaced on save
+        data["secrets"] = {"hash_c": "secret_c"}
+        data["payments_queued"] = data["payments_queued"][1:]
+        self.store.save("handle_a", data)
+        self.assertEqual(self.store.load("handle_a"), data)
+
+    def test_delete(self):
+        self.store.save("handle_a", make_data("handle_a"))
+        self.store.delete("handle_a")
+        self.assertEqual(self.store.load_all(), {})
+
+    def test_cancel_payment(self):
+        self.store.save("handle_a", make_data("handle_a"))
+        self.assertTrue(self.store.cancel_payment("token_a"))
+        self.assertFalse(self.store.cancel_payment("token_a"))
+        queued = self.store.load("handle_a")["payments_queued"]
+        self.assertEqual([p["token"] for p in queued], ["token_b"])
+
+    def test_update(self):
+        data = make_data("handle_a")
+        self.store.save("handle_a", data)
+        data["payments_sent"] = [{"handle": "dest", "amount": 1}]
+        data["secrets"] = dict(data["secrets"], hash_c="secret_c")
+        data["asset"] = "BTC"  # not written, unchanged per caller
+        self.store.update("handle_a", data,
+                          set(["payments_sent", "secrets"]))
+        stored = self.store.load("handle_a")
+        self.assertEqual(stored["payments_sent"], data["payments_sent"])
+        self.assertEqual(stored["secrets"], data["secrets"])
+
+        data["payments_sent"].append({"handle": "dest", "amount": 2})
+        self.store.update("handle_a", data, set(["payments_sent"]))
+        stored = self.store.load("handle_a")
+        self.assertEqual(stored["payments_sent"], data["payments_sent"])
+
+    def test_archive(self):
+        self.store.save("handle_a", make_data("handle_a"))
+        self.store.archive_commits("handle_a", "c2h", [{"script": "a"}])
+        self.store.archive_commits("handle_a", "c2h", [{"script": "b"}])
+        self.assertEqual(self.store.load_archived("handle_a", "c2h"),
+                         [{"script": "a"}, {"script": "b"}])
+        self.assertEqual(self.store.load_archived("handle_a", "h2c"), [])
+        self.store.delete("handle_a")
+        self.assertEqual(self.store.load_archived("handle_a", "c2h"), [])
+
+    def test_transaction_rollback(self):
+        self.store.save("handle_a", make_data("handle_a"))
+
+        def func():
+            with self.store.transaction():
+                self.store.delete("handle_a")
+                raise Exception("crash")
+
+        self.assertRaises(Exception, func)
+        self.assertEqual(self.store.handles(), ["handle_a"])
+
+
+class TestJsonStore(StoreTest, unittest.TestCase):
+
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        self.store = store.JsonStore(os.path.join(self.basedir, "data"))
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+
+class TestBinaryStore(StoreTest, unittest.TestCase):
+
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        self.store = store.BinaryStore(os.path.join(self.basedir, "bin"))
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def test_lazy(self):
+        self.store.save("handle_a", make_data("handle_a"))
+        self.store.save("handle_b", make_data("handle_b"))
+
+        # corrupt handle_b, only decoded when accessed
+        with open(self.store.path, "rb") as infile:
+            data = infile.read()
+        raw = codec.encode(make_data("handle_b"))
+        start = data.index(raw) + 1
+        data = data[:start] + b"X" * 20 + data[start + 20:]
+        with open(self.store.path, "wb") as outfile:
+            outfile.write(data)
+        self.assertEqual(self.store.load("handle_a"), make_data("handle_a"))
+        self.assertRaises(Exception, self.store.load, "handle_b")
+
+        # unchanged connections copied as is
+        self.store.save("handle_a", make_data("handle_c"))
+        with open(self.store.path, "rb") as infile:
+            self.assertIn(data[start:start + 20], infile.read())
+
+    def test_queued_lookups_lazy(self):
+        data = make_data("handle_b")
+        data["payments_queued"] = [
+            {"payee_handle": "dest", "amount": 3, "token": "token_c"},
+        ]
+        data["note"] = {"text": u"n" * 20}
+        self.store.save("handle_a", make_data("handle_a"))
+        self.store.save("handle_b", data)
+
+        # corrupt the note of handle_b, only queued payments are decoded
+        with open(self.store.path, "rb") as infile:
+            data = infile.read().replace(b"n" * 20, b"\xff" * 20)
+        with open(self.store.path, "wb") as outfile:
+            outfile.write(data)
+        self.assertRaises(Exception, self.store.load, "handle_b")
+        self.assertEqual(self.store.find_queued("token_c"), "handle_b")
+        self.assertEqual(self.store.count_queued("token_a"), 1)
+        self.assertTrue(self.store.cancel_payment("token_a"))
+        self.assertEqual(self.store.find_queued("token_a"), None)
+        queued = self.store.load("handle_a")["payments_queued"]
+        self.assertEqual([p["token"] for p in queued], ["token_b"])
+
+    def test_convert(self):
+        self.store.save("handle_a", make_data("handle_a"))
+        self.store.archive_commits("handle_a", "c2h", [{"script": "00"}])
+        json_store = store.JsonStore(os.path.join(self.basedir, "data"))
+        store.migrate(self.store, json_store)
+        converted = store.BinaryStore(os.path.join(self.basedir, "bin2"))
+        store.migrate(json_store, converted)
+        self.assertEqual(converted.load_all(), self.store.load_all())
+        self.assertEqual(converted.load_archived("handle_a", "c2h"),
+                         [{"script": "00"}])
+
+
+class TestSqliteStore(StoreTest, unittest.TestCase):
+
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        self.store = store.SqliteStore(os.path.join(self.basedir, "db"))
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def test_migrate(self):
+        path = os.path.join(self.basedir, "data")
+        with open(path, "w") as outfile:
+            json.dump({"connections": {
+                "handle_a": make_data("handle_a"),
+                "handle_b": make_data("handle_b"),
+            }}, outfile)
+        store.migrate(store.JsonStore(path), self.store)
+        self.assertEqual(self.store.load_all(),
+                         store.JsonStore(path).load_all())
+
+    def test_update_writes_changed_only(self):
+        self.store.save("handle_a", make_data("handle_a"))
+        data = make_data("handle_a")
+        data["asset"] = "BTC"
+        self.store.update("handle_a", data, set(["payments_queued"]))
+        self.assertEqual(self.store.load("handle_a")["asset"], "XCP")
+
+
+class TestResidentStore(StoreTest, unittest.TestCase):
+
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        self.backing = store.SqliteStore(os.path.join(self.basedir, "db"))
+        self.store = store.ResidentStore(self.backing, write_delay=60.0)
+
+    def tearDown(self):
+        self.store.flush()
+        shutil.rmtree(self.basedir)
+
+    def test_write_behind(self):
+        self.store.save("handle_a", make_data("handle_a"))
+        self.store.archive_commits("handle_a", "c2h", [{"script": "a"}])
+        self.store.set_meta("key", "value")
+        self.assertEqual(self.backing.handles(), [])
+        self.store.flush()
+        self.assertEqual(self.backing.load("handle_a"), make_data("handle_a"))
+        self.assertEqual(self.backing.load_archived("handle_a", "c2h"),
+                         [{"script": "a"}])
+        self.assertEqual(self.backing.get_meta("key"), "value")
+
+        data = make_data("handle_a")
+        data["payments_sent"] = [{"handle": "dest", "amount": 1}]
+        self.store.update("handle_a", data, ["payments_sent"])
+        self.store.delete("handle_a")
+        self.store.flush()
+        self.assertEqual(self.backing.handles(), [])
+
+    def test_written_after_delay(self):
+        self.store.write_delay = 0.01
+        self.store.save("handle_a", make_data("handle_a"))
+        for i in range(500):
+            if self.backing.handles():
+                break
+            time.sleep(0.01)
+        self.assertEqual(self.backing.handles(), ["handle_a"])
+
+    def test_hold_defers_write_behind(self):
+        self.store.save("handle_a", make_data("handle_a"))
+        with self.store.hold():
+            self.store._write_behind()  # timer started before held
+            self.store.write_delay = 0.01
+            self.store.save("handle_b", make_data("handle_b"))
+            time.sleep(0.1)
+            self.assertEqual(self.backing.handles(), [])
+
+        # written behind once released
+        for i in range(500):
+            if self.backing.handles():
+                break
+            time.sleep(0.01)
+        self.assertEqual(sorted(self.backing.handles()),
+                         ["handle_a", "handle_b"])
+
+    def test_loaded_once(self):
+        self.backing.save("handle_a", make_data("handle_a"))
+        self.assertEqual(self.store.handles(), ["handle_a"])
+        self.backing.delete("handle_a")  # not read again
+        self.assertEqual(self.store.load("handle_a"), make_data("handle_a"))
+
+    def test_failed_flush_kept(self):
+        self.store.save("handle_a", make_data("handle_a"))
+        save = self.backing.save
+
+        def fail(handle, data):
+            raise IOError("disk full")
+
+        self.backing.save = fail
+        self.assertRaises(IOError, self.store.flush)
+        self.backing.save = save
+        self.store.flush()
+        self.assertEqual(self.backing.handles(), ["handle_a"])
+
+
+if __name__ == "__main__":
+    unittest.main()
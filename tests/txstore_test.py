@@ -0,0 +1,62 @@
+import os
+import shutil
+import tempfile
+import unittest
+from pycoin.tx import Tx, TxIn, TxOut
+from micropayment_core import util
+from picopayments_cli import txstore
+
+
+def make_rawtx(previous_hash, coin_values):
+    txs_out = [TxOut(value, b"\x51") for value in coin_values]
+    return Tx(1, [TxIn(previous_hash, 0)], txs_out).as_hex()
+
+
+class TestTxStore(unittest.TestCase):
+
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        self.path = os.path.join(self.basedir, "rawtxs")
+        self.fetched = []
+        self.parent = make_rawtx(os.urandom(32), [1000, 2000])
+        self.parent_txid = util.gettxid(self.parent)
+        parent_hash = Tx.from_hex(self.parent).hash()
+        self.child = Tx(1, [TxIn(parent_hash, 1)], [TxOut(1500, b"\x51")])
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def fetch(self, txids):
+        self.fetched += txids
+        return {self.parent_txid: self.parent}
+
+    def test_fetch_missing_only(self):
+        store = txstore.TxStore(path=self.path)
+        txids = [self.parent_txid]
+        self.assertEqual(store.get_rawtxs(txids, self.fetch),
+                         {self.parent_txid: self.parent})
+        self.assertEqual(store.get_rawtxs(txids, self.fetch),
+                         {self.parent_txid: self.parent})
+        self.assertEqual(self.fetched, txids)
+
+        # persisted between instances
+        store = txstore.TxStore(path=self.path)
+        self.assertEqual(store.get(self.parent_txid), self.parent)
+        store.get_rawtxs(txids, self.fetch)
+        self.assertEqual(self.fetched, txids)
+
+    def test_load_tx(self):
+        store = txstore.TxStore()
+        tx = store.load_tx(self.child.as_hex(), self.fetch)
+        self.assertEqual([u.coin_value for u in tx.unspents], [2000])
+        self.assertEqual(tx.fee(), 500)
+
+    def test_txid_mismatch(self):
+        store = txstore.TxStore(path=self.path)
+        self.assertRaises(txstore.TxidMismatch, store.put,
+                          "00" * 32, self.parent)
+        self.assertEqual(os.listdir(self.path), [])
+
+
+if __name__ == "__main__":
+    unittest.main()